@@ -0,0 +1,36 @@
+# Capture package initialization
+from .batch import PacketBatch, PROTOCOLS, format_address, parse_address
+from .flows import FlowTable
+from .filters import PacketFilter
+from .sampling import FlowSample, SampleAccumulator
+from .cache import CaptureCache, CacheEntry
+from .compression import DecompressingStream, compression_of
+from .follow import CaptureFollower
+from .index import CaptureIndex, parse_time, select_window
+from .sketch import HyperLogLog, QuantileSketch, SpaceSaving, hash_columns
+from .analysis import analyze_capture
+from .fleet import analyze_fleet, expand_captures, summarize_fleet
+from .merge import MergedReader, analyze_merged, parse_clock_offset
+from .reader import PcapReader, CaptureFormatError, decode_headers
+from .sbi import SbiAccumulator
+from .hpack import HpackDecoder, huffman_decode
+from .pfcp import PfcpAccumulator, decode_pfcp
+from .gtpu import GtpuAccumulator, decapsulate
+from .talkers import HeavyHitterAccumulator
+from .ngap import NgapAccumulator, ProcedureLatencyAccumulator, decode_ngap, sctp_data_chunks
+from .metrics import (
+    LatencyAccumulator,
+    RttAccumulator,
+    ThroughputAccumulator,
+    SignalAccumulator,
+    LossAccumulator,
+    ConnectionAccumulator,
+    CaptureStatsAccumulator,
+    BucketSeries,
+    collect_results,
+    create_accumulators,
+    update_accumulators,
+    required_fields,
+    merge_accumulators
+)
+from .parallel import analyze_parallel
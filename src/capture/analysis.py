@@ -0,0 +1,117 @@
+"""
+Whole-capture analysis with the parsed-capture cache.
+
+``analyze_capture`` is the single entry point used by the PCAP analyzer
+tool and by fleet batch runs: it returns cached results when the capture
+was already analyzed with the same settings, replays a cached packet table
+when only the settings changed, and otherwise parses the capture. A time
+window is read through the capture's offset index, so only the region
+that can hold it is decoded; so is a flow sample when the index exists.
+"""
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .cache import CaptureCache, settings_key
+from .compression import compression_of
+from .filters import PacketFilter
+from .index import CaptureIndex, select_window
+from .metrics import collect_results, create_accumulators, required_fields, update_accumulators
+from .parallel import analyze_parallel
+from .reader import PcapReader, TRANSPORT_COLUMNS
+
+
+def analyze_capture(path: str, metric_names: List[str], options: Dict[str, Dict] = None,
+                    batch_size: int = 65536, workers: int = 1, cache: CaptureCache = None,
+                    evict: bool = True, packet_filter: PacketFilter = None,
+                    time_range: Optional[Tuple[Optional[int], Optional[int]]] = None,
+                    index: CaptureIndex = None) -> Dict[str, Dict]:
+    """
+    Compute metric results for a whole capture.
+
+    Only the header layers the requested metrics and filter need are
+    decoded. The packet table is stored in the cache only when it was fully
+    decoded and unfiltered, so any later analysis can replay it. Compressed
+    captures never store it, as replay needs the whole capture mapped.
+
+    A flow-sampling packet filter reads only the segments holding sampled
+    flows when an index is given.
+
+    Args:
+        path (str): Path to the capture file
+        metric_names (list): Requested metric names
+        options (dict, optional): Metric name -> accumulator keyword arguments
+        batch_size (int, optional): Packets per batch
+        workers (int, optional): Worker processes for parsing; 1 parses in this process
+        cache (CaptureCache, optional): Parsed-capture cache to read and fill
+        evict (bool, optional): Enforce the cache size limit afterwards
+        packet_filter (PacketFilter, optional): Only analyze matching packets
+        time_range (tuple, optional): (start_ns, end_ns) window; only packets with
+                                      start_ns <= ts < end_ns are analyzed, and
+                                      either bound may be None
+        index (CaptureIndex, optional): Offset index used for a time window or a flow
+                                        sample; for a window it is loaded or built next
+                                        to the capture if not given
+
+    Returns:
+        dict: Metric results keyed by result name
+    """
+    settings = settings_key(metric_names, options, packet_filter, time_range)
+    entry = cache.entry(path) if cache is not None else None
+    if entry is not None and entry.metrics(settings) is not None:
+        return entry.metrics(settings)
+
+    accumulators = create_accumulators(metric_names, options, packet_filter)
+    fields = required_fields(accumulators, packet_filter)
+    sample = packet_filter.sample if packet_filter is not None else None
+    if entry is not None and entry.has_packets:
+        # Replay the cached packet table instead of parsing; the capture is
+        # still mapped so payload decoders can follow the offset columns
+        with PcapReader(path) as reader:
+            raw = np.frombuffer(reader.buffer, dtype=np.uint8)
+            for batch in entry.batches(batch_size):
+                batch.buffer = raw
+                if packet_filter is not None:
+                    batch = batch.select(packet_filter.mask(batch))
+                if time_range is not None:
+                    batch = select_window(batch, *time_range)
+                update_accumulators(accumulators, batch)
+    elif time_range is not None or (sample is not None and index is not None):
+        # Decode only the checkpoint segments that can hold the window and the sampled flows
+        index = index or CaptureIndex.load_or_build(path)
+        segments = np.ones(index.segments, dtype=bool)
+        if time_range is not None:
+            window = index.window_segments(*time_range)
+            segments[:] = False
+            if window is not None:
+                segments[window[0]:window[1] + 1] = True
+        if sample is not None:
+            segments &= index.sampled_segments(sample)
+        with PcapReader(path) as reader:
+            for start, end, state in index.segment_ranges(segments):
+                for batch in reader.batches(batch_size, start=start, end=end, state=state,
+                                            fields=fields, packet_filter=packet_filter):
+                    if time_range is not None:
+                        batch = select_window(batch, *time_range)
+                    update_accumulators(accumulators, batch)
+    elif workers > 1:
+        accumulators = analyze_parallel(path, metric_names, workers, batch_size, options, packet_filter)
+    else:
+        # Stream columnar batches straight from the memory-mapped capture,
+        # storing the table for later runs when every header layer is decoded
+        complete = (packet_filter is None and bool(fields & set(TRANSPORT_COLUMNS))
+                    and compression_of(path) is None)
+        writer = entry.writer(cache.max_bytes // 2) if entry is not None and complete else None
+        with PcapReader(path) as reader, writer or nullcontext():
+            for batch in reader.batches(batch_size, fields=fields, packet_filter=packet_filter):
+                update_accumulators(accumulators, batch)
+                if writer is not None:
+                    writer.append(batch)
+
+    results = collect_results(accumulators)
+    if entry is not None:
+        entry.store_metrics(settings, results)
+        if evict:
+            cache.evict(keep=entry)
+    return results
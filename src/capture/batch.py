@@ -0,0 +1,190 @@
+"""
+Columnar packet table.
+
+A PacketBatch holds decoded packet headers as one preallocated NumPy array
+per field instead of one Python dict per packet. The reader fills the
+arrays in place, and every metric works on whole columns at once.
+"""
+import socket
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+# Dictionary encoding of the transport protocol column
+PROTOCOLS = (None, "TCP", "UDP", "SCTP")
+PROTO_NONE = 0
+PROTO_TCP = 1
+PROTO_UDP = 2
+PROTO_SCTP = 3
+
+# IPv4 addresses are stored as IPv4-mapped IPv6 addresses (::ffff:a.b.c.d)
+IPV4_MAPPED_PREFIX = 0xFFFF << 32
+
+# Column name -> dtype. Addresses are 128-bit values split into two uint64s.
+PACKET_COLUMNS = {
+    "ts_ns": np.int64,
+    "length": np.uint32,
+    "caplen": np.uint32,
+    "data_offset": np.int64,
+    "linktype": np.uint16,
+    "ip_version": np.uint8,
+    "ttl": np.uint8,
+    "protocol": np.uint8,
+    "src_hi": np.uint64,
+    "src_lo": np.uint64,
+    "dst_hi": np.uint64,
+    "dst_lo": np.uint64,
+    "src_port": np.uint16,
+    "dst_port": np.uint16,
+    "tcp_flags": np.uint8,
+    "seq": np.uint32,
+    "ack": np.uint32,
+    "payload_offset": np.int64,
+    "payload_len": np.uint32,
+    "is_5g": np.bool_
+}
+
+
+class PacketBatch:
+    """
+    Fixed-capacity columnar table of decoded packets.
+
+    Columns are accessed by name (``batch["ts_ns"]``) and are views trimmed
+    to the number of packets currently in the batch. ``buffer`` is the
+    capture the offset columns point into, as a uint8 array, when the
+    batch came from a reader; payload decoders read from it.
+    """
+
+    def __init__(self, capacity: int, columns: Dict[str, type] = None):
+        """
+        Allocate an empty batch.
+
+        Args:
+            capacity (int): Maximum number of packets the batch can hold
+            columns (dict, optional): Column name -> dtype. Defaults to PACKET_COLUMNS.
+        """
+        self.capacity = capacity
+        self.size = 0
+        self.dtypes = dict(columns or PACKET_COLUMNS)
+        self._columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in self.dtypes.items()}
+        self.buffer = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self._columns[name][:self.size]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._columns
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self._columns)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the populated part of the batch."""
+        return sum(self[name].nbytes for name in self._columns)
+
+    def raw(self, name: str) -> np.ndarray:
+        """Return the full-capacity array of a column, for filling in place."""
+        return self._columns[name]
+
+    def reset(self):
+        """Empty the batch without releasing its arrays."""
+        self.size = 0
+
+    def select(self, mask) -> "PacketBatch":
+        """
+        Return a new batch holding the rows selected by a mask or index array.
+
+        Args:
+            mask: Boolean mask or integer index array over the batch rows
+        """
+        rows = {name: self[name][mask] for name in self._columns}
+        batch = PacketBatch.from_columns(rows, self.dtypes)
+        batch.buffer = self.buffer
+        return batch
+
+    def copy(self) -> "PacketBatch":
+        """Return a compact copy that is safe to keep after the batch is refilled."""
+        batch = PacketBatch.from_columns({name: self[name].copy() for name in self._columns}, self.dtypes)
+        batch.buffer = self.buffer
+        return batch
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, np.ndarray], dtypes: Dict[str, type] = None) -> "PacketBatch":
+        """Build a batch from existing column arrays of equal length."""
+        size = len(next(iter(columns.values()))) if columns else 0
+        batch = cls(0, dtypes or {name: array.dtype for name, array in columns.items()})
+        batch._columns = {name: np.ascontiguousarray(array, dtype=batch.dtypes[name]) for name, array in columns.items()}
+        batch.capacity = batch.size = size
+        return batch
+
+    @classmethod
+    def concat(cls, batches: Iterable["PacketBatch"]) -> "PacketBatch":
+        """Concatenate batches into a single compact batch."""
+        batches = [batch for batch in batches if len(batch)]
+        if not batches:
+            return cls(0)
+        names = batches[0].columns
+        batch = cls.from_columns({name: np.concatenate([batch[name] for batch in batches]) for name in names}, batches[0].dtypes)
+        batch.buffer = batches[0].buffer
+        return batch
+
+    def to_frame(self) -> pd.DataFrame:
+        """Return the batch as a numeric DataFrame (no per-row Python objects)."""
+        return pd.DataFrame({name: self[name] for name in self._columns})
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """
+        Return the batch as a list of dicts with string addresses and flags.
+
+        This is the legacy per-packet representation and is only meant for
+        small samples or debugging.
+        """
+        records = []
+        for i in range(self.size):
+            protocol = int(self["protocol"][i])
+            data = {
+                "timestamp": int(self["ts_ns"][i]) / 1e9,
+                "length": int(self["length"][i]),
+                "protocol": PROTOCOLS[protocol]
+            }
+            if self["ip_version"][i]:
+                data["src_ip"] = format_address(self["src_hi"][i], self["src_lo"][i])
+                data["dst_ip"] = format_address(self["dst_hi"][i], self["dst_lo"][i])
+                data["ttl"] = int(self["ttl"][i])
+            if protocol != PROTO_NONE:
+                data["src_port"] = int(self["src_port"][i])
+                data["dst_port"] = int(self["dst_port"][i])
+            if protocol == PROTO_TCP:
+                data["tcp_flags"] = f"0x{int(self['tcp_flags'][i]):04x}"
+                data["seq"] = int(self["seq"][i])
+                data["ack"] = int(self["ack"][i])
+            data["is_5g"] = bool(self["is_5g"][i])
+            records.append(data)
+        return records
+
+
+def format_address(hi, lo) -> str:
+    """Format a 128-bit address stored as two uint64 values."""
+    hi, lo = int(hi), int(lo)
+    if hi == 0 and lo >> 32 == 0xFFFF:
+        return socket.inet_ntoa((lo & 0xFFFFFFFF).to_bytes(4, "big"))
+    return socket.inet_ntop(socket.AF_INET6, hi.to_bytes(8, "big") + lo.to_bytes(8, "big"))
+
+
+def parse_address(address: str):
+    """
+    Parse an IPv4 or IPv6 address string into (hi, lo) uint64 values.
+
+    Returns:
+        tuple: (hi, lo) integers in the packet table's address encoding
+    """
+    if ":" in address:
+        value = int.from_bytes(socket.inet_pton(socket.AF_INET6, address), "big")
+        return value >> 64, value & 0xFFFFFFFFFFFFFFFF
+    return 0, IPV4_MAPPED_PREFIX | int.from_bytes(socket.inet_aton(address), "big")
@@ -0,0 +1,287 @@
+"""
+Persistent cache of parsed captures.
+
+Each cached capture gets its own directory under the cache root, named
+after the capture's content hash. The directory holds the decoded packet
+table as one raw binary file per column, plus a manifest. The manifest
+records the column dtypes, the packet count and the metric results
+computed so far, keyed by the analysis settings. Cached columns are
+memory-mapped on load, so a cached capture opens in milliseconds whatever
+its size.
+
+The content hash of a capture is stored in an index next to the file's
+size and mtime, so an unchanged file is not hashed again. When the cache
+grows past its size limit, the least recently used entries are evicted
+first.
+"""
+import hashlib
+import json
+import os
+import shutil
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from .batch import PacketBatch, PACKET_COLUMNS
+
+# Default size limit of the cache directory
+DEFAULT_CACHE_BYTES = 1 << 30
+
+# Bytes read at a time when hashing a capture
+HASH_CHUNK_SIZE = 1 << 24
+
+# Bump when the packet table layout or metric semantics change
+CACHE_VERSION = 1
+
+MANIFEST = "manifest.json"
+INDEX = "index.json"
+
+
+def content_hash(path: str) -> str:
+    """Return the BLAKE2b digest of a file's content as hex."""
+    digest = hashlib.blake2b(digest_size=20)
+    buffer = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            digest.update(view[:read])
+    return digest.hexdigest()
+
+
+def settings_key(metric_names: List[str], options: Dict[str, Dict] = None, packet_filter=None,
+                 time_range=None) -> str:
+    """Stable key of the analysis settings that metric results depend on."""
+    settings = {"metrics": sorted(metric_names), "options": options or {}}
+    if packet_filter is not None:
+        settings["filter"] = str(packet_filter)
+    if time_range is not None:
+        settings["time_range"] = list(time_range)
+    return json.dumps(settings, sort_keys=True)
+
+
+def _write_json(path: str, data: Any):
+    """Write JSON atomically so readers never see a partial file."""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def _read_json(path: str) -> Dict:
+    """Read a JSON file, treating a missing or damaged file as empty."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class CaptureCache:
+    """
+    Directory of cached captures with size-based LRU eviction.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_CACHE_BYTES):
+        """
+        Open (and create if needed) a cache directory.
+
+        Args:
+            directory (str): Cache root, typically inside the output directory
+            max_bytes (int, optional): Size limit enforced by evict()
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, path: str) -> str:
+        """
+        Return the content hash of a capture.
+
+        The hash is only recomputed when the file's size or mtime changed
+        since it was last recorded.
+        """
+        stat = os.stat(path)
+        index_path = os.path.join(self.directory, INDEX)
+        index = _read_json(index_path)
+        record = index.get(os.path.abspath(path))
+        if record and record["size"] == stat.st_size and record["mtime_ns"] == stat.st_mtime_ns:
+            return record["hash"]
+
+        digest = content_hash(path)
+        index[os.path.abspath(path)] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": digest}
+        _write_json(index_path, index)
+        return digest
+
+    def entry(self, path: str) -> "CacheEntry":
+        """Return the cache entry of a capture (it may still be empty)."""
+        entry = CacheEntry(os.path.join(self.directory, self.key(path)))
+        entry.touch()
+        return entry
+
+    def size(self) -> int:
+        """Total size of all cache entries in bytes."""
+        return sum(size for _, _, size in self._entries())
+
+    def _entries(self):
+        """(last use, directory, size) of every entry."""
+        entries = []
+        for name in os.listdir(self.directory):
+            directory = os.path.join(self.directory, name)
+            if not os.path.isdir(directory):
+                continue
+            files = [os.path.join(directory, f) for f in os.listdir(directory)]
+            size = sum(os.path.getsize(f) for f in files if os.path.isfile(f))
+            entries.append((os.path.getmtime(directory), directory, size))
+        return entries
+
+    def evict(self, keep: "CacheEntry" = None):
+        """
+        Remove least recently used entries until the cache fits its limit.
+
+        Args:
+            keep (CacheEntry, optional): Entry that must not be removed
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+        for _, directory, size in entries:
+            if total <= self.max_bytes:
+                break
+            if keep is not None and os.path.abspath(directory) == os.path.abspath(keep.directory):
+                continue
+            shutil.rmtree(directory, ignore_errors=True)
+            total -= size
+
+
+class CacheEntry:
+    """
+    Cached packet table and metric results of one capture.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = self._load()
+
+    def _load(self) -> Dict:
+        """Read the manifest, ignoring one written by another cache version."""
+        manifest = _read_json(os.path.join(self.directory, MANIFEST))
+        if manifest.get("version") != CACHE_VERSION:
+            return {"version": CACHE_VERSION}
+        return manifest
+
+    def touch(self):
+        """Mark the entry as recently used."""
+        os.utime(self.directory)
+
+    @property
+    def has_packets(self) -> bool:
+        """Whether a complete packet table with the current columns is stored."""
+        return "packets" in self.manifest and set(self.manifest.get("dtypes", {})) == set(PACKET_COLUMNS)
+
+    @property
+    def packets(self) -> int:
+        return self.manifest.get("packets", 0)
+
+    def metrics(self, settings: str) -> Optional[Dict]:
+        """Return cached metric results for the given settings key, if any."""
+        return self.manifest.get("metrics", {}).get(settings)
+
+    def store_metrics(self, settings: str, results: Dict):
+        """Record metric results computed with the given settings key."""
+        self.manifest = self._load()
+        self.manifest.setdefault("metrics", {})[settings] = results
+        _write_json(os.path.join(self.directory, MANIFEST), self.manifest)
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """Memory-map every cached column."""
+        if not self.has_packets or not self.packets:
+            return {}
+        return {
+            name: np.memmap(os.path.join(self.directory, f"{name}.bin"), dtype=np.dtype(dtype), mode="r",
+                            shape=(self.packets,))
+            for name, dtype in self.manifest["dtypes"].items()
+        }
+
+    def batches(self, batch_size: int = 65536) -> Iterator[PacketBatch]:
+        """Yield the cached packet table in batches, without parsing the capture."""
+        columns = self.columns()
+        dtypes = {name: np.dtype(dtype) for name, dtype in self.manifest.get("dtypes", {}).items()}
+        for start in range(0, self.packets, batch_size):
+            yield PacketBatch.from_columns({name: column[start:start + batch_size] for name, column in columns.items()},
+                                           dtypes)
+
+    def writer(self, max_bytes: int = None) -> "PacketTableWriter":
+        """Return a writer that stores a packet table streamed batch by batch."""
+        return PacketTableWriter(self, max_bytes)
+
+
+class PacketTableWriter:
+    """
+    Appends decoded batches to a cache entry's column files.
+
+    The packet table only becomes visible in the manifest once the writer
+    is closed without error. A table that grows past max_bytes is dropped.
+    """
+
+    def __init__(self, entry: CacheEntry, max_bytes: int = None):
+        self.entry = entry
+        self.max_bytes = max_bytes
+        self.packets = 0
+        self.nbytes = 0
+        self.dtypes = None
+        self._files = {}
+        self.abandoned = False
+
+    def append(self, batch: PacketBatch):
+        """Write one batch of packets."""
+        if self.abandoned or not len(batch):
+            return
+        if self.dtypes is None:
+            self.dtypes = {name: np.dtype(dtype).str for name, dtype in batch.dtypes.items()}
+            self._files = {name: open(self._path(name, temporary=True), "wb") for name in self.dtypes}
+        for name, f in self._files.items():
+            batch[name].tofile(f)
+        self.packets += len(batch)
+        self.nbytes += batch.nbytes
+        if self.max_bytes is not None and self.nbytes > self.max_bytes:
+            self.abort()
+
+    def _path(self, name: str, temporary: bool = False) -> str:
+        return os.path.join(self.entry.directory, f"{name}.bin" + (".tmp" if temporary else ""))
+
+    def _close_files(self):
+        for f in self._files.values():
+            f.close()
+
+    def abort(self):
+        """Discard everything written so far."""
+        self._close_files()
+        for name in self._files:
+            if os.path.exists(self._path(name, temporary=True)):
+                os.remove(self._path(name, temporary=True))
+        self._files = {}
+        self.abandoned = True
+
+    def commit(self):
+        """Publish the packet table in the entry's manifest."""
+        if self.abandoned:
+            return
+        self._close_files()
+        for name in self._files:
+            os.replace(self._path(name, temporary=True), self._path(name))
+        manifest = self.entry._load()
+        manifest.update({"packets": self.packets, "dtypes": self.dtypes or {}})
+        _write_json(os.path.join(self.entry.directory, MANIFEST), manifest)
+        self.entry.manifest = manifest
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
@@ -0,0 +1,170 @@
+"""
+Transparent decompression of archived captures.
+
+Captures compressed with gzip, xz, bzip2 or zstd are recognized by their
+magic bytes and decompressed as a stream, so they never need to be
+unpacked to disk first. A background thread reads and decompresses large
+chunks ahead of the record parser; the decompressors release the GIL, so
+decompression overlaps with header decoding.
+
+zstd support needs the optional ``zstandard`` package.
+"""
+import bz2
+import gzip
+import lzma
+import queue
+import threading
+from typing import BinaryIO, Optional
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+# Magic bytes of each supported compression format
+COMPRESSION_MAGIC = {
+    "gzip": b"\x1f\x8b",
+    "xz": b"\xfd7zXZ\x00",
+    "zstd": b"\x28\xb5\x2f\xfd",
+    "bzip2": b"BZh",
+}
+
+# File name suffixes of compressed captures
+COMPRESSED_SUFFIXES = (".gz", ".xz", ".zst", ".bz2")
+
+# Decompressed bytes produced per read, and chunks decompressed ahead of the parser
+DECOMPRESS_CHUNK_SIZE = 1 << 25
+DECOMPRESS_AHEAD = 2
+
+
+def compression_of(path: str) -> Optional[str]:
+    """
+    Return the compression format of a file, or None if it is not compressed.
+
+    Args:
+        path (str): Path to the file
+
+    Returns:
+        str: "gzip", "xz", "zstd", "bzip2" or None
+    """
+    with open(path, "rb") as f:
+        head = f.read(8)
+    for name, magic in COMPRESSION_MAGIC.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def open_decompressed(path: str, compression: str) -> BinaryIO:
+    """
+    Open a compressed file as a stream of its decompressed bytes.
+
+    Args:
+        path (str): Path to the compressed file
+        compression (str): Format as returned by ``compression_of``
+
+    Returns:
+        file: Binary file object yielding decompressed data
+
+    Raises:
+        ValueError: If the format is unknown or its decompressor is not installed
+    """
+    if compression == "gzip":
+        return gzip.open(path, "rb")
+    if compression == "xz":
+        return lzma.open(path, "rb")
+    if compression == "bzip2":
+        return bz2.open(path, "rb")
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError(f"Reading zstd captures requires the zstandard package: {path}")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_size=DECOMPRESS_CHUNK_SIZE,
+                                                          closefd=True)
+    raise ValueError(f"Unsupported compression format: {compression}")
+
+
+class DecompressingStream:
+    """
+    Decompresses a file on a background thread, a few chunks ahead of the reader.
+
+    ``read`` returns decompressed chunks in order, each in a fresh writable
+    buffer that starts with ``headroom`` unused bytes, so the caller can put
+    leftover data of the previous chunk in front without copying the chunk.
+    At the end of the data only the headroom is returned. An error raised
+    while decompressing is raised again from ``read``.
+    """
+
+    def __init__(self, path: str, compression: str, chunk_size: int = DECOMPRESS_CHUNK_SIZE,
+                 headroom: int = 0):
+        """
+        Args:
+            path (str): Path to the compressed file
+            compression (str): Format as returned by ``compression_of``
+            chunk_size (int, optional): Decompressed bytes per chunk
+            headroom (int, optional): Unused bytes in front of each chunk
+        """
+        self.path = path
+        self.compression = compression
+        self.headroom = headroom
+        self._source = open_decompressed(path, compression)
+        self._chunk_size = chunk_size
+        self._chunks = queue.Queue(maxsize=DECOMPRESS_AHEAD)
+        self._stopped = threading.Event()
+        self._done = False
+        self._thread = threading.Thread(target=self._produce, name="capture-decompress", daemon=True)
+        self._thread.start()
+
+    def _produce(self):
+        """Thread body: decompress chunks into the queue until the end or until stopped."""
+        try:
+            while not self._stopped.is_set():
+                chunk = memoryview(bytearray(self.headroom + self._chunk_size))
+                filled = self.headroom
+                while filled < len(chunk):
+                    read = self._source.readinto(chunk[filled:])
+                    if not read:
+                        break
+                    filled += read
+                self._put(chunk[:filled])
+                if filled == self.headroom:
+                    return
+        except Exception as e:  # handed to the reading thread
+            self._put(e)
+
+    def _put(self, item):
+        """Queue an item, giving up when the stream is closed."""
+        while not self._stopped.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def read(self) -> memoryview:
+        """
+        Return the next decompressed chunk.
+
+        Returns:
+            memoryview: Headroom followed by decompressed data; only headroom at the end
+        """
+        if self._done:
+            return memoryview(bytearray(self.headroom))
+        item = self._chunks.get()
+        if isinstance(item, Exception):
+            self._done = True
+            raise item
+        if len(item) == self.headroom:
+            self._done = True
+        return item
+
+    def close(self):
+        """Stop the decompression thread and close the file."""
+        self._stopped.set()
+        self._thread.join()
+        self._source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,181 @@
+"""
+Header-level packet filters.
+
+A PacketFilter selects packets by transport protocol, port range and
+subnet. It is evaluated on the decoded header columns of a whole batch at
+once, before any metric sees the packets, and it reports which columns it
+needs so the reader can skip decoding everything else. The reader checks
+protocol and subnet terms on the network headers first and decodes
+transport headers only for the packets that remain.
+
+Filters are written in a small BPF-like syntax::
+
+    tcp udp portrange 30000-40000 net 10.0.0.0/8 host 2001:db8::1 sample 1%
+
+Terms of the same kind are alternatives (any may match); different kinds
+must all match. Ports and addresses match either the source or destination.
+A ``sample`` term keeps only a hash-chosen share of whole flows (see
+sampling.FlowSample).
+"""
+import copy
+import ipaddress
+from typing import List, Optional, Set, Tuple
+
+import numpy as np
+
+from .batch import PacketBatch, PROTOCOLS, IPV4_MAPPED_PREFIX
+from .sampling import FlowSample
+
+MASK64 = (1 << 64) - 1
+
+
+class PacketFilter:
+    """
+    Protocol, port range and subnet predicate over packet batches.
+    """
+
+    def __init__(self, protocols: List[str] = None, ports: List[Tuple[int, int]] = None,
+                 subnets: List[str] = None, sample_rate: float = None):
+        """
+        Args:
+            protocols (list, optional): Transport protocol names, e.g. ["TCP", "SCTP"]
+            ports (list, optional): Inclusive (low, high) port ranges
+            subnets (list, optional): CIDR networks or single addresses, IPv4 or IPv6
+            sample_rate (float, optional): Share of flows kept; None or 1 keeps all
+        """
+        self.protocols = [p.upper() for p in protocols or []]
+        unknown = [p for p in self.protocols if p not in PROTOCOLS]
+        if unknown:
+            raise ValueError(f"Unknown protocol in filter: {', '.join(unknown)}")
+        self.ports = list(ports or [])
+        self.subnets = [_subnet(text) for text in subnets or []]
+        self.sample = FlowSample(sample_rate) if sample_rate is not None and sample_rate != 1 else None
+
+    @classmethod
+    def parse(cls, expression: Optional[str]) -> Optional["PacketFilter"]:
+        """
+        Parse a filter expression; an empty expression means no filter.
+
+        Raises:
+            ValueError: If the expression is malformed
+        """
+        tokens = (expression or "").replace(",", " ").split()
+        if not tokens:
+            return None
+        protocols, ports, subnets, sample_rate = [], [], [], None
+        words = iter(tokens)
+        for word in words:
+            keyword = word.lower()
+            if keyword.upper() in PROTOCOLS[1:]:
+                protocols.append(keyword)
+            elif keyword in ("port", "portrange"):
+                low, _, high = next(words, "").partition("-")
+                ports.append((int(low), int(high or low)))
+            elif keyword in ("net", "host"):
+                subnets.append(next(words, ""))
+            elif keyword == "sample":
+                sample_rate = parse_rate(next(words, ""))
+            else:
+                raise ValueError(f"Unknown filter term: {word}")
+        return cls(protocols, ports, subnets, sample_rate)
+
+    def sampled(self, sample_rate: Optional[float]) -> "PacketFilter":
+        """Return a copy of this filter that also samples flows at the given rate (None keeps all)."""
+        sampled = copy.copy(self)
+        sampled.sample = FlowSample(sample_rate) if sample_rate is not None and sample_rate != 1 else None
+        return sampled
+
+    @property
+    def fields(self) -> Set[str]:
+        """Columns the filter reads."""
+        fields = set()
+        if self.protocols:
+            fields.add("protocol")
+        if self.ports:
+            fields.update(("src_port", "dst_port"))
+        if self.subnets:
+            fields.update(("src_hi", "src_lo", "dst_hi", "dst_lo"))
+        if self.sample is not None:
+            fields.update(self.sample.fields)
+        return fields
+
+    @property
+    def network_terms(self) -> bool:
+        """Whether the filter has terms that network headers alone can decide."""
+        return bool(self.protocols or self.subnets)
+
+    def mask(self, batch: PacketBatch) -> np.ndarray:
+        """Boolean mask of the packets in a batch that pass the filter."""
+        keep = self.network_mask(batch, batch["protocol"])
+        if self.ports:
+            matched = np.zeros(len(batch), dtype=bool)
+            for low, high in self.ports:
+                for column in ("src_port", "dst_port"):
+                    matched |= (batch[column] >= low) & (batch[column] <= high)
+            keep &= matched
+        if self.sample is not None:
+            keep &= self.sample.mask(batch)
+        return keep
+
+    def network_mask(self, batch: PacketBatch, protocol: np.ndarray) -> np.ndarray:
+        """
+        Boolean mask of the packets that pass the protocol and subnet terms.
+
+        Args:
+            batch (PacketBatch): Batch with at least the network columns decoded
+            protocol (np.ndarray): Transport protocol code per packet, which
+                                   the reader may take from the IP header
+        """
+        keep = np.ones(len(batch), dtype=bool)
+        if self.protocols:
+            codes = [PROTOCOLS.index(p) for p in self.protocols]
+            keep &= np.isin(protocol, codes)
+        if self.subnets:
+            matched = np.zeros(len(batch), dtype=bool)
+            for net_hi, net_lo, mask_hi, mask_lo in self.subnets:
+                for side in ("src", "dst"):
+                    matched |= (((batch[f"{side}_hi"] & np.uint64(mask_hi)) == np.uint64(net_hi))
+                                & ((batch[f"{side}_lo"] & np.uint64(mask_lo)) == np.uint64(net_lo)))
+            keep &= matched
+        return keep
+
+    def __str__(self) -> str:
+        terms = [p.lower() for p in self.protocols]
+        terms += [f"portrange {low}-{high}" for low, high in self.ports]
+        terms += [f"net {_format_subnet(*subnet)}" for subnet in self.subnets]
+        if self.sample is not None:
+            terms.append(str(self.sample))
+        return " ".join(terms)
+
+
+def parse_rate(text: str) -> float:
+    """
+    Parse a sample rate given as a fraction ("0.01") or a percentage ("1%").
+
+    Raises:
+        ValueError: If the text is not a rate in (0, 1]
+    """
+    text = text.strip()
+    rate = float(text[:-1]) / 100 if text.endswith("%") else float(text)
+    if not 0 < rate <= 1:
+        raise ValueError(f"Sample rate must be in (0, 1], got {text}")
+    return rate
+
+
+def _subnet(text: str) -> Tuple[int, int, int, int]:
+    """Turn a CIDR string into (network hi, network lo, mask hi, mask lo) in table encoding."""
+    network = ipaddress.ip_network(text, strict=False)
+    value, prefix = int(network.network_address), network.prefixlen
+    if network.version == 4:
+        value, prefix = IPV4_MAPPED_PREFIX | value, prefix + 96
+    mask = ((1 << 128) - 1) ^ ((1 << (128 - prefix)) - 1)
+    return value >> 64, value & MASK64, mask >> 64, mask & MASK64
+
+
+def _format_subnet(net_hi: int, net_lo: int, mask_hi: int, mask_lo: int) -> str:
+    """Inverse of _subnet, for display."""
+    value, mask = (net_hi << 64) | net_lo, (mask_hi << 64) | mask_lo
+    prefix = bin(mask).count("1")
+    if value >> 32 == 0xFFFF and prefix >= 96:
+        return f"{ipaddress.IPv4Address(value & 0xFFFFFFFF)}/{prefix - 96}"
+    return f"{ipaddress.IPv6Address(value)}/{prefix}"
@@ -0,0 +1,166 @@
+"""
+Concurrent analysis of many captures.
+
+A fleet run expands a directory or glob into capture files and analyzes
+them on a pool of worker processes, one capture per task. Every capture
+yields one record, either its metrics or the error that stopped it, so a
+damaged file never aborts the batch. The records are then summarized into
+a fleet-level aggregate, with fleet-wide latency and RTT percentiles taken
+from the merged quantile sketches of the captures.
+"""
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+from .analysis import analyze_capture
+from .cache import CaptureCache
+from .compression import COMPRESSED_SUFFIXES
+from .filters import PacketFilter
+from .parallel import default_workers
+from .sketch import QuantileSketch, distribution
+
+# File extensions picked up when a directory is given, plain or compressed
+CAPTURE_EXTENSIONS = (".pcap", ".pcapng", ".cap")
+CAPTURE_EXTENSIONS += tuple(ext + suffix for ext in CAPTURE_EXTENSIONS for suffix in COMPRESSED_SUFFIXES)
+
+# capture_stats fields that add up across captures
+TOTAL_FIELDS = ("packets_analyzed", "bytes_analyzed", "duration_s")
+
+
+def expand_captures(pattern: str) -> List[str]:
+    """
+    List the capture files named by a directory, a glob or a single path.
+
+    Args:
+        pattern (str): Directory (searched recursively), glob pattern or file path
+
+    Returns:
+        list: Sorted capture file paths
+    """
+    if os.path.isdir(pattern):
+        paths = [
+            os.path.join(root, name)
+            for root, _, files in os.walk(pattern)
+            for name in files if name.lower().endswith(CAPTURE_EXTENSIONS)
+        ]
+    else:
+        paths = [path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path)]
+    return sorted(paths)
+
+
+def analyze_one(path: str, metric_names: List[str], options: Dict[str, Dict] = None,
+                batch_size: int = 65536, cache: CaptureCache = None,
+                packet_filter: PacketFilter = None) -> Dict[str, Any]:
+    """
+    Analyze one capture of a fleet run, turning any failure into an error record.
+
+    Returns:
+        dict: {"pcap_file", "status": "ok", "metrics"} or {"pcap_file", "status": "error", "error"}
+    """
+    try:
+        metrics = analyze_capture(path, metric_names, options, batch_size, cache=cache, evict=False,
+                                  packet_filter=packet_filter)
+        return {"pcap_file": path, "status": "ok", "metrics": metrics}
+    except Exception as e:
+        return {"pcap_file": path, "status": "error", "error": f"{type(e).__name__}: {e}"}
+
+
+def analyze_fleet(paths: List[str], metric_names: List[str], options: Dict[str, Dict] = None,
+                  workers: int = None, batch_size: int = 65536,
+                  cache: CaptureCache = None,
+                  packet_filter: PacketFilter = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Analyze many captures concurrently.
+
+    Args:
+        paths (list): Capture file paths
+        metric_names (list): Requested metric names
+        options (dict, optional): Metric name -> accumulator keyword arguments
+        workers (int, optional): Size of the worker pool. Defaults to the CPU count.
+        batch_size (int, optional): Packets per batch
+        cache (CaptureCache, optional): Parsed-capture cache shared by the workers
+        packet_filter (PacketFilter, optional): Only analyze matching packets
+
+    Returns:
+        tuple: (one record per capture in input order, fleet summary)
+    """
+    workers = min(workers or default_workers(), max(len(paths), 1))
+    if workers == 1:
+        records = [analyze_one(path, metric_names, options, batch_size, cache, packet_filter) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(analyze_one, path, metric_names, options, batch_size, cache, packet_filter)
+                       for path in paths]
+            records = []
+            for path, future in zip(paths, futures):
+                try:
+                    records.append(future.result())
+                except Exception as e:
+                    # The worker itself died (e.g. killed while parsing)
+                    records.append({"pcap_file": path, "status": "error", "error": f"{type(e).__name__}: {e}"})
+
+    # Workers skip eviction so they never remove an entry another one is writing
+    if cache is not None:
+        cache.evict()
+    return records, summarize_fleet(records)
+
+
+def summarize_fleet(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Aggregate per-capture records into fleet-level statistics.
+
+    Capture counters in ``capture_stats`` are summed. Every other numeric
+    metric field is reduced to its mean, minimum and maximum over the
+    captures that report it; series and other lists are left out. The
+    quantile sketches of the captures are merged, so "percentiles" holds
+    the distribution of all samples of the fleet rather than an average of
+    per-capture percentiles.
+
+    Returns:
+        dict: {"captures", "analyzed", "failed", "totals", "metrics", "percentiles", "errors"}
+    """
+    analyzed = [record["metrics"] for record in records if record["status"] == "ok"]
+    summary = {
+        "captures": len(records),
+        "analyzed": len(analyzed),
+        "failed": len(records) - len(analyzed),
+        "totals": {field: 0 for field in TOTAL_FIELDS},
+        "metrics": {},
+        "percentiles": {},
+        "errors": {record["pcap_file"]: record["error"] for record in records if record["status"] != "ok"}
+    }
+
+    values: Dict[str, Dict[str, List[float]]] = {}
+    sketches: Dict[str, QuantileSketch] = {}
+    for metrics in analyzed:
+        for field in TOTAL_FIELDS:
+            summary["totals"][field] += metrics.get("capture_stats", {}).get(field, 0)
+        for key, section in metrics.items():
+            if key not in ("capture_stats", "timeseries", "sketches") and isinstance(section, dict):
+                _collect_numbers(section, values.setdefault(key, {}))
+        for key, data in metrics.get("sketches", {}).items():
+            sketch = QuantileSketch.from_dict(data)
+            if key in sketches:
+                sketches[key].merge(sketch)
+            else:
+                sketches[key] = sketch
+
+    for key, fields in values.items():
+        summary["metrics"][key] = {
+            field: {"mean": round(sum(numbers) / len(numbers), 2), "min": min(numbers), "max": max(numbers)}
+            for field, numbers in fields.items()
+        }
+    for key, sketch in sketches.items():
+        summary["percentiles"][key] = {"samples": sketch.count, **distribution(sketch)}
+    summary["totals"]["duration_s"] = round(summary["totals"]["duration_s"], 3)
+    return summary
+
+
+def _collect_numbers(section: Dict[str, Any], fields: Dict[str, List[float]], prefix: str = ""):
+    """Gather numeric leaves of a result section under dotted field names."""
+    for name, value in section.items():
+        if isinstance(value, dict):
+            _collect_numbers(value, fields, f"{prefix}{name}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            fields.setdefault(prefix + name, []).append(value)
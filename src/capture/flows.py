@@ -0,0 +1,139 @@
+"""
+Bidirectional flow table over a packet batch.
+
+The table groups the transport-layer packets of a batch by canonical
+5-tuple (protocol plus the two endpoints in a fixed order, so both
+directions of a conversation share one flow) and sorts them by flow, then
+time, in a single lexsort. Each flow's packets occupy a contiguous slice
+of the sorted order given by per-flow offsets, and flow-level metrics read
+their columns from this one shared structure instead of regrouping the
+batch themselves.
+"""
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from .batch import PacketBatch, PROTO_NONE
+
+# Canonical flow key columns: protocol, endpoint A, endpoint B
+FLOW_KEY_COLUMNS = ["protocol", "a_hi", "a_lo", "b_hi", "b_lo", "a_port", "b_port"]
+
+# Packet columns needed to build a flow table
+FLOW_FIELDS = ("ts_ns", "protocol", "src_hi", "src_lo", "dst_hi", "dst_lo", "src_port", "dst_port")
+
+
+def canonical_keys(batch: PacketBatch, rows: np.ndarray) -> Tuple[List[np.ndarray], np.ndarray]:
+    """
+    Canonical flow key columns of some packets of a batch.
+
+    Args:
+        batch (PacketBatch): Decoded packets
+        rows (np.ndarray): Rows to key
+
+    Returns:
+        tuple: (key columns in FLOW_KEY_COLUMNS order, forward mask)
+    """
+    src = [batch[name][rows] for name in ("src_hi", "src_lo", "src_port")]
+    dst = [batch[name][rows] for name in ("dst_hi", "dst_lo", "dst_port")]
+
+    # Forward when (src address, src port) <= (dst address, dst port)
+    forward = (src[0] < dst[0]) | ((src[0] == dst[0]) & (
+        (src[1] < dst[1]) | ((src[1] == dst[1]) & (src[2] <= dst[2]))))
+    a = [np.where(forward, s, d) for s, d in zip(src, dst)]
+    b = [np.where(forward, d, s) for s, d in zip(src, dst)]
+    return [batch["protocol"][rows], a[0], a[1], b[0], b[1], a[2], b[2]], forward
+
+
+class FlowTable:
+    """
+    Packets of one batch grouped by bidirectional flow.
+
+    Endpoint A of a flow is the lower of the two (address, port) pairs.
+    Packets sent from A to B are "forward". Positions index the sorted
+    order: ``rows[position]`` is the packet's row in the batch, and flow
+    ``f`` covers positions ``offsets[f]:offsets[f + 1]``.
+
+    Directions of a flow are identified by ``flow * 2 + side``, where side
+    is 0 for traffic sent by endpoint A and 1 for traffic sent by B.
+    """
+
+    def __init__(self, batch: PacketBatch):
+        """
+        Build the flow table of a batch.
+
+        Args:
+            batch (PacketBatch): Decoded packets; rows without a transport
+                                 header are left out
+        """
+        self.batch = batch
+        rows = np.flatnonzero(batch["protocol"] != PROTO_NONE)
+        key, forward = canonical_keys(batch, rows)
+
+        # One sort by flow key, then time
+        order = np.lexsort([batch["ts_ns"][rows]] + key[::-1])
+        self.rows = rows[order]
+        self.forward = forward[order]
+        changed = np.zeros(len(order), dtype=bool)
+        if len(order):
+            changed[0] = True
+            for column in key:
+                ordered = column[order]
+                changed[1:] |= ordered[1:] != ordered[:-1]
+        starts = np.flatnonzero(changed)
+
+        self.flow = np.cumsum(changed) - 1
+        self.offsets = np.append(starts, len(order)).astype(np.int64)
+        self.keys = np.stack([column[order[starts]].astype(np.uint64) for column in key], axis=1) \
+            if len(order) else np.zeros((0, len(key)), dtype=np.uint64)
+        self._columns: Dict[str, np.ndarray] = {}
+        self._key_list = None
+        self._index = None
+
+    def __len__(self) -> int:
+        """Number of flows."""
+        return len(self.keys)
+
+    @property
+    def size(self) -> int:
+        """Number of packets in the table."""
+        return len(self.rows)
+
+    def column(self, name: str) -> np.ndarray:
+        """Return a packet column in flow order (computed once per table)."""
+        if name not in self._columns:
+            self._columns[name] = self.batch[name][self.rows]
+        return self._columns[name]
+
+    def span(self, protocol: int) -> slice:
+        """
+        Positions of all packets of one protocol.
+
+        Flows are sorted by protocol first, so these form one slice.
+        """
+        first, last = np.searchsorted(self.keys[:, 0], [protocol, protocol + 1]) if len(self) else (0, 0)
+        return slice(int(self.offsets[first]), int(self.offsets[last]))
+
+    def sides(self, positions=slice(None)) -> np.ndarray:
+        """Direction id (flow * 2 + side) of the packets at the given positions."""
+        return self.flow[positions] * 2 + ~self.forward[positions]
+
+    def flow_keys(self) -> List[Tuple]:
+        """Canonical key tuple of every flow."""
+        if self._key_list is None:
+            self._key_list = [tuple(key) for key in self.keys.tolist()]
+        return self._key_list
+
+    def find(self, key: Tuple):
+        """Return the id of the flow with the given canonical key, or None."""
+        if self._index is None:
+            self._index = {flow_key: flow for flow, flow_key in enumerate(self.flow_keys())}
+        return self._index.get(key)
+
+    def direction_key(self, direction: int) -> Tuple:
+        """Key of one direction of a flow: the flow key plus the sending side."""
+        return self.flow_keys()[direction >> 1] + (direction & 1,)
+
+    def direction_keys(self, directions: np.ndarray) -> List[Tuple]:
+        """Keys of several flow directions."""
+        keys = self.flow_keys()
+        return [keys[direction >> 1] + (direction & 1,) for direction in directions.tolist()]
@@ -0,0 +1,91 @@
+"""
+Incremental analysis of captures that are still being written.
+
+A CaptureFollower keeps the metric accumulators of a capture alive between
+refreshes, together with the byte offset (and pcapng interface state) of
+the first record not yet read. Each refresh decodes only the records
+appended since the previous one, so its cost is proportional to the new
+data rather than to the whole file.
+
+Compressed captures cannot be followed: a decompressor can only resume
+from the start of the stream, so every refresh would decompress the whole
+file again.
+"""
+import os
+from typing import Dict, List
+
+from .compression import compression_of
+from .filters import PacketFilter
+from .metrics import collect_results, create_accumulators, required_fields, update_accumulators
+from .reader import PcapReader
+
+# A capture shorter than a pcap file header is still being started
+MIN_CAPTURE_SIZE = 24
+
+
+class CaptureFollower:
+    """
+    Follows a growing capture file and updates metrics incrementally.
+
+    If the file is replaced or truncated (a new inode, or a size smaller than
+    the offset already read), the follower starts over from the beginning.
+    """
+
+    def __init__(self, path: str, metric_names: List[str], options: Dict[str, Dict] = None,
+                 batch_size: int = 65536, packet_filter: PacketFilter = None):
+        """
+        Args:
+            path (str): Path to the pcap or pcapng file being written
+            metric_names (list): Requested metric names
+            options (dict, optional): Metric name -> accumulator keyword arguments
+            batch_size (int, optional): Packets per batch
+            packet_filter (PacketFilter, optional): Only analyze matching packets
+        """
+        self.path = path
+        self.metric_names = metric_names
+        self.options = options
+        self.batch_size = batch_size
+        self.packet_filter = packet_filter
+        self._reset()
+
+    def _reset(self):
+        """Forget everything read so far."""
+        self.accumulators = create_accumulators(self.metric_names, self.options, self.packet_filter)
+        self.offset = None
+        self.state = None
+        self.inode = None
+        self.refreshes = 0
+
+    def refresh(self) -> int:
+        """
+        Decode the records appended since the last refresh.
+
+        Returns:
+            int: Number of new packets
+
+        Raises:
+            ValueError: If the capture is compressed
+        """
+        stat = os.stat(self.path)
+        if self.inode is not None and (stat.st_ino != self.inode or stat.st_size < self.offset):
+            self._reset()
+        if stat.st_size < MIN_CAPTURE_SIZE:
+            return 0
+        if compression_of(self.path) is not None:
+            raise ValueError(f"Compressed captures cannot be followed: {self.path}")
+
+        packets = 0
+        fields = required_fields(self.accumulators, self.packet_filter)
+        with PcapReader(self.path) as reader:
+            for batch in reader.batches(self.batch_size, start=self.offset, state=self.state,
+                                        fields=fields, packet_filter=self.packet_filter):
+                update_accumulators(self.accumulators, batch)
+                packets += len(batch)
+            self.offset, self.state = reader.next_offset, reader.next_state.copy()
+        self.inode = stat.st_ino
+        self.refreshes += 1
+        return packets
+
+    def results(self) -> Dict[str, Dict]:
+        """Current metric results, keyed by result name."""
+        return collect_results(self.accumulators)
@@ -0,0 +1,394 @@
+"""
+GTP-U decapsulation and per-tunnel user-plane metrics.
+
+On N3/N9 the UE's traffic is carried in GTP-U over UDP port 2152, so the
+outer headers only describe the tunnel between gNB and UPF. This module
+strips the GTP-U header (and its extension headers, picking the QFI out of
+the PDU Session Container) for a whole batch at once and decodes the inner
+IP and transport headers with the regular header decoder. The inner
+packets form an ordinary packet batch, with the tunnel TEID and QFI as
+extra columns, so anything that works on packets works on them too.
+"""
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+from .batch import PacketBatch, PACKET_COLUMNS, PROTOCOLS, PROTO_UDP, PROTO_TCP, format_address
+from .flows import FlowTable
+from .reader import LINKTYPE_RAW, decode_headers, _be16, _be32, _take
+
+# Well-known UDP port for GTP-U
+GTPU_PORT = 2152
+
+# GTPv1-U header fields
+GTPU_VERSION = 1
+GTPU_FLAG_PT = 0x10
+GTPU_FLAGS_OPTIONAL = 0x07
+GTPU_FLAG_EXTENSION = 0x04
+GTPU_G_PDU = 0xFF
+GTPU_HEADER_LEN = 8
+GTPU_EXT_PDU_SESSION_CONTAINER = 0x85
+
+# Extension headers followed per packet
+MAX_GTPU_EXTENSIONS = 4
+
+# Marks a packet without a PDU Session Container
+NO_QFI = 0xFF
+
+# Inner packet columns: the packet columns plus the tunnel and the outer packet's row
+TUNNEL_COLUMNS = dict(PACKET_COLUMNS, teid=np.uint32, qfi=np.uint8, packet=np.int64)
+
+# Outer packet columns read by decapsulate()
+GTPU_FIELDS = ("ts_ns", "protocol", "src_port", "dst_port", "payload_offset", "payload_len",
+               "data_offset", "caplen")
+
+# TCP flags used for the inner handshake
+TCP_SYN = 0x02
+TCP_ACK = 0x10
+
+NSEC_PER_SEC = 1_000_000_000
+NSEC_PER_MSEC = 1_000_000
+
+
+def decapsulate(batch: PacketBatch, raw: np.ndarray = None, fields=None) -> PacketBatch:
+    """
+    Strip GTP-U from the tunnelled packets of a batch.
+
+    Only G-PDUs (message type 255) carry user traffic; echo and error
+    messages on the GTP-U port are skipped.
+
+    Args:
+        batch (PacketBatch): Decoded outer packets
+        raw (np.ndarray, optional): Capture buffer. Defaults to ``batch.buffer``.
+        fields (iterable, optional): Inner columns needed, as for decode_headers
+
+    Returns:
+        PacketBatch: Inner packets with TUNNEL_COLUMNS, one row per G-PDU
+    """
+    raw = batch.buffer if raw is None else raw
+    rows = np.flatnonzero((batch["protocol"] == PROTO_UDP)
+                          & ((batch["src_port"] == GTPU_PORT) | (batch["dst_port"] == GTPU_PORT))
+                          & (batch["payload_len"] >= GTPU_HEADER_LEN))
+    start = batch["payload_offset"][rows]
+    captured = batch["data_offset"][rows] + batch["caplen"][rows]
+    udp_end = np.minimum(start + batch["payload_len"][rows], captured)
+
+    header = _take(raw, start, 12)
+    flags = header[:, 0]
+    optional = (flags & GTPU_FLAGS_OPTIONAL) != 0
+    pos = start + np.where(optional, 12, GTPU_HEADER_LEN)
+    valid = (((flags >> 5) == GTPU_VERSION) & ((flags & GTPU_FLAG_PT) != 0)
+             & (header[:, 1] == GTPU_G_PDU) & (pos <= udp_end))
+    end = np.minimum(start + GTPU_HEADER_LEN + _be16(header, 2), udp_end)
+    teid = _be32(header, 4)
+
+    # Extension header chain: length in 4-byte units, next type in the last byte
+    qfi = np.full(len(rows), NO_QFI, dtype=np.uint8)
+    next_type = np.where(valid & ((flags & GTPU_FLAG_EXTENSION) != 0), header[:, 11], 0)
+    for _ in range(MAX_GTPU_EXTENSIONS):
+        current = np.flatnonzero(next_type != 0)
+        if not current.size:
+            break
+        at = pos[current]
+        length = _take(raw, at, 1)[:, 0].astype(np.int64) * 4
+        fits = (length >= 4) & (at + length <= end[current])
+        container = fits & (next_type[current] == GTPU_EXT_PDU_SESSION_CONTAINER)
+        qfi[current[container]] = _take(raw, at[container] + 2, 1)[:, 0] & 0x3F
+        valid[current[~fits]] = False
+        pos[current] = at + length
+        next_type[current] = np.where(fits, _take(raw, at + np.maximum(length, 1) - 1, 1)[:, 0], 0)
+
+    rows, pos, end = rows[valid], pos[valid], end[valid]
+    inner = PacketBatch(len(rows), TUNNEL_COLUMNS)
+    inner.size = len(rows)
+    inner.buffer = raw
+    inner.raw("ts_ns")[:] = batch["ts_ns"][rows]
+    inner.raw("length")[:] = end - pos
+    inner.raw("caplen")[:] = np.minimum(end, batch["data_offset"][rows] + batch["caplen"][rows]) - pos
+    inner.raw("data_offset")[:] = pos
+    inner.raw("linktype")[:] = LINKTYPE_RAW
+    inner.raw("teid")[:] = teid[valid]
+    inner.raw("qfi")[:] = qfi[valid]
+    inner.raw("packet")[:] = rows
+    decode_headers(raw, inner, fields)
+    return inner
+
+
+def _qfi_list(mask: int) -> List[int]:
+    """QFIs set in a 64-bit mask."""
+    return [qfi for qfi in range(64) if mask >> qfi & 1]
+
+
+def _rate_kbps(nbytes: int, first: int, last: int) -> float:
+    """Average rate over a first/last timestamp span, 0 when the span is empty."""
+    return round(nbytes * 8 / ((last - first) / NSEC_PER_SEC) / 1000, 2) if last > first else 0
+
+
+class GtpuAccumulator:
+    """
+    User-plane metrics per GTP-U tunnel (TEID) and per inner flow.
+
+    Every TEID and inner flow keeps packet and byte counts, first and last
+    timestamps and, for TCP, the times of the first SYN and SYN-ACK, so
+    partial states from consecutive parts merge by addition and min/max.
+    The handshake RTT of an inner flow is credited to every TEID it used.
+
+    The inner packets also go through the regular RTT and loss
+    accumulators, so every inner TCP direction has continuous RTT samples
+    and classified retransmissions. Those are credited to the TEIDs that
+    carried the direction's data. Tunnels and flows are ranked three ways:
+    by throughput, by RTT and by loss, each table cut to ``top`` entries.
+    """
+
+    fields = GTPU_FIELDS
+
+    def __init__(self, top: int = 20):
+        """
+        Args:
+            top (int, optional): Tunnels and inner flows listed in each ranking
+        """
+        # metrics registers this accumulator, so it is imported here
+        from .metrics import LossAccumulator, RttAccumulator
+
+        self.top = top
+        self.packets = 0
+        self.bytes = 0
+        # teid -> [packets, bytes, first_ts, last_ts, qfi mask]
+        self.tunnels: Dict[int, list] = {}
+        # canonical inner flow key -> [packets, bytes, first_ts, last_ts, syn_ts, syn_ack_ts,
+        #                              TEIDs of A's packets, TEIDs of B's packets]
+        self.flows: Dict[tuple, list] = {}
+        # Inner TCP RTT and loss per flow direction
+        self.rtt = RttAccumulator(top=0)
+        self.loss = LossAccumulator(top=0)
+
+    def update(self, batch: PacketBatch):
+        """Consume a batch of packets."""
+        if not len(batch) or batch.buffer is None:
+            return
+        inner = decapsulate(batch)
+        if not len(inner):
+            return
+        self.packets += len(inner)
+        self.bytes += int(inner["length"].sum())
+        self._update_tunnels(inner)
+        flows = FlowTable(inner)
+        self._update_flows(flows)
+        self.rtt.update(inner, flows)
+        self.loss.update(inner, flows)
+
+    def _update_tunnels(self, inner: PacketBatch):
+        """Per-TEID counters of one batch."""
+        order = np.argsort(inner["teid"], kind="stable")
+        teid = inner["teid"][order]
+        starts = np.flatnonzero(np.r_[True, teid[1:] != teid[:-1]])
+        ts = inner["ts_ns"][order]
+        qfi = inner["qfi"][order].astype(np.uint64)
+        qfi_bits = np.where(qfi < 64, np.uint64(1) << np.minimum(qfi, 63), np.uint64(0))
+        columns = zip(teid[starts].tolist(),
+                      np.diff(np.append(starts, len(order))).tolist(),
+                      np.add.reduceat(inner["length"][order].astype(np.int64), starts).tolist(),
+                      np.minimum.reduceat(ts, starts).tolist(),
+                      np.maximum.reduceat(ts, starts).tolist(),
+                      np.bitwise_or.reduceat(qfi_bits, starts).tolist())
+        for teid_value, *values in columns:
+            self._add_tunnel(teid_value, values)
+
+    def _update_flows(self, flows: FlowTable):
+        """Per-inner-flow counters and handshake times of one batch."""
+        if not len(flows):
+            return
+        starts = flows.offsets[:-1]
+        ts = flows.column("ts_ns")
+        flags = flows.column("tcp_flags")
+        is_tcp = flows.column("protocol") == PROTO_TCP
+        never = np.iinfo(np.int64).max
+        syn = np.where(is_tcp & ((flags & (TCP_SYN | TCP_ACK)) == TCP_SYN), ts, never)
+        syn_ack = np.where(is_tcp & ((flags & (TCP_SYN | TCP_ACK)) == (TCP_SYN | TCP_ACK)), ts, never)
+
+        # TEIDs seen per flow direction; a flow normally uses one per direction
+        direction_teids: Dict[int, set] = {}
+        pairs = np.unique((flows.sides() << 32) | flows.column("teid").astype(np.int64))
+        for pair in pairs.tolist():
+            direction_teids.setdefault(pair >> 32, set()).add(pair & 0xFFFFFFFF)
+
+        columns = zip(flows.flow_keys(),
+                      np.diff(flows.offsets).tolist(),
+                      np.add.reduceat(flows.column("length").astype(np.int64), starts).tolist(),
+                      ts[starts].tolist(),
+                      np.maximum.reduceat(ts, starts).tolist(),
+                      np.minimum.reduceat(syn, starts).tolist(),
+                      np.minimum.reduceat(syn_ack, starts).tolist())
+        for flow, (key, *values) in enumerate(columns):
+            self._add_flow(key, values + [direction_teids.get(flow * 2, set()),
+                                          direction_teids.get(flow * 2 + 1, set())])
+
+    def _add_tunnel(self, teid: int, values: list):
+        """Fold [packets, bytes, first_ts, last_ts, qfi mask] into a tunnel record."""
+        tunnel = self.tunnels.get(teid)
+        if tunnel is None:
+            self.tunnels[teid] = list(values)
+            return
+        tunnel[0] += values[0]
+        tunnel[1] += values[1]
+        tunnel[2] = min(tunnel[2], values[2])
+        tunnel[3] = max(tunnel[3], values[3])
+        tunnel[4] |= values[4]
+
+    def _add_flow(self, key: tuple, values: list):
+        """Fold [packets, bytes, first_ts, last_ts, syn_ts, syn_ack_ts, A's TEIDs, B's TEIDs] into a flow record."""
+        record = self.flows.get(key)
+        if record is None:
+            self.flows[key] = values[:6] + [set(values[6]), set(values[7])]
+            return
+        record[0] += values[0]
+        record[1] += values[1]
+        record[2] = min(record[2], values[2])
+        record[3] = max(record[3], values[3])
+        record[4] = min(record[4], values[4])
+        record[5] = min(record[5], values[5])
+        record[6] |= values[6]
+        record[7] |= values[7]
+
+    def merge(self, later: "GtpuAccumulator"):
+        """Add the later part's tunnel and flow records and its inner RTT and loss."""
+        self.packets += later.packets
+        self.bytes += later.bytes
+        for teid, values in later.tunnels.items():
+            self._add_tunnel(teid, values)
+        for key, values in later.flows.items():
+            self._add_flow(key, values)
+        self.rtt.merge(later.rtt)
+        self.loss.merge(later.loss)
+
+    def _handshake_ms(self, record: list):
+        """Inner TCP handshake RTT of a flow record, or None."""
+        syn, syn_ack = record[4], record[5]
+        if syn_ack == np.iinfo(np.int64).max or syn > syn_ack:
+            return None
+        return (syn_ack - syn) / NSEC_PER_MSEC
+
+    def _direction_metrics(self, key: tuple, side: int):
+        """[RTT samples, sum, max] and [segments, retransmits, spurious] of one inner flow direction."""
+        direction = key + (side,)
+        stats = self.rtt.directions.get(direction)
+        counts = self.loss.flows.get(direction)
+        rtt = [stats.count, stats.total, stats.max] if stats is not None else [0, 0.0, 0.0]
+        loss = [sum(counts[:3]), counts[1], counts[4]] if counts is not None else [0, 0, 0]
+        return rtt, loss
+
+    def result(self) -> Dict[str, Union[int, List[Dict]]]:
+        """Return tunnel and inner-flow tables ranked by throughput, RTT and loss."""
+        tunnel_handshakes: Dict[int, List[float]] = {}
+        tunnel_flows: Dict[int, int] = {}
+        tunnel_rtts: Dict[int, list] = {}
+        tunnel_losses: Dict[int, List[int]] = {}
+        flows = []
+        for key, record in self.flows.items():
+            protocol, a_hi, a_lo, b_hi, b_lo, a_port, b_port = key
+            handshake = self._handshake_ms(record)
+            teids = record[6] | record[7]
+            for teid in teids:
+                tunnel_flows[teid] = tunnel_flows.get(teid, 0) + 1
+                if handshake is not None:
+                    tunnel_handshakes.setdefault(teid, []).append(handshake)
+
+            # A direction's RTT and loss belong to the TEIDs that carried its data
+            rtt, loss = [0, 0.0, 0.0], [0, 0, 0]
+            for side in (0, 1):
+                samples, counts = self._direction_metrics(key, side)
+                for teid in record[6 + side]:
+                    _add_rtt(tunnel_rtts.setdefault(teid, [0, 0.0, 0.0]), samples)
+                    totals = tunnel_losses.setdefault(teid, [0, 0, 0])
+                    totals[:] = [a + b for a, b in zip(totals, counts)]
+                _add_rtt(rtt, samples)
+                loss = [a + b for a, b in zip(loss, counts)]
+
+            flows.append({
+                "protocol": PROTOCOLS[protocol],
+                "endpoint_a": f"{format_address(a_hi, a_lo)}:{a_port}",
+                "endpoint_b": f"{format_address(b_hi, b_lo)}:{b_port}",
+                "teids": sorted(teids),
+                "packets": record[0],
+                "bytes": record[1],
+                "duration_s": round((record[3] - record[2]) / NSEC_PER_SEC, 3),
+                "throughput_kbps": _rate_kbps(record[1], record[2], record[3]),
+                "handshake_rtt_ms": round(handshake, 3) if handshake is not None else None,
+                **_rtt_columns(rtt),
+                **_loss_columns(loss)
+            })
+
+        tunnels = []
+        for teid, (packets, nbytes, first, last, qfi_mask) in self.tunnels.items():
+            handshakes = tunnel_handshakes.get(teid)
+            tunnels.append({
+                "teid": teid,
+                "qfi": _qfi_list(qfi_mask),
+                "packets": packets,
+                "bytes": nbytes,
+                "duration_s": round((last - first) / NSEC_PER_SEC, 3),
+                "throughput_kbps": _rate_kbps(nbytes, first, last),
+                "inner_flows": tunnel_flows.get(teid, 0),
+                "handshake_rtt_ms": round(sum(handshakes) / len(handshakes), 3) if handshakes else None,
+                **_rtt_columns(tunnel_rtts.get(teid, [0, 0.0, 0.0])),
+                **_loss_columns(tunnel_losses.get(teid, [0, 0, 0]))
+            })
+
+        return {
+            "tunnels": len(tunnels),
+            "inner_flows": len(flows),
+            "packets": self.packets,
+            "bytes": self.bytes,
+            "by_teid": self._rank(tunnels, _by_throughput),
+            "by_flow": self._rank(flows, _by_throughput),
+            "by_teid_latency": self._rank(tunnels, _by_latency),
+            "by_flow_latency": self._rank(flows, _by_latency),
+            "by_teid_loss": self._rank(tunnels, _by_loss),
+            "by_flow_loss": self._rank(flows, _by_loss)
+        }
+
+    def _rank(self, entries: List[Dict], key) -> List[Dict]:
+        """The top entries by a ranking key; entries the key maps to None are left out."""
+        return sorted((entry for entry in entries if key(entry) is not None), key=key)[:self.top]
+
+
+def _add_rtt(totals: list, samples: list):
+    """Fold [RTT samples, sum, max] into running totals of the same layout."""
+    totals[0] += samples[0]
+    totals[1] += samples[1]
+    totals[2] = max(totals[2], samples[2])
+
+
+def _rtt_columns(rtt: list) -> Dict[str, Union[int, float, None]]:
+    """Inner TCP RTT sample count, average and maximum in milliseconds from [samples, sum, max]."""
+    count, total, highest = rtt
+    if not count:
+        return {"rtt_samples": 0, "rtt_avg_ms": None, "rtt_max_ms": None}
+    return {"rtt_samples": count, "rtt_avg_ms": round(total / count, 3), "rtt_max_ms": round(highest, 3)}
+
+
+def _loss_columns(loss: List[int]) -> Dict[str, Union[int, float]]:
+    """Inner TCP segments, retransmissions and loss percentage from [segments, retransmits, spurious]."""
+    segments, retransmits, spurious = loss
+    return {"segments": segments, "retransmits": retransmits,
+            "loss_percentage": round((retransmits - spurious) / segments * 100, 2) if segments else 0}
+
+
+def _by_throughput(entry: Dict) -> tuple:
+    """Highest throughput first."""
+    return -entry["throughput_kbps"], -entry["bytes"]
+
+
+def _by_latency(entry: Dict) -> Optional[tuple]:
+    """Highest average RTT first, then highest handshake RTT; None without either."""
+    rtt, handshake = entry["rtt_avg_ms"], entry["handshake_rtt_ms"]
+    if rtt is None and handshake is None:
+        return None
+    return -(rtt if rtt is not None else handshake), -(handshake or 0), -entry["bytes"]
+
+
+def _by_loss(entry: Dict) -> Optional[tuple]:
+    """Highest loss percentage first; None without retransmissions."""
+    if not entry["retransmits"]:
+        return None
+    return -entry["loss_percentage"], -entry["retransmits"]
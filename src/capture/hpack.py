@@ -0,0 +1,223 @@
+"""
+HPACK header block decoder (RFC 7541).
+
+Decodes the header blocks of HTTP/2 HEADERS frames, including Huffman
+coded string literals and the per-connection dynamic table. One decoder
+is kept per direction of a connection, since each endpoint compresses
+its headers against its own table.
+"""
+from collections import deque
+from typing import List, Tuple
+
+# Static table (RFC 7541 Appendix A); index 0 is unused
+STATIC_TABLE = (
+    None,
+    (":authority", ""), (":method", "GET"), (":method", "POST"), (":path", "/"),
+    (":path", "/index.html"), (":scheme", "http"), (":scheme", "https"), (":status", "200"),
+    (":status", "204"), (":status", "206"), (":status", "304"), (":status", "400"),
+    (":status", "404"), (":status", "500"), ("accept-charset", ""),
+    ("accept-encoding", "gzip, deflate"), ("accept-language", ""), ("accept-ranges", ""),
+    ("accept", ""), ("access-control-allow-origin", ""), ("age", ""), ("allow", ""),
+    ("authorization", ""), ("cache-control", ""), ("content-disposition", ""),
+    ("content-encoding", ""), ("content-language", ""), ("content-length", ""),
+    ("content-location", ""), ("content-range", ""), ("content-type", ""), ("cookie", ""),
+    ("date", ""), ("etag", ""), ("expect", ""), ("expires", ""), ("from", ""), ("host", ""),
+    ("if-match", ""), ("if-modified-since", ""), ("if-none-match", ""), ("if-range", ""),
+    ("if-unmodified-since", ""), ("last-modified", ""), ("link", ""), ("location", ""),
+    ("max-forwards", ""), ("proxy-authenticate", ""), ("proxy-authorization", ""),
+    ("range", ""), ("referer", ""), ("refresh", ""), ("retry-after", ""), ("server", ""),
+    ("set-cookie", ""), ("strict-transport-security", ""), ("transfer-encoding", ""),
+    ("user-agent", ""), ("vary", ""), ("via", ""), ("www-authenticate", "")
+)
+
+# Huffman code length of every symbol, 0-255 plus EOS (RFC 7541 Appendix B).
+# The code is canonical, so the codes themselves follow from the lengths.
+HUFFMAN_CODE_LENGTHS = (
+    13, 23, 28, 28, 28, 28, 28, 28, 28, 24, 30, 28, 28, 30, 28, 28, 28, 28, 28, 28, 28, 28, 30,
+    28, 28, 28, 28, 28, 28, 28, 28, 28, 6, 10, 10, 12, 13, 6, 8, 11, 10, 10, 8, 11, 8, 6, 6, 6,
+    5, 5, 5, 6, 6, 6, 6, 6, 6, 6, 7, 8, 15, 6, 12, 10, 13, 6, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7,
+    7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 8, 7, 8, 13, 19, 13, 14, 6, 15, 5, 6, 5, 6, 5, 6, 6, 6, 5,
+    7, 7, 6, 6, 6, 5, 6, 7, 6, 5, 5, 6, 7, 7, 7, 7, 7, 15, 11, 14, 13, 28, 20, 22, 20, 20, 22,
+    22, 22, 23, 22, 23, 23, 23, 23, 23, 24, 23, 24, 24, 22, 23, 24, 23, 23, 23, 23, 21, 22, 23,
+    22, 23, 23, 24, 22, 21, 20, 22, 22, 23, 23, 21, 23, 22, 22, 24, 21, 22, 23, 23, 21, 21, 22,
+    21, 23, 22, 23, 23, 20, 22, 22, 22, 23, 22, 22, 23, 26, 26, 20, 19, 22, 23, 22, 25, 26, 26,
+    26, 27, 27, 26, 24, 25, 19, 21, 26, 27, 27, 26, 27, 24, 21, 21, 26, 26, 28, 27, 27, 27, 20,
+    24, 20, 21, 22, 21, 21, 23, 22, 22, 25, 25, 24, 24, 26, 23, 26, 27, 26, 26, 27, 27, 27, 27,
+    27, 28, 27, 27, 27, 27, 27, 26, 30
+)
+HUFFMAN_EOS = 256
+
+# Default SETTINGS_HEADER_TABLE_SIZE
+DEFAULT_TABLE_SIZE = 4096
+
+# Per-entry overhead counted against the dynamic table size
+ENTRY_OVERHEAD = 32
+
+
+class HpackError(ValueError):
+    """Raised when a header block cannot be decoded."""
+
+
+def _canonical_tables():
+    """
+    Build canonical Huffman decoding tables.
+
+    Returns:
+        tuple: (symbols sorted by code, first code of each length,
+                index into symbols of each length's first code, count per length)
+    """
+    symbols = sorted(range(len(HUFFMAN_CODE_LENGTHS)), key=lambda s: (HUFFMAN_CODE_LENGTHS[s], s))
+    longest = max(HUFFMAN_CODE_LENGTHS)
+    first_code = [0] * (longest + 2)
+    first_index = [0] * (longest + 2)
+    count = [0] * (longest + 2)
+    for symbol in symbols:
+        count[HUFFMAN_CODE_LENGTHS[symbol]] += 1
+    code = index = 0
+    for length in range(1, longest + 1):
+        first_code[length], first_index[length] = code, index
+        code = (code + count[length]) << 1
+        index += count[length]
+    return symbols, first_code, first_index, count
+
+
+_SYMBOLS, _FIRST_CODE, _FIRST_INDEX, _COUNT = _canonical_tables()
+_SHORTEST = min(HUFFMAN_CODE_LENGTHS)
+
+
+def huffman_decode(data: bytes) -> bytes:
+    """
+    Decode a Huffman coded string literal.
+
+    Raises:
+        HpackError: If the data contains EOS or invalid padding
+    """
+    out = bytearray()
+    code = length = 0
+    for byte in data:
+        for shift in range(7, -1, -1):
+            code = (code << 1) | ((byte >> shift) & 1)
+            length += 1
+            if length < _SHORTEST:
+                continue
+            offset = code - _FIRST_CODE[length]
+            if 0 <= offset < _COUNT[length]:
+                symbol = _SYMBOLS[_FIRST_INDEX[length] + offset]
+                if symbol == HUFFMAN_EOS:
+                    raise HpackError("EOS symbol in Huffman string")
+                out.append(symbol)
+                code = length = 0
+    # Padding is the most significant bits of EOS: at most 7 bits, all ones
+    if length > 7 or code != (1 << length) - 1:
+        raise HpackError("Invalid Huffman padding")
+    return bytes(out)
+
+
+class HpackDecoder:
+    """
+    Stateful decoder for the header blocks sent by one endpoint.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_TABLE_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self.table = deque()
+
+    def decode(self, block: bytes) -> List[Tuple[str, str]]:
+        """
+        Decode one complete header block.
+
+        Returns:
+            list: (name, value) pairs in order
+
+        Raises:
+            HpackError: If the block is malformed
+        """
+        headers = []
+        pos = 0
+        while pos < len(block):
+            first = block[pos]
+            if first & 0x80:
+                # Indexed header field
+                index, pos = self._integer(block, pos, 7)
+                headers.append(self._lookup(index))
+            elif first & 0x40:
+                # Literal with incremental indexing
+                name, value, pos = self._literal(block, pos, 6)
+                headers.append((name, value))
+                self._add(name, value)
+            elif first & 0x20:
+                # Dynamic table size update
+                self.max_size, pos = self._integer(block, pos, 5)
+                self._evict()
+            else:
+                # Literal without indexing or never indexed
+                name, value, pos = self._literal(block, pos, 4)
+                headers.append((name, value))
+        return headers
+
+    def _lookup(self, index: int) -> Tuple[str, str]:
+        """Header at a combined static/dynamic table index."""
+        if 0 < index < len(STATIC_TABLE):
+            return STATIC_TABLE[index]
+        dynamic = index - len(STATIC_TABLE)
+        if 0 <= dynamic < len(self.table):
+            return self.table[dynamic]
+        raise HpackError(f"Invalid header table index {index}")
+
+    def _literal(self, block: bytes, pos: int, prefix: int):
+        """Decode a literal field whose name is indexed or literal."""
+        index, pos = self._integer(block, pos, prefix)
+        if index:
+            name = self._lookup(index)[0]
+        else:
+            name, pos = self._string(block, pos)
+        value, pos = self._string(block, pos)
+        return name, value, pos
+
+    def _add(self, name: str, value: str):
+        """Insert an entry at the front of the dynamic table."""
+        self.table.appendleft((name, value))
+        self.size += len(name) + len(value) + ENTRY_OVERHEAD
+        self._evict()
+
+    def _evict(self):
+        """Drop the oldest entries until the table fits its maximum size."""
+        while self.size > self.max_size and self.table:
+            name, value = self.table.pop()
+            self.size -= len(name) + len(value) + ENTRY_OVERHEAD
+
+    @staticmethod
+    def _integer(block: bytes, pos: int, prefix: int) -> Tuple[int, int]:
+        """Decode a prefix-coded integer."""
+        if pos >= len(block):
+            raise HpackError("Truncated integer")
+        mask = (1 << prefix) - 1
+        value = block[pos] & mask
+        pos += 1
+        if value < mask:
+            return value, pos
+        shift = 0
+        while True:
+            if pos >= len(block) or shift > 28:
+                raise HpackError("Truncated or oversized integer")
+            byte = block[pos]
+            pos += 1
+            value += (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                return value, pos
+
+    @classmethod
+    def _string(cls, block: bytes, pos: int) -> Tuple[str, int]:
+        """Decode a string literal, Huffman coded or raw."""
+        if pos >= len(block):
+            raise HpackError("Truncated string")
+        huffman = block[pos] & 0x80
+        length, pos = cls._integer(block, pos, 7)
+        if pos + length > len(block):
+            raise HpackError("Truncated string")
+        data = block[pos:pos + length]
+        if huffman:
+            data = huffman_decode(data)
+        return data.decode("latin-1"), pos + length
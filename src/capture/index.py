@@ -0,0 +1,375 @@
+"""
+Sidecar offset index of a capture, for reading a time window or a flow.
+
+The index is built by one pass that decodes only the flow columns. It
+records a checkpoint every ``interval`` records: the byte offset of the
+record (a record boundary the reader can start at), the pcapng interface
+state in effect there, and the earliest and latest timestamp between that
+checkpoint and the next. For every bidirectional flow it records the
+checkpoint segments holding its first and last packet, so a flow can be
+read from a bounding byte range.
+
+A time window then maps to a byte range by binary search over running
+extremes of the segment timestamps, which stays correct when records are
+slightly out of time order. The index is saved next to the capture (or in
+a chosen directory) as ``<capture>.idx.npz`` and rebuilt whenever the
+capture's size or mtime changes.
+"""
+import json
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .batch import PacketBatch
+from .flows import FLOW_FIELDS, FLOW_KEY_COLUMNS, FlowTable
+from .reader import NSEC_PER_SEC, PcapReader, _PcapngState
+
+# Records between two checkpoints
+DEFAULT_INDEX_INTERVAL = 4096
+
+# Suffix of the sidecar file
+INDEX_SUFFIX = ".idx.npz"
+
+# Bump when the sidecar layout changes
+INDEX_VERSION = 1
+
+# Per-flow rows collected before they are folded into the flow table
+FLOW_COMPACT_ROWS = 1 << 20
+
+# Units accepted in relative times such as "+90s"
+TIME_UNITS = {"us": 1_000, "ms": 1_000_000, "s": NSEC_PER_SEC, "m": 60 * NSEC_PER_SEC, "h": 3600 * NSEC_PER_SEC}
+
+
+class CaptureIndex:
+    """
+    Checkpoint offsets, timestamps and flow extents of one capture.
+
+    Segment ``i`` holds the records from ``offsets[i]`` up to ``offsets[i + 1]``;
+    ``ts_min[i]`` and ``ts_max[i]`` bound their timestamps. Flow ``f`` has
+    the canonical key ``flow_keys[f]`` (see FlowTable) and its packets lie
+    in segments ``flow_first[f]`` to ``flow_last[f]``.
+    """
+
+    def __init__(self, path: str, interval: int, offsets: np.ndarray, states: List[_PcapngState],
+                 ts_min: np.ndarray, ts_max: np.ndarray, flow_keys: np.ndarray, flow_stats: np.ndarray,
+                 size: int, mtime_ns: int):
+        self.path = path
+        self.interval = interval
+        self.offsets = offsets
+        self.states = states
+        self.ts_min = ts_min
+        self.ts_max = ts_max
+        self.flow_keys = flow_keys
+        # Columns: first segment, last segment, first ts, last ts, packets
+        self.flow_stats = flow_stats
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self._flow_index = None
+        # Running extremes make both ends of a window searchable
+        self._max_before = np.maximum.accumulate(ts_max) if len(ts_max) else ts_max
+        self._min_after = np.minimum.accumulate(ts_min[::-1])[::-1] if len(ts_min) else ts_min
+
+    @property
+    def segments(self) -> int:
+        """Number of checkpoint segments."""
+        return len(self.ts_min)
+
+    @property
+    def start_ns(self) -> Optional[int]:
+        """Earliest timestamp in the capture."""
+        return int(self.ts_min.min()) if self.segments else None
+
+    @property
+    def end_ns(self) -> Optional[int]:
+        """Latest timestamp in the capture."""
+        return int(self.ts_max.max()) if self.segments else None
+
+    @staticmethod
+    def sidecar_path(path: str, directory: str = None) -> str:
+        """Path of the index file of a capture, next to it unless a directory is given."""
+        if directory is None:
+            return path + INDEX_SUFFIX
+        return os.path.join(directory, os.path.basename(path) + INDEX_SUFFIX)
+
+    @classmethod
+    def build(cls, path: str, interval: int = DEFAULT_INDEX_INTERVAL) -> "CaptureIndex":
+        """
+        Index a capture with one pass over its flow columns.
+
+        Args:
+            path (str): Path to the capture file
+            interval (int, optional): Records between two checkpoints
+
+        Returns:
+            CaptureIndex: The new index
+        """
+        stat = os.stat(path)
+        offsets, states, ts_min, ts_max = [], [], [], []
+        pending, flow_keys, flow_stats = [], None, None
+        pending_rows = 0
+
+        with PcapReader(path) as reader:
+            offset, state = reader.data_offset, reader.next_state.copy()
+            for batch in reader.batches(interval, fields=FLOW_FIELDS):
+                segment = len(offsets)
+                offsets.append(offset)
+                states.append(state)
+                ts = batch["ts_ns"]
+                ts_min.append(int(ts.min()))
+                ts_max.append(int(ts.max()))
+                offset, state = reader.next_offset, reader.next_state.copy()
+
+                flows = FlowTable(batch)
+                if len(flows):
+                    times = flows.column("ts_ns")
+                    first, last = flows.offsets[:-1], flows.offsets[1:] - 1
+                    rows = np.column_stack([
+                        np.full(len(flows), segment), np.full(len(flows), segment),
+                        times[first], times[last], np.diff(flows.offsets)
+                    ]).astype(np.int64)
+                    pending.append((flows.keys, rows))
+                    pending_rows += len(rows)
+                if pending_rows >= FLOW_COMPACT_ROWS:
+                    flow_keys, flow_stats = _fold_flows(flow_keys, flow_stats, pending)
+                    pending, pending_rows = [], 0
+            offsets.append(offset)
+        flow_keys, flow_stats = _fold_flows(flow_keys, flow_stats, pending)
+
+        return cls(path, interval, np.array(offsets, dtype=np.int64), states,
+                   np.array(ts_min, dtype=np.int64), np.array(ts_max, dtype=np.int64),
+                   flow_keys, flow_stats, stat.st_size, stat.st_mtime_ns)
+
+    @classmethod
+    def load(cls, path: str, directory: str = None) -> Optional["CaptureIndex"]:
+        """
+        Load the saved index of a capture.
+
+        Returns:
+            CaptureIndex: The index, or None if it is missing, damaged or out of date
+        """
+        try:
+            stat = os.stat(path)
+            with np.load(cls.sidecar_path(path, directory), allow_pickle=False) as data:
+                meta = json.loads(str(data["meta"]))
+                if (meta.get("version") != INDEX_VERSION or meta["size"] != stat.st_size
+                        or meta["mtime_ns"] != stat.st_mtime_ns):
+                    return None
+                distinct = [_state_from_json(state) for state in meta["states"]]
+                states = [distinct[i] for i in data["state_ids"].tolist()]
+                return cls(path, meta["interval"], data["offsets"], states, data["ts_min"], data["ts_max"],
+                           data["flow_keys"], data["flow_stats"], meta["size"], meta["mtime_ns"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, directory: str = None):
+        """
+        Write the index to its sidecar file.
+
+        Raises:
+            OSError: If the file cannot be written
+        """
+        distinct, state_ids = {}, []
+        for state in self.states:
+            key = (state.endian, state.section_base, len(state.interfaces))
+            state_ids.append(distinct.setdefault(key, (len(distinct), state))[0])
+        meta = {
+            "version": INDEX_VERSION, "size": self.size, "mtime_ns": self.mtime_ns, "interval": self.interval,
+            "states": [_state_to_json(state) for _, state in sorted(distinct.values(), key=lambda item: item[0])]
+        }
+        target = self.sidecar_path(self.path, directory)
+        temporary = f"{target}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), offsets=self.offsets,
+                     state_ids=np.array(state_ids, dtype=np.int64), ts_min=self.ts_min, ts_max=self.ts_max,
+                     flow_keys=self.flow_keys, flow_stats=self.flow_stats)
+        os.replace(temporary, target)
+
+    @classmethod
+    def load_or_build(cls, path: str, interval: int = DEFAULT_INDEX_INTERVAL,
+                      directory: str = None) -> "CaptureIndex":
+        """
+        Return the saved index of a capture, building and saving it when needed.
+
+        An index that cannot be saved (e.g. a read-only directory) is still returned.
+
+        Args:
+            path (str): Path to the capture file
+            interval (int, optional): Records between two checkpoints of a new index
+            directory (str, optional): Directory of the sidecar file; defaults to the capture's
+
+        Returns:
+            CaptureIndex: The index
+        """
+        index = cls.load(path, directory)
+        if index is None:
+            index = cls.build(path, interval)
+            try:
+                index.save(directory)
+            except OSError:
+                pass
+        return index
+
+    def byte_range(self, start_ns: int = None, end_ns: int = None) -> Optional[Tuple[int, int, _PcapngState]]:
+        """
+        Smallest checkpoint-aligned byte range holding every record in [start_ns, end_ns).
+
+        Args:
+            start_ns (int, optional): Window start; defaults to the capture start
+            end_ns (int, optional): Window end (exclusive); defaults to the capture end
+
+        Returns:
+            tuple: (start, end, state) to pass to ``PcapReader.batches``, or None
+                   when no record can fall inside the window
+        """
+        window = self.window_segments(start_ns, end_ns)
+        return self._segment_range(*window) if window is not None else None
+
+    def window_segments(self, start_ns: int = None, end_ns: int = None) -> Optional[Tuple[int, int]]:
+        """First and last segment that can hold records in [start_ns, end_ns), or None."""
+        first = 0 if start_ns is None else int(np.searchsorted(self._max_before, start_ns, side="left"))
+        last = self.segments - 1 if end_ns is None else int(np.searchsorted(self._min_after, end_ns, side="left")) - 1
+        return (first, last) if first <= last else None
+
+    def sampled_segments(self, sample) -> np.ndarray:
+        """
+        Segments holding packets of the flows a flow sample keeps.
+
+        Args:
+            sample (FlowSample): The flow sample
+
+        Returns:
+            np.ndarray: Boolean mask over the segments
+        """
+        chosen = sample.key_hashes(self.flow_keys) < sample.threshold if len(self.flow_keys) \
+            else np.zeros(0, dtype=bool)
+        # +1 at each sampled flow's first segment, -1 after its last
+        edges = np.zeros(self.segments + 1, dtype=np.int64)
+        np.add.at(edges, self.flow_stats[chosen, 0], 1)
+        np.add.at(edges, self.flow_stats[chosen, 1] + 1, -1)
+        return np.cumsum(edges[:-1]) > 0
+
+    def segment_ranges(self, mask: np.ndarray) -> List[Tuple[int, int, _PcapngState]]:
+        """Byte ranges, as for ``PcapReader.batches``, of the runs of selected segments."""
+        changes = np.flatnonzero(np.diff(np.r_[0, mask.astype(np.int8), 0]))
+        return [self._segment_range(first, last) for first, last in zip(changes[::2].tolist(),
+                                                                          (changes[1::2] - 1).tolist())]
+
+    def find_flow(self, key: Tuple) -> Optional[int]:
+        """Return the id of the flow with the given canonical key, or None."""
+        if self._flow_index is None:
+            self._flow_index = {tuple(flow_key): flow for flow, flow_key in enumerate(self.flow_keys.tolist())}
+        return self._flow_index.get(tuple(key))
+
+    def flow_range(self, key: Tuple) -> Optional[Tuple[int, int, _PcapngState]]:
+        """
+        Checkpoint-aligned byte range holding every packet of a flow.
+
+        Args:
+            key (tuple): Canonical flow key, as in ``FlowTable.flow_keys``
+
+        Returns:
+            tuple: (start, end, state) to pass to ``PcapReader.batches``, or None for an unknown flow
+        """
+        flow = self.find_flow(key)
+        if flow is None:
+            return None
+        first, last = self.flow_stats[flow, :2].tolist()
+        return self._segment_range(first, last)
+
+    def _segment_range(self, first: int, last: int) -> Tuple[int, int, _PcapngState]:
+        """Byte range covering segments first to last."""
+        return int(self.offsets[first]), int(self.offsets[last + 1]), self.states[first].copy()
+
+
+def select_window(batch: PacketBatch, start_ns: int = None, end_ns: int = None) -> PacketBatch:
+    """Return the packets of a batch with start_ns <= ts < end_ns."""
+    ts = batch["ts_ns"]
+    mask = np.ones(len(batch), dtype=bool)
+    if start_ns is not None:
+        mask &= ts >= start_ns
+    if end_ns is not None:
+        mask &= ts < end_ns
+    return batch if mask.all() else batch.select(mask)
+
+
+def parse_time(text: str, origin_ns: int) -> int:
+    """
+    Parse a window bound into nanoseconds since the epoch.
+
+    Accepted forms are an offset from the capture start ("+90s", "+2.5m"),
+    epoch seconds ("1718201520.5"), a time of day on the capture's first
+    day in UTC ("14:02", "14:02:30.25") and an ISO 8601 date and time
+    (UTC unless it names a zone).
+
+    Args:
+        text (str): Time to parse
+        origin_ns (int): Timestamp of the capture start
+
+    Returns:
+        int: Nanoseconds since the epoch
+
+    Raises:
+        ValueError: If the text is not a recognized time
+    """
+    text = text.strip()
+    relative = re.fullmatch(r"\+\s*([0-9.]+)\s*(us|ms|s|m|h)?", text.lower())
+    if relative:
+        return origin_ns + int(float(relative.group(1)) * TIME_UNITS[relative.group(2) or "s"])
+    if re.fullmatch(r"[0-9]+(\.[0-9]*)?", text):
+        return int(float(text) * NSEC_PER_SEC)
+
+    clock = re.fullmatch(r"([0-9]{1,2}):([0-9]{2})(?::([0-9]{2}(?:\.[0-9]+)?))?", text)
+    if clock:
+        day = datetime.fromtimestamp(origin_ns // NSEC_PER_SEC, tz=timezone.utc).replace(
+            hour=0, minute=0, second=0, microsecond=0)
+        seconds = int(clock.group(1)) * 3600 + int(clock.group(2)) * 60 + float(clock.group(3) or 0)
+        return int(day.timestamp()) * NSEC_PER_SEC + int(seconds * NSEC_PER_SEC)
+
+    try:
+        moment = datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"Unrecognized time: {text}") from None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    since_epoch = moment - datetime(1970, 1, 1, tzinfo=timezone.utc)
+    return since_epoch // timedelta(microseconds=1) * 1000
+
+
+def _fold_flows(keys: Optional[np.ndarray], stats: Optional[np.ndarray],
+                pending: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Merge per-segment flow rows into the flow table, one row per flow key."""
+    parts = ([(keys, stats)] if keys is not None else []) + pending
+    if not parts:
+        return np.zeros((0, len(FLOW_KEY_COLUMNS)), dtype=np.uint64), np.zeros((0, 5), dtype=np.int64)
+    all_keys = np.concatenate([part[0] for part in parts])
+    all_stats = np.concatenate([part[1] for part in parts])
+    unique, inverse = np.unique(all_keys, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    merged = np.empty((len(unique), 5), dtype=np.int64)
+    merged[:, 0] = np.iinfo(np.int64).max
+    merged[:, 2] = np.iinfo(np.int64).max
+    merged[:, 1] = merged[:, 3] = np.iinfo(np.int64).min
+    np.minimum.at(merged[:, 0], inverse, all_stats[:, 0])
+    np.maximum.at(merged[:, 1], inverse, all_stats[:, 1])
+    np.minimum.at(merged[:, 2], inverse, all_stats[:, 2])
+    np.maximum.at(merged[:, 3], inverse, all_stats[:, 3])
+    merged[:, 4] = np.bincount(inverse, weights=all_stats[:, 4], minlength=len(unique)).astype(np.int64)
+    return unique, merged
+
+
+def _state_to_json(state: _PcapngState) -> dict:
+    """Serializable form of a pcapng interface state."""
+    return {"endian": state.endian, "section_base": state.section_base,
+            "interfaces": [list(interface) for interface in state.interfaces]}
+
+
+def _state_from_json(data: dict) -> _PcapngState:
+    """Rebuild a pcapng interface state saved by ``_state_to_json``."""
+    state = _PcapngState(data["endian"])
+    state.section_base = data["section_base"]
+    state.interfaces = [tuple(interface) for interface in data["interfaces"]]
+    return state
@@ -0,0 +1,251 @@
+"""
+Timestamp-ordered merge of several captures.
+
+Deployments often capture each interface (N2, N3, N4) on its own tap, so
+correlating them needs the captures read as one packet stream in
+timestamp order. MergedReader does this as a streaming k-way merge: every
+input keeps one reader, with its own mapped file or decompression window,
+and at most one pending batch. A heap orders the inputs by the latest
+timestamp of their pending batch; the top of the heap is the horizon up to
+which no input can still produce an earlier packet, so every pending
+packet at or before it is emitted in timestamp order and every input
+left without pending packets, at least the one at the top, is refilled.
+Nothing is concatenated on disk.
+
+Tap clocks rarely agree, so each input can be shifted by a clock offset
+before merging.
+"""
+import heapq
+import itertools
+import re
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .batch import PacketBatch
+from .filters import PacketFilter
+from .index import TIME_UNITS, select_window
+from .metrics import collect_results, create_accumulators, required_fields, update_accumulators
+from .reader import PcapReader
+
+# Column added to merged batches: index of the input each packet came from
+CAPTURE_COLUMN = "capture"
+CAPTURE_DTYPE = np.uint16
+
+
+class MergedReader:
+    """
+    Read several captures as one stream of packet batches in timestamp order.
+
+    Packets with equal timestamps keep the order of the inputs. Each input
+    is assumed to be in timestamp order itself, as captures written by a
+    single tap are; a packet that is out of order within its own capture
+    is emitted late rather than reordered.
+
+    Merged batches carry a ``capture`` column with the index of the input
+    each packet came from. When payload columns are read, the captured
+    bytes of the emitted packets are gathered into one buffer per merged
+    batch and the offset columns rebased into it, so payload decoders work
+    unchanged.
+    """
+
+    def __init__(self, paths: Sequence[str], clock_offsets_ns: Optional[Sequence[int]] = None):
+        """
+        Open every input capture.
+
+        Args:
+            paths (list): Capture files to merge, plain or compressed
+            clock_offsets_ns (list, optional): Nanoseconds added to the timestamps
+                                               of each input, in the order of paths
+
+        Raises:
+            ValueError: If no paths are given or the offsets do not match them
+            CaptureFormatError: If a file is not a pcap or pcapng capture
+        """
+        if not paths:
+            raise ValueError("No captures to merge")
+        if clock_offsets_ns is not None and len(clock_offsets_ns) != len(paths):
+            raise ValueError(f"Got {len(clock_offsets_ns)} clock offsets for {len(paths)} captures")
+        self.paths = list(paths)
+        self.clock_offsets_ns = [int(offset) for offset in clock_offsets_ns or [0] * len(paths)]
+        self.readers: List[PcapReader] = []
+        try:
+            for path in self.paths:
+                self.readers.append(PcapReader(path))
+        except Exception:
+            self.close()
+            raise
+
+    def batches(self, batch_size: int = 65536, fields=None,
+                packet_filter: PacketFilter = None) -> Iterator[PacketBatch]:
+        """
+        Iterate over the merged captures as timestamp-ordered packet batches.
+
+        A merged batch holds the packets of all inputs up to the current
+        horizon, so it may exceed batch_size when several inputs overlap.
+
+        Args:
+            batch_size (int, optional): Packets read per input batch
+            fields (iterable, optional): Columns the caller needs; defaults to all
+            packet_filter (PacketFilter, optional): Drop packets that do not match
+                                                    before they are merged
+
+        Yields:
+            PacketBatch: Batch of packets from every input, in timestamp order
+        """
+        gather = fields is None or "payload_offset" in fields
+        streams = [reader.batches(batch_size, reuse=False, fields=fields, packet_filter=packet_filter)
+                   for reader in self.readers]
+        # source -> its pending batch, and the refill that batch came from
+        pending: Dict[int, PacketBatch] = {}
+        refills: Dict[int, int] = {}
+        # (latest pending timestamp, source, refill); entries of drained batches go stale
+        heap: List[Tuple[int, int, int]] = []
+        serial = itertools.count()
+        for source in range(len(streams)):
+            self._refill(source, streams, pending, refills, heap, serial)
+
+        while heap:
+            horizon, source, refill = heap[0]
+            if refills.get(source) != refill:
+                heapq.heappop(heap)
+                continue
+            parts, drained = [], []
+            for other in sorted(pending):
+                batch = pending[other]
+                due = batch["ts_ns"] <= horizon
+                if due.all():
+                    parts.append((other, batch))
+                    drained.append(other)
+                elif due.any():
+                    parts.append((other, batch.select(due)))
+                    pending[other] = batch.select(~due)
+            if parts:
+                yield _interleave(parts, gather)
+            # Inputs tied with the top of the heap may have been drained with it
+            for other in drained:
+                del pending[other], refills[other]
+                self._refill(other, streams, pending, refills, heap, serial)
+
+    def _refill(self, source: int, streams: List[Iterator[PacketBatch]], pending: Dict[int, PacketBatch],
+                refills: Dict[int, int], heap: List[Tuple[int, int, int]], serial: Iterator[int]):
+        """Read the next non-empty batch of an input, if any, and push it on the heap."""
+        for batch in streams[source]:
+            if not len(batch):
+                continue
+            if self.clock_offsets_ns[source]:
+                batch.raw("ts_ns")[:len(batch)] += self.clock_offsets_ns[source]
+            pending[source], refills[source] = batch, next(serial)
+            heapq.heappush(heap, (int(batch["ts_ns"].max()), source, refills[source]))
+            return
+
+    def close(self):
+        """Close every input reader."""
+        for reader in self.readers:
+            reader.close()
+        self.readers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _interleave(parts: List[Tuple[int, PacketBatch]], gather: bool) -> PacketBatch:
+    """
+    Merge the due packets of several inputs into one batch sorted by timestamp.
+
+    Args:
+        parts (list): (input index, non-empty batch) pairs in input order
+        gather (bool): Copy the captured bytes into a buffer of the merged batch
+
+    Returns:
+        PacketBatch: The merged batch
+    """
+    dtypes = dict(parts[0][1].dtypes, **{CAPTURE_COLUMN: CAPTURE_DTYPE})
+    columns = {name: np.concatenate([batch[name] for _, batch in parts]) for name in parts[0][1].columns}
+    columns[CAPTURE_COLUMN] = np.concatenate([np.full(len(batch), source, dtype=CAPTURE_DTYPE)
+                                              for source, batch in parts])
+
+    buffer = None
+    if gather:
+        # Lay out the captured records of every part back to back and shift
+        # the offset columns by how far each record moved
+        chunks, shifts, base = [], [], 0
+        for _, batch in parts:
+            offsets = batch["data_offset"]
+            caplen = batch["caplen"].astype(np.int64)
+            starts = base + np.cumsum(caplen) - caplen
+            chunks.append(_gather(batch.buffer, offsets, caplen))
+            shifts.append(starts - offsets)
+            base += int(caplen.sum())
+        buffer = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.uint8)
+        shift = np.concatenate(shifts)
+        columns["data_offset"] = columns["data_offset"] + shift
+        columns["payload_offset"] = columns["payload_offset"] + shift
+
+    order = np.argsort(columns["ts_ns"], kind="stable")
+    merged = PacketBatch.from_columns({name: column[order] for name, column in columns.items()}, dtypes)
+    merged.buffer = buffer
+    return merged
+
+
+def _gather(raw: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Copy the byte ranges [start, start + length) of a buffer back to back."""
+    total = int(lengths.sum())
+    if raw is None or total == 0:
+        return np.zeros(total, dtype=np.uint8)
+    # Position of every output byte in the source buffer
+    run_starts = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return raw[run_starts + np.arange(total)]
+
+
+def parse_clock_offset(text: str) -> int:
+    """
+    Parse a signed clock offset ("+1.5ms", "-200us", "0.25") into nanoseconds.
+
+    A number without a unit is in seconds.
+
+    Raises:
+        ValueError: If the text is not a recognized offset
+    """
+    offset = re.fullmatch(r"([+-]?)\s*([0-9]*\.?[0-9]+)\s*(us|ms|s|m|h)?", text.strip().lower())
+    if not offset:
+        raise ValueError(f"Unrecognized clock offset: {text}")
+    value = int(float(offset.group(2)) * TIME_UNITS[offset.group(3) or "s"])
+    return -value if offset.group(1) == "-" else value
+
+
+def analyze_merged(paths: Sequence[str], metric_names: List[str], options: Dict[str, Dict] = None,
+                   batch_size: int = 65536, packet_filter: PacketFilter = None,
+                   clock_offsets_ns: Optional[Sequence[int]] = None,
+                   time_range: Optional[Tuple[Optional[int], Optional[int]]] = None) -> Dict[str, Dict]:
+    """
+    Compute metric results over several captures merged into one stream.
+
+    Flows, procedures and sessions seen on more than one input are tracked
+    across them, which separate per-capture runs cannot do. The merged
+    stream is never cached, as it has no single capture to key it by.
+
+    Args:
+        paths (list): Capture files to merge
+        metric_names (list): Requested metric names
+        options (dict, optional): Metric name -> accumulator keyword arguments
+        batch_size (int, optional): Packets read per input batch
+        packet_filter (PacketFilter, optional): Only analyze matching packets
+        clock_offsets_ns (list, optional): Nanoseconds added to each input's timestamps
+        time_range (tuple, optional): (start_ns, end_ns) window on the merged,
+                                      offset-corrected timestamps
+
+    Returns:
+        dict: Metric results keyed by result name
+    """
+    accumulators = create_accumulators(metric_names, options, packet_filter)
+    fields = required_fields(accumulators, packet_filter)
+    with MergedReader(paths, clock_offsets_ns) as reader:
+        for batch in reader.batches(batch_size, fields=fields, packet_filter=packet_filter):
+            if time_range is not None:
+                batch = select_window(batch, *time_range)
+            update_accumulators(accumulators, batch)
+    return collect_results(accumulators)
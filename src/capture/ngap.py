@@ -0,0 +1,439 @@
+"""
+SCTP chunk walker and minimal NGAP header decoder.
+
+NGAP (N2, between gNB and AMF) runs over SCTP and is encoded in ASN.1
+aligned PER. Only the outer layers are decoded here, for a whole batch at
+once: the NGAP-PDU choice (message type), the procedure code, and the
+AMF-UE-NGAP-ID and RAN-UE-NGAP-ID information elements. No generic ASN.1
+machinery is involved, so control-plane captures can be indexed as fast
+as they are read.
+
+One SCTP packet may bundle several DATA chunks, so decoded messages are
+returned as their own columnar table with one row per NGAP message.
+"""
+from typing import Dict, List, Union
+
+import numpy as np
+
+from .batch import PacketBatch, PROTO_SCTP
+from .reader import NGAP_SCTP_PORT, _be16, _be32, _take
+from .sketch import QuantileSketch, distribution
+
+# SCTP chunk types and DATA chunk flags
+SCTP_CHUNK_DATA = 0
+SCTP_FLAG_END = 0x01
+SCTP_FLAG_BEGIN = 0x02
+
+# SCTP payload protocol identifier registered for NGAP
+NGAP_PPID = 60
+
+# Chunks examined per SCTP packet and IEs examined per NGAP message
+MAX_SCTP_CHUNKS = 16
+MAX_NGAP_IES = 8
+
+# NGAP-PDU choice index -> message type
+MESSAGE_TYPES = ("initiatingMessage", "successfulOutcome", "unsuccessfulOutcome")
+INITIATING_MESSAGE = 0
+SUCCESSFUL_OUTCOME = 1
+UNSUCCESSFUL_OUTCOME = 2
+
+# Protocol IE ids (TS 38.413)
+IE_AMF_UE_NGAP_ID = 10
+IE_RAN_UE_NGAP_ID = 85
+
+# Procedure codes (TS 38.413 section 9.4.7)
+NGAP_PROCEDURES = {
+    0: "AMFConfigurationUpdate", 1: "AMFStatusIndication", 2: "CellTrafficTrace",
+    3: "DeactivateTrace", 4: "DownlinkNASTransport", 5: "DownlinkNonUEAssociatedNRPPaTransport",
+    6: "DownlinkRANConfigurationTransfer", 7: "DownlinkRANStatusTransfer",
+    8: "DownlinkUEAssociatedNRPPaTransport", 9: "ErrorIndication", 10: "HandoverCancel",
+    11: "HandoverNotification", 12: "HandoverPreparation", 13: "HandoverResourceAllocation",
+    14: "InitialContextSetup", 15: "InitialUEMessage", 16: "LocationReportingControl",
+    17: "LocationReportingFailureIndication", 18: "LocationReport", 19: "NASNonDeliveryIndication",
+    20: "NGReset", 21: "NGSetup", 22: "OverloadStart", 23: "OverloadStop", 24: "Paging",
+    25: "PathSwitchRequest", 26: "PDUSessionResourceModify", 27: "PDUSessionResourceModifyIndication",
+    28: "PDUSessionResourceRelease", 29: "PDUSessionResourceSetup", 30: "PDUSessionResourceNotify",
+    31: "PrivateMessage", 32: "PWSCancel", 33: "PWSFailureIndication", 34: "PWSRestartIndication",
+    35: "RANConfigurationUpdate", 36: "RerouteNASRequest", 37: "RRCInactiveTransitionReport",
+    38: "TraceFailureIndication", 39: "TraceStart", 40: "UEContextModification",
+    41: "UEContextRelease", 42: "UEContextReleaseRequest", 43: "UERadioCapabilityCheck",
+    44: "UERadioCapabilityInfoIndication", 45: "UETNLABindingRelease", 46: "UplinkNASTransport",
+    47: "UplinkNonUEAssociatedNRPPaTransport", 48: "UplinkRANConfigurationTransfer",
+    49: "UplinkRANStatusTransfer", 50: "UplinkUEAssociatedNRPPaTransport", 51: "WriteReplaceWarning",
+    52: "SecondaryRATDataUsageReport"
+}
+
+# Class 1 procedures, the ones answered by a successful or unsuccessful outcome
+CLASS1_PROCEDURES = frozenset((0, 10, 12, 13, 14, 20, 21, 25, 26, 27, 28, 29, 32, 35, 40, 41, 43, 51))
+
+# Columns of the NGAP message table; missing UE ids are -1
+NGAP_COLUMNS = {
+    "ts_ns": np.int64,
+    "packet": np.int64,
+    "src_hi": np.uint64,
+    "src_lo": np.uint64,
+    "dst_hi": np.uint64,
+    "dst_lo": np.uint64,
+    "stream": np.uint16,
+    "message_type": np.uint8,
+    "procedure_code": np.uint8,
+    "amf_ue_id": np.int64,
+    "ran_ue_id": np.int64
+}
+
+NSEC_PER_SEC = 1_000_000_000
+NSEC_PER_MSEC = 1_000_000
+
+# Procedures without an outcome this long are given up
+PROCEDURE_TIMEOUT_NS = 30 * NSEC_PER_SEC
+
+# Packet columns read by the decoders
+NGAP_FIELDS = ("ts_ns", "protocol", "src_hi", "src_lo", "dst_hi", "dst_lo", "src_port", "dst_port",
+               "payload_offset", "payload_len", "data_offset", "caplen")
+
+
+def procedure_name(code: int) -> str:
+    """Name of an NGAP procedure code."""
+    return NGAP_PROCEDURES.get(code, f"procedure_{code}")
+
+
+def sctp_data_chunks(raw: np.ndarray, batch: PacketBatch) -> Dict[str, np.ndarray]:
+    """
+    Walk the chunks of every SCTP packet in a batch and return its DATA chunks.
+
+    All packets are advanced one chunk per step, so the loop runs once per
+    chunk position rather than once per packet.
+
+    Returns:
+        dict: Arrays with one entry per DATA chunk, in capture order: packet
+              (row), flags, stream, ppid, data (offset of the user data) and length
+    """
+    rows = np.flatnonzero(batch["protocol"] == PROTO_SCTP)
+    end = np.minimum(batch["payload_offset"][rows] + batch["payload_len"][rows],
+                     batch["data_offset"][rows] + batch["caplen"][rows])
+    pos = batch["payload_offset"][rows].copy()
+    active = pos + 4 <= end
+    found = {"packet": [], "flags": [], "stream": [], "ppid": [], "data": [], "length": []}
+
+    for _ in range(MAX_SCTP_CHUNKS):
+        current = np.flatnonzero(active)
+        if not current.size:
+            break
+        start = pos[current]
+        header = _take(raw, start, 16)
+        length = _be16(header, 2)
+        valid = (length >= 4) & (start + length <= end[current])
+
+        data = valid & (header[:, 0] == SCTP_CHUNK_DATA) & (length >= 16)
+        found["packet"].append(rows[current[data]])
+        found["flags"].append(header[data, 1])
+        found["stream"].append(_be16(header, 8)[data])
+        found["ppid"].append(_be32(header, 12)[data])
+        found["data"].append(start[data] + 16)
+        found["length"].append(length[data] - 16)
+
+        # Chunks are padded to a multiple of four bytes
+        pos[current] = start + ((length + 3) & ~3)
+        active[current] = valid & (pos[current] + 4 <= end[current])
+
+    empty = {"packet": np.int64, "flags": np.uint8, "stream": np.int64, "ppid": np.int64,
+             "data": np.int64, "length": np.int64}
+    chunks = {name: np.concatenate(parts) if parts else np.zeros(0, dtype=empty[name])
+              for name, parts in found.items()}
+
+    # Back to capture order: by packet, then position within the packet
+    order = np.argsort(chunks["packet"], kind="stable")
+    return {name: column[order] for name, column in chunks.items()}
+
+
+def _byte(raw: np.ndarray, pos: np.ndarray) -> np.ndarray:
+    """
+    Byte at each position, as int64.
+
+    Unlike a wide gather, a position past the end of the buffer only
+    garbles its own byte, so fields ending flush with the capture decode.
+    """
+    return _take(raw, pos, 1)[:, 0].astype(np.int64)
+
+
+def _length_determinant(raw: np.ndarray, pos: np.ndarray):
+    """
+    Decode aligned PER length determinants (short and long forms).
+
+    Returns:
+        tuple: (length, size of the determinant in bytes)
+    """
+    first, second = _byte(raw, pos), _byte(raw, pos + 1)
+    long_form = (first & 0xC0) == 0x80
+    length = np.where(long_form, ((first & 0x3F) << 8) | second, first)
+    return length, np.where(long_form, 2, 1)
+
+
+def _ue_id(raw: np.ndarray, content: np.ndarray, length_bits: int) -> np.ndarray:
+    """
+    Decode a constrained INTEGER whose range needs more than two octets.
+
+    Aligned PER puts the octet count minus one in the top length_bits bits
+    of the first byte, followed by the value as big-endian octets.
+    """
+    octets = (_byte(raw, content) >> (8 - length_bits)) + 1
+    value = np.zeros(len(content), dtype=np.int64)
+    for i in range(5):
+        value = np.where(i < octets, (value << 8) | _byte(raw, content + 1 + i), value)
+    return value
+
+
+def decode_ngap(batch: PacketBatch, raw: np.ndarray = None) -> PacketBatch:
+    """
+    Decode the NGAP messages carried in a batch.
+
+    A DATA chunk is taken as NGAP when its payload protocol identifier is
+    60, or 0 on the NGAP SCTP port. Only a message's first fragment is
+    decoded; everything needed sits in its first few bytes.
+
+    Args:
+        batch (PacketBatch): Decoded packets
+        raw (np.ndarray, optional): Capture buffer. Defaults to ``batch.buffer``.
+
+    Returns:
+        PacketBatch: Message table with NGAP_COLUMNS, one row per message
+    """
+    raw = batch.buffer if raw is None else raw
+    chunks = sctp_data_chunks(raw, batch)
+    packet = chunks["packet"]
+    on_port = (batch["src_port"][packet] == NGAP_SCTP_PORT) | (batch["dst_port"][packet] == NGAP_SCTP_PORT)
+    ngap = (((chunks["ppid"] == NGAP_PPID) | ((chunks["ppid"] == 0) & on_port))
+            & ((chunks["flags"] & SCTP_FLAG_BEGIN) != 0) & (chunks["length"] >= 4))
+    packet, data, end = packet[ngap], chunks["data"][ngap], chunks["data"][ngap] + chunks["length"][ngap]
+    stream = chunks["stream"][ngap]
+
+    # NGAP-PDU: choice index (extension bit clear), procedureCode, criticality, open type length
+    header = _take(raw, data, 3)
+    message_type = (header[:, 0] >> 5) & 0x03
+    valid = ((header[:, 0] & 0x80) == 0) & (message_type <= UNSUCCESSFUL_OUTCOME)
+    length, size = _length_determinant(raw, data + 3)
+    value = data + 3 + size
+
+    # Message value: SEQUENCE preamble, then the ProtocolIE-Container count
+    ie_count = _be16(_take(raw, value + 1, 2), 0)
+    pos = value + 3
+    amf_ue_id = np.full(len(data), -1, dtype=np.int64)
+    ran_ue_id = np.full(len(data), -1, dtype=np.int64)
+    active = valid & (pos + 4 <= end)
+
+    for i in range(MAX_NGAP_IES):
+        current = np.flatnonzero(active & (i < ie_count))
+        if not current.size:
+            break
+        start = pos[current]
+        ie_id = _be16(_take(raw, start, 2), 0)
+        ie_length, ie_size = _length_determinant(raw, start + 3)
+        content = start + 3 + ie_size
+
+        is_amf = (ie_id == IE_AMF_UE_NGAP_ID) & (content + 2 <= end[current])
+        amf_ue_id[current[is_amf]] = _ue_id(raw, content[is_amf], 3)
+        is_ran = (ie_id == IE_RAN_UE_NGAP_ID) & (content + 2 <= end[current])
+        ran_ue_id[current[is_ran]] = _ue_id(raw, content[is_ran], 2)
+
+        pos[current] = content + ie_length
+        done = (amf_ue_id[current] >= 0) & (ran_ue_id[current] >= 0)
+        active[current] = ~done & (pos[current] + 4 <= end[current])
+
+    packet, keep = packet[valid], valid
+    return PacketBatch.from_columns({
+        "ts_ns": batch["ts_ns"][packet],
+        "packet": packet,
+        "src_hi": batch["src_hi"][packet],
+        "src_lo": batch["src_lo"][packet],
+        "dst_hi": batch["dst_hi"][packet],
+        "dst_lo": batch["dst_lo"][packet],
+        "stream": stream[keep],
+        "message_type": message_type[keep],
+        "procedure_code": header[keep, 1],
+        "amf_ue_id": amf_ue_id[keep],
+        "ran_ue_id": ran_ue_id[keep]
+    }, NGAP_COLUMNS)
+
+
+class NgapAccumulator:
+    """
+    NGAP message counts per procedure and message type, plus UE counts.
+    """
+
+    fields = NGAP_FIELDS
+
+    def __init__(self):
+        self.messages = 0
+        self.procedures: Dict[int, list] = {}
+        self.amf_ue_ids = set()
+        self.ran_ue_ids = set()
+
+    def update(self, batch: PacketBatch):
+        """Consume a batch of packets."""
+        if not len(batch) or batch.buffer is None:
+            return
+        messages = decode_ngap(batch)
+        if not len(messages):
+            return
+        self.messages += len(messages)
+
+        index = messages["procedure_code"].astype(np.int64) * 3 + messages["message_type"]
+        counts = np.bincount(index, minlength=256 * 3).reshape(256, 3)
+        for code in np.flatnonzero(counts.sum(axis=1)).tolist():
+            totals = self.procedures.setdefault(code, [0, 0, 0])
+            for message_type in range(3):
+                totals[message_type] += int(counts[code, message_type])
+
+        self.amf_ue_ids.update(np.unique(messages["amf_ue_id"][messages["amf_ue_id"] >= 0]).tolist())
+        self.ran_ue_ids.update(np.unique(messages["ran_ue_id"][messages["ran_ue_id"] >= 0]).tolist())
+
+    def merge(self, later: "NgapAccumulator"):
+        """Add the later part's message counts and UE ids."""
+        self.messages += later.messages
+        for code, counts in later.procedures.items():
+            totals = self.procedures.setdefault(code, [0, 0, 0])
+            for message_type in range(3):
+                totals[message_type] += counts[message_type]
+        self.amf_ue_ids.update(later.amf_ue_ids)
+        self.ran_ue_ids.update(later.ran_ue_ids)
+
+    def result(self) -> Dict[str, Union[int, Dict]]:
+        """Return NGAP message statistics."""
+        return {
+            "messages": self.messages,
+            "ue_contexts": {"amf_ue_ngap_ids": len(self.amf_ue_ids), "ran_ue_ngap_ids": len(self.ran_ue_ids)},
+            "procedures": {
+                procedure_name(code): dict(zip(MESSAGE_TYPES, counts))
+                for code, counts in sorted(self.procedures.items())
+            }
+        }
+
+
+class ProcedureLatencyAccumulator:
+    """
+    NGAP procedure latency from request/outcome pairing.
+
+    Each initiating message of a class 1 procedure is indexed under
+    (association, AMF-UE-NGAP-ID, RAN-UE-NGAP-ID, procedureCode) in a hash
+    table; the next successful or unsuccessful outcome with the same key
+    closes it. The association (the unordered pair of SCTP endpoint
+    addresses) keeps UE ids reused by different gNBs apart and pairs
+    non-UE-associated procedures such as NGSetup. A repeated request
+    replaces the outstanding one, so latency is measured from the last
+    attempt. Requests without an outcome after PROCEDURE_TIMEOUT_NS are
+    given up and counted as unanswered.
+
+    Outcomes whose request may lie in an earlier part of the capture, those
+    within PROCEDURE_TIMEOUT_NS of the part's start, are kept as orphans
+    and paired when the parts are merged.
+    """
+
+    fields = NGAP_FIELDS
+
+    def __init__(self):
+        # key -> request timestamp
+        self.pending: Dict[tuple, int] = {}
+        # outcomes not preceded by their request: (key, ts, message_type)
+        self.orphans: List[tuple] = []
+        # procedure code -> [latency sketch (ms), unsuccessful outcomes]
+        self.latencies: Dict[int, list] = {}
+        # procedure code -> requests given up, outcomes never paired
+        self.expired: Dict[int, int] = {}
+        self.unmatched: Dict[int, int] = {}
+        self.first_ts = None
+        self.last_ts = None
+
+    def update(self, batch: PacketBatch):
+        """Consume a batch of packets."""
+        if not len(batch) or batch.buffer is None:
+            return
+        messages = decode_ngap(batch)
+        messages = messages.select(np.isin(messages["procedure_code"], list(CLASS1_PROCEDURES)))
+        if not len(messages):
+            return
+        if self.first_ts is None:
+            self.first_ts = int(messages["ts_ns"].min())
+        self.last_ts = max(self.last_ts or 0, int(messages["ts_ns"].max()))
+
+        src = zip(messages["src_hi"].tolist(), messages["src_lo"].tolist())
+        dst = zip(messages["dst_hi"].tolist(), messages["dst_lo"].tolist())
+        columns = zip(src, dst, messages["amf_ue_id"].tolist(), messages["ran_ue_id"].tolist(),
+                      messages["procedure_code"].tolist(), messages["message_type"].tolist(),
+                      messages["ts_ns"].tolist())
+        for a, b, amf_ue_id, ran_ue_id, code, message_type, ts in columns:
+            key = (min(a, b), max(a, b), amf_ue_id, ran_ue_id, code)
+            if message_type == INITIATING_MESSAGE:
+                self.pending[key] = ts
+            else:
+                self._outcome(key, ts, message_type)
+        self._expire(self.last_ts)
+
+    def _outcome(self, key: tuple, ts: int, message_type: int):
+        """Pair an outcome with its pending request, or keep it as an orphan."""
+        code = key[-1]
+        requested = self.pending.pop(key, None)
+        if requested is not None and 0 <= ts - requested <= PROCEDURE_TIMEOUT_NS:
+            self._add(code, message_type, ts - requested)
+            return
+        if requested is not None:
+            self.expired[code] = self.expired.get(code, 0) + 1
+        if self.first_ts is None or ts - self.first_ts <= PROCEDURE_TIMEOUT_NS:
+            # Its request may lie in an earlier part of the capture
+            self.orphans.append((key, ts, message_type))
+        else:
+            self.unmatched[code] = self.unmatched.get(code, 0) + 1
+
+    def _expire(self, now: int):
+        """Give up requests older than the timeout."""
+        for key in [k for k, ts in self.pending.items() if now - ts > PROCEDURE_TIMEOUT_NS]:
+            del self.pending[key]
+            self.expired[key[-1]] = self.expired.get(key[-1], 0) + 1
+
+    def _add(self, code: int, message_type: int, latency_ns: int):
+        """Record one completed procedure."""
+        outcomes = self.latencies.setdefault(code, [QuantileSketch(), 0])
+        outcomes[0].add_value(latency_ns / NSEC_PER_MSEC)
+        outcomes[1] += message_type != SUCCESSFUL_OUTCOME
+
+    def merge(self, later: "ProcedureLatencyAccumulator"):
+        """Pair the later part's orphan outcomes with our open requests."""
+        for orphan in later.orphans:
+            self._outcome(*orphan)
+        for code, (sketch, failures) in later.latencies.items():
+            outcomes = self.latencies.setdefault(code, [QuantileSketch(), 0])
+            outcomes[0].merge(sketch)
+            outcomes[1] += failures
+        for counts, later_counts in ((self.expired, later.expired), (self.unmatched, later.unmatched)):
+            for code, count in later_counts.items():
+                counts[code] = counts.get(code, 0) + count
+        self.pending.update(later.pending)
+        if later.last_ts is not None:
+            self.first_ts = later.first_ts if self.first_ts is None else self.first_ts
+            self.last_ts = max(self.last_ts or 0, later.last_ts)
+            self._expire(self.last_ts)
+
+    def result(self) -> Dict[str, Union[int, Dict]]:
+        """Return per-procedure latency distributions and failure counts."""
+        unanswered = dict(self.expired)
+        for key in self.pending:
+            unanswered[key[-1]] = unanswered.get(key[-1], 0) + 1
+        unmatched = dict(self.unmatched)
+        for key, _, _ in self.orphans:
+            unmatched[key[-1]] = unmatched.get(key[-1], 0) + 1
+
+        procedures = {}
+        for code in sorted(set(self.latencies) | set(unanswered) | set(unmatched)):
+            sketch, failures = self.latencies.get(code, [QuantileSketch(), 0])
+            procedures[procedure_name(code)] = {
+                "completed": sketch.count,
+                "failures": failures,
+                "unanswered": unanswered.get(code, 0),
+                "unmatched_outcomes": unmatched.get(code, 0),
+                "latency_ms": distribution(sketch)
+            }
+        return {
+            "completed": sum(entry["completed"] for entry in procedures.values()),
+            "failures": sum(entry["failures"] for entry in procedures.values()),
+            "procedures": procedures
+        }
+
@@ -0,0 +1,110 @@
+"""
+Multi-process analysis of a single large capture.
+
+The capture is split into byte ranges on record boundaries by a header
+pre-scan. Each range is decoded by a worker process into its own set of
+metric accumulators, and the partial states are merged in file order.
+Accumulators marked ``sequential`` carry state that cannot be rebuilt in
+the middle of a capture; they run over the whole capture as one extra task.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+from .filters import PacketFilter
+from .metrics import ACCUMULATORS, create_accumulators, merge_accumulators, required_fields, update_accumulators
+from .reader import PcapReader
+
+# More ranges than workers keeps the pool busy when ranges decode unevenly
+RANGES_PER_WORKER = 4
+
+# Accumulators created for every run rather than per requested metric
+CAPTURE_KEYS = ("capture_stats", "sampling")
+
+
+def default_workers() -> int:
+    """Number of worker processes to use when none is configured."""
+    return os.cpu_count() or 1
+
+
+def analyze_range(path: str, byte_range: Tuple, metric_names: List[str], batch_size: int,
+                  options: Dict[str, Dict] = None, packet_filter: PacketFilter = None) -> Dict[str, object]:
+    """
+    Decode one byte range of a capture into fresh accumulators.
+
+    Args:
+        path (str): Path to the capture file
+        byte_range (tuple): (start, end, state) as returned by PcapReader.split
+        metric_names (list): Requested metric names
+        batch_size (int): Packets per batch
+        options (dict, optional): Metric name -> accumulator keyword arguments
+        packet_filter (PacketFilter, optional): Only analyze matching packets
+
+    Returns:
+        dict: Accumulators keyed by result name
+    """
+    start, end, state = byte_range
+    accumulators = create_accumulators(metric_names, options, packet_filter)
+    fields = required_fields(accumulators, packet_filter)
+    with PcapReader(path) as reader:
+        for batch in reader.batches(batch_size, start=start, end=end, state=state,
+                                    fields=fields, packet_filter=packet_filter):
+            update_accumulators(accumulators, batch)
+    return accumulators
+
+
+def analyze_parallel(path: str, metric_names: List[str], workers: int = None,
+                     batch_size: int = 65536, options: Dict[str, Dict] = None,
+                     packet_filter: PacketFilter = None) -> Dict[str, object]:
+    """
+    Analyze a capture on a pool of worker processes.
+
+    Args:
+        path (str): Path to the capture file
+        metric_names (list): Requested metric names
+        workers (int, optional): Number of worker processes. Defaults to the CPU count.
+        batch_size (int, optional): Packets per batch
+        options (dict, optional): Metric name -> accumulator keyword arguments
+        packet_filter (PacketFilter, optional): Only analyze matching packets
+
+    Returns:
+        dict: Merged accumulators keyed by result name
+    """
+    workers = workers or default_workers()
+    with PcapReader(path) as reader:
+        ranges = reader.split(workers * RANGES_PER_WORKER)
+    whole = (None, None, None)
+    sequential = [name for name in metric_names if getattr(ACCUMULATORS.get(name, (None, None))[1], "sequential", False)]
+    split = [name for name in metric_names if name not in sequential]
+
+    if workers == 1 or len(ranges) == 1:
+        merged = merge_accumulators([analyze_range(path, byte_range, split, batch_size, options, packet_filter)
+                                     for byte_range in ranges])
+        if sequential:
+            merged = _combine(metric_names, merged,
+                              analyze_range(path, whole, sequential, batch_size, options, packet_filter))
+        return merged
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        whole_future = pool.submit(analyze_range, path, whole, sequential, batch_size, options, packet_filter) \
+            if sequential else None
+        futures = [pool.submit(analyze_range, path, byte_range, split, batch_size, options, packet_filter)
+                   for byte_range in ranges]
+        merged = merge_accumulators([future.result() for future in futures])
+        if whole_future is not None:
+            merged = _combine(metric_names, merged, whole_future.result())
+        return merged
+
+
+def _combine(metric_names: List[str], split: Dict[str, object], whole: Dict[str, object]) -> Dict[str, object]:
+    """
+    Join the accumulators of the split ranges with those of the whole-capture task.
+
+    Capture-level counters and sample totals come from the split ranges;
+    keys keep the order a sequential run would give them.
+    """
+    for key in CAPTURE_KEYS:
+        whole.pop(key, None)
+    joined = dict(split, **whole)
+    order = [ACCUMULATORS[name][0] for name in metric_names if name in ACCUMULATORS] + list(CAPTURE_KEYS)
+    return {key: joined[key] for key in order if key in joined}
@@ -0,0 +1,416 @@
+"""
+PFCP (N4) decoder and request/response matcher.
+
+PFCP runs over UDP port 8805 between the SMF and the UPF. The header
+(message type, optional SEID and 24-bit sequence number) and the few IEs
+needed for session bookkeeping (Cause and F-SEID) are decoded for a whole
+batch at once. Requests are then matched to responses on the sequence
+number, which a response echoes, within the pair of nodes involved.
+
+Every session message sent to the SMF carries the SMF's (CP) SEID in its
+header, so session lifecycles are keyed by CP SEID without tracking the
+UPF's SEID allocation.
+"""
+from typing import Dict, List, Union
+
+import numpy as np
+
+from .batch import PacketBatch, PROTO_UDP
+from .reader import _be16, _be32, _be64, _take
+from .sketch import QuantileSketch, distribution
+
+# Well-known UDP port for PFCP
+PFCP_PORT = 8805
+
+# PFCP header fields
+PFCP_VERSION = 1
+PFCP_FLAG_SEID = 0x01
+
+# Message types (TS 29.244 section 7.3)
+PFCP_MESSAGES = {
+    1: "HeartbeatRequest", 2: "HeartbeatResponse",
+    3: "PFDManagementRequest", 4: "PFDManagementResponse",
+    5: "AssociationSetupRequest", 6: "AssociationSetupResponse",
+    7: "AssociationUpdateRequest", 8: "AssociationUpdateResponse",
+    9: "AssociationReleaseRequest", 10: "AssociationReleaseResponse",
+    12: "NodeReportRequest", 13: "NodeReportResponse",
+    14: "SessionSetDeletionRequest", 15: "SessionSetDeletionResponse",
+    50: "SessionEstablishmentRequest", 51: "SessionEstablishmentResponse",
+    52: "SessionModificationRequest", 53: "SessionModificationResponse",
+    54: "SessionDeletionRequest", 55: "SessionDeletionResponse",
+    56: "SessionReportRequest", 57: "SessionReportResponse"
+}
+REQUEST_TYPES = frozenset(code for code, name in PFCP_MESSAGES.items() if name.endswith("Request"))
+SESSION_ESTABLISHMENT = 50
+SESSION_MODIFICATION = 52
+SESSION_DELETION = 54
+SESSION_REPORT = 56
+
+# Procedures with a per-second latency series in the result
+SERIES_PROCEDURES = (SESSION_ESTABLISHMENT, SESSION_MODIFICATION, SESSION_DELETION)
+
+# Information elements
+IE_CAUSE = 19
+IE_F_SEID = 57
+CAUSE_REQUEST_ACCEPTED = 1
+MAX_PFCP_IES = 8
+
+# Columns of the PFCP message table; cause is 0 and up_seid 0 when absent
+PFCP_COLUMNS = {
+    "ts_ns": np.int64,
+    "packet": np.int64,
+    "src_hi": np.uint64,
+    "src_lo": np.uint64,
+    "dst_hi": np.uint64,
+    "dst_lo": np.uint64,
+    "message_type": np.uint8,
+    "seid": np.uint64,
+    "sequence": np.uint32,
+    "cause": np.uint8,
+    "f_seid": np.uint64
+}
+
+# Packet columns read by the decoder
+PFCP_FIELDS = ("ts_ns", "protocol", "src_hi", "src_lo", "dst_hi", "dst_lo", "src_port", "dst_port",
+               "payload_offset", "payload_len", "data_offset", "caplen")
+
+NSEC_PER_SEC = 1_000_000_000
+NSEC_PER_MSEC = 1_000_000
+
+# Requests unanswered this long are given up, well past the T1 x N1 retransmission budget
+REQUEST_TIMEOUT_NS = 30 * NSEC_PER_SEC
+
+
+def message_name(message_type: int) -> str:
+    """Name of a PFCP message type."""
+    return PFCP_MESSAGES.get(message_type, f"message_{message_type}")
+
+
+def procedure_name(request_type: int) -> str:
+    """Name of the procedure started by a request type."""
+    return message_name(request_type).replace("Request", "")
+
+
+def is_request(message_type: int) -> bool:
+    """Whether a message type is a known request; unknown types count as responses."""
+    return message_type in REQUEST_TYPES
+
+
+def _count(counts: Dict[int, int], code: int, count: int = 1):
+    """Add to a per-message-type counter."""
+    counts[code] = counts.get(code, 0) + count
+
+
+def decode_pfcp(batch: PacketBatch, raw: np.ndarray = None) -> PacketBatch:
+    """
+    Decode the PFCP messages carried in a batch.
+
+    Only the first message of a UDP datagram is decoded; PFCP senders
+    do not bundle messages in practice.
+
+    Args:
+        batch (PacketBatch): Decoded packets
+        raw (np.ndarray, optional): Capture buffer. Defaults to ``batch.buffer``.
+
+    Returns:
+        PacketBatch: Message table with PFCP_COLUMNS, one row per message
+    """
+    raw = batch.buffer if raw is None else raw
+    rows = np.flatnonzero((batch["protocol"] == PROTO_UDP)
+                          & ((batch["src_port"] == PFCP_PORT) | (batch["dst_port"] == PFCP_PORT))
+                          & (batch["payload_len"] >= 8))
+    start = batch["payload_offset"][rows]
+    end = np.minimum(start + batch["payload_len"][rows], batch["data_offset"][rows] + batch["caplen"][rows])
+
+    header = _take(raw, start, 16)
+    has_seid = (header[:, 0] & PFCP_FLAG_SEID) != 0
+    header_len = np.where(has_seid, 16, 8)
+    valid = ((header[:, 0] >> 5) == PFCP_VERSION) & (start + header_len <= end)
+    end = np.minimum(start + 4 + _be16(header, 2), end)
+    seid = np.where(has_seid, _be64(header, 4), np.uint64(0))
+    sequence = np.where(has_seid, _be32(header, 11), _be32(header, 3)) & 0xFFFFFF
+
+    # Scan the IEs (type, length, value) for Cause and F-SEID
+    cause = np.zeros(len(rows), dtype=np.uint8)
+    f_seid = np.zeros(len(rows), dtype=np.uint64)
+    pos = start + header_len
+    active = valid & (pos + 4 <= end)
+    for _ in range(MAX_PFCP_IES):
+        current = np.flatnonzero(active)
+        if not current.size:
+            break
+        at = pos[current]
+        ie = _take(raw, at, 4)
+        ie_type, length = _be16(ie, 0), _be16(ie, 2)
+        fits = at + 4 + length <= end[current]
+        found = fits & (ie_type == IE_CAUSE) & (length >= 1)
+        cause[current[found]] = _take(raw, at[found] + 4, 1)[:, 0]
+        found = fits & (ie_type == IE_F_SEID) & (length >= 9)
+        f_seid[current[found]] = _be64(_take(raw, at[found] + 5, 8), 0)
+        pos[current] = at + 4 + length
+        active[current] = fits & (pos[current] + 4 <= end[current])
+
+    packet = rows[valid]
+    return PacketBatch.from_columns({
+        "ts_ns": batch["ts_ns"][packet],
+        "packet": packet,
+        "src_hi": batch["src_hi"][packet],
+        "src_lo": batch["src_lo"][packet],
+        "dst_hi": batch["dst_hi"][packet],
+        "dst_lo": batch["dst_lo"][packet],
+        "message_type": header[valid, 1],
+        "seid": seid[valid],
+        "sequence": sequence[valid],
+        "cause": cause[valid],
+        "f_seid": f_seid[valid]
+    }, PFCP_COLUMNS)
+
+
+class PfcpAccumulator:
+    """
+    PFCP request latency, session latency series and per-SEID lifecycles.
+
+    Requests wait in a hash table keyed by (sender, receiver, sequence
+    number) until the response arrives, so work and memory are linear in
+    the number of messages and bounded by outstanding requests plus live
+    sessions. A retransmitted request is counted but keeps the time of its
+    first transmission, so latency includes the retries. Requests
+    unanswered after REQUEST_TIMEOUT_NS are given up and counted as
+    unanswered.
+
+    Responses whose request may lie in an earlier part of the capture,
+    those within REQUEST_TIMEOUT_NS of the part's start, are kept as
+    orphans and paired when the parts are merged. A retransmission whose
+    first transmission lies in an earlier part counts as a request of its
+    own.
+    """
+
+    fields = PFCP_FIELDS
+
+    def __init__(self, max_records: int = 1000):
+        """
+        Args:
+            max_records (int, optional): Session lifecycle records listed in the
+                                         result, earliest established first
+        """
+        self.max_records = max_records
+        self.messages = 0
+        # (sender, receiver, sequence) -> (request ts, request type)
+        self.pending: Dict[tuple, tuple] = {}
+        # responses not preceded by their request: (key, ts, response type, seid, cause, f_seid)
+        self.orphans: List[tuple] = []
+        # request type -> retransmitted requests, requests given up, responses never paired
+        self.retransmits: Dict[int, int] = {}
+        self.expired: Dict[int, int] = {}
+        self.unmatched: Dict[int, int] = {}
+        # request type -> [latency sketch (ms), failures]
+        self.requests: Dict[int, list] = {}
+        # request type -> {second: [latency sum (ms), count]}
+        self.series: Dict[int, Dict[int, list]] = {}
+        # CP SEID -> lifecycle record
+        self.sessions: Dict[int, Dict] = {}
+        self.first_ts = None
+        self.last_ts = None
+
+    def update(self, batch: PacketBatch):
+        """Consume a batch of packets."""
+        if not len(batch) or batch.buffer is None:
+            return
+        messages = decode_pfcp(batch)
+        if not len(messages):
+            return
+        self.messages += len(messages)
+        if self.first_ts is None:
+            self.first_ts = int(messages["ts_ns"].min())
+        self.last_ts = max(self.last_ts or 0, int(messages["ts_ns"].max()))
+
+        src = zip(messages["src_hi"].tolist(), messages["src_lo"].tolist())
+        dst = zip(messages["dst_hi"].tolist(), messages["dst_lo"].tolist())
+        columns = zip(src, dst, messages["sequence"].tolist(), messages["message_type"].tolist(),
+                      messages["ts_ns"].tolist(), messages["seid"].tolist(), messages["cause"].tolist(),
+                      messages["f_seid"].tolist())
+        for a, b, sequence, message_type, ts, seid, cause, f_seid in columns:
+            if is_request(message_type):
+                if self._request((a, b, sequence), ts, message_type) and message_type == SESSION_REPORT:
+                    self._session(seid)["reports"] += 1
+            else:
+                self._response((b, a, sequence), ts, message_type, seid, cause, f_seid)
+        self._expire(self.last_ts)
+
+    def _request(self, key: tuple, ts: int, request_type: int) -> bool:
+        """
+        Wait for the response to a request.
+
+        Returns:
+            bool: False if the request retransmits one still waiting
+        """
+        previous = self.pending.get(key)
+        if previous is not None:
+            if previous[1] == request_type and ts - previous[0] <= REQUEST_TIMEOUT_NS:
+                _count(self.retransmits, request_type)
+                return False
+            # The sequence number was reused: the earlier request went unanswered
+            _count(self.expired, previous[1])
+        self.pending[key] = (ts, request_type)
+        return True
+
+    def _response(self, key: tuple, ts: int, response_type: int, seid: int, cause: int, f_seid: int):
+        """Pair a response with its pending request, or keep it as an orphan."""
+        request = self.pending.pop(key, None)
+        if request is not None and 0 <= ts - request[0] <= REQUEST_TIMEOUT_NS:
+            self._complete(request, ts, response_type, seid, cause, f_seid)
+            return
+        if request is not None:
+            _count(self.expired, request[1])
+        if self.first_ts is None or ts - self.first_ts <= REQUEST_TIMEOUT_NS:
+            # Its request may lie in an earlier part of the capture
+            self.orphans.append((key, ts, response_type, seid, cause, f_seid))
+        else:
+            _count(self.unmatched, response_type - 1)
+
+    def _expire(self, now: int):
+        """Give up requests older than the timeout."""
+        for key in [k for k, (ts, _) in self.pending.items() if now - ts > REQUEST_TIMEOUT_NS]:
+            _count(self.expired, self.pending.pop(key)[1])
+
+    def _session(self, seid: int) -> Dict:
+        """Lifecycle record of a session, created on first sight."""
+        record = self.sessions.get(seid)
+        if record is None:
+            record = self.sessions[seid] = {
+                "established_ns": None, "establishment_ms": None, "up_seid": None, "failed": False,
+                "modifications": 0, "modification_ms": 0.0, "reports": 0,
+                "deleted_ns": None, "deletion_ms": None
+            }
+        return record
+
+    def _complete(self, request: tuple, ts: int, response_type: int, seid: int, cause: int, f_seid: int):
+        """Record a request answered by a response."""
+        requested, request_type = request
+        if response_type != request_type + 1:
+            return
+        latency = (ts - requested) / NSEC_PER_MSEC
+        failed = cause not in (0, CAUSE_REQUEST_ACCEPTED)
+        totals = self.requests.setdefault(request_type, [QuantileSketch(), 0])
+        totals[0].add_value(latency)
+        totals[1] += failed
+
+        if request_type in SERIES_PROCEDURES:
+            second = self.series.setdefault(request_type, {}).setdefault(ts // NSEC_PER_SEC, [0.0, 0])
+            second[0] += latency
+            second[1] += 1
+        if request_type == SESSION_ESTABLISHMENT:
+            record = self._session(seid)
+            record["established_ns"], record["establishment_ms"] = requested, latency
+            record["up_seid"] = f_seid or None
+            record["failed"] = failed
+        elif request_type == SESSION_MODIFICATION:
+            record = self._session(seid)
+            record["modifications"] += 1
+            record["modification_ms"] += latency
+        elif request_type == SESSION_DELETION:
+            record = self._session(seid)
+            record["deleted_ns"], record["deletion_ms"] = requested, latency
+
+    def merge(self, later: "PfcpAccumulator"):
+        """Pair the later part's orphan responses with our open requests and add its totals."""
+        self.messages += later.messages
+        for code, (sketch, failures) in later.requests.items():
+            totals = self.requests.setdefault(code, [QuantileSketch(), 0])
+            totals[0].merge(sketch)
+            totals[1] += failures
+        for code, seconds in later.series.items():
+            mine = self.series.setdefault(code, {})
+            for second, (total, count) in seconds.items():
+                bucket = mine.setdefault(second, [0.0, 0])
+                bucket[0] += total
+                bucket[1] += count
+        for seid, values in later.sessions.items():
+            record = self._session(seid)
+            for name in ("established_ns", "establishment_ms", "up_seid", "deleted_ns", "deletion_ms"):
+                if values[name] is not None:
+                    record[name] = values[name]
+            record["failed"] |= values["failed"]
+            for name in ("modifications", "modification_ms", "reports"):
+                record[name] += values[name]
+
+        for counts, later_counts in ((self.retransmits, later.retransmits), (self.expired, later.expired),
+                                     (self.unmatched, later.unmatched)):
+            for code, count in later_counts.items():
+                _count(counts, code, count)
+
+        for orphan in later.orphans:
+            self._response(*orphan)
+        for key, (ts, request_type) in later.pending.items():
+            self._request(key, ts, request_type)
+        if later.last_ts is not None:
+            self.first_ts = later.first_ts if self.first_ts is None else self.first_ts
+            self.last_ts = max(self.last_ts or 0, later.last_ts)
+            self._expire(self.last_ts)
+
+    def result(self) -> Dict[str, Union[int, Dict, List]]:
+        """Return request latencies, session latency series and lifecycle records."""
+        unanswered = dict(self.expired)
+        for _, request_type in self.pending.values():
+            _count(unanswered, request_type)
+        unmatched = dict(self.unmatched)
+        for _, _, response_type, _, _, _ in self.orphans:
+            _count(unmatched, response_type - 1)
+
+        procedures = {}
+        for code in sorted(set(self.requests) | set(unanswered) | set(unmatched) | set(self.retransmits)):
+            sketch, failures = self.requests.get(code, [QuantileSketch(), 0])
+            entry = {
+                "completed": sketch.count,
+                "failures": failures,
+                "retransmits": self.retransmits.get(code, 0),
+                "unanswered": unanswered.get(code, 0),
+                "unmatched_responses": unmatched.get(code, 0),
+                "latency_ms": distribution(sketch)
+            }
+            if code in self.series:
+                first, last = min(self.series[code]), max(self.series[code])
+                buckets = [self.series[code].get(second) for second in range(first, last + 1)]
+                entry["series_ms"] = {
+                    "start": first,
+                    "step_s": 1,
+                    "values": [round(total / count, 3) if count else None
+                               for total, count in (bucket or (0.0, 0) for bucket in buckets)]
+                }
+            procedures[procedure_name(code)] = entry
+
+        established = [r for r in self.sessions.values() if r["established_ns"] is not None and not r["failed"]]
+        lifetimes = [(r["deleted_ns"] - r["established_ns"]) / NSEC_PER_SEC
+                     for r in established if r["deleted_ns"] is not None]
+        records = sorted(self.sessions.items(),
+                         key=lambda item: (item[1]["established_ns"] is None, item[1]["established_ns"] or 0, item[0]))
+        return {
+            "messages": self.messages,
+            "procedures": procedures,
+            "sessions": {
+                "seen": len(self.sessions),
+                "established": len(established),
+                "failed_establishments": sum(r["failed"] for r in self.sessions.values()),
+                "deleted": len(lifetimes),
+                "active": len(established) - len(lifetimes),
+                "mean_lifetime_s": round(sum(lifetimes) / len(lifetimes), 3) if lifetimes else None
+            },
+            "session_records": [self._record(seid, record) for seid, record in records[:self.max_records]]
+        }
+
+    @staticmethod
+    def _record(seid: int, record: Dict) -> Dict:
+        """One session lifecycle record for the result."""
+        modifications = record["modifications"]
+        return {
+            "cp_seid": seid,
+            "up_seid": record["up_seid"],
+            "established_s": record["established_ns"] / NSEC_PER_SEC if record["established_ns"] is not None else None,
+            "establishment_ms": round(record["establishment_ms"], 3) if record["establishment_ms"] is not None else None,
+            "failed": record["failed"],
+            "modifications": modifications,
+            "avg_modification_ms": round(record["modification_ms"] / modifications, 3) if modifications else None,
+            "reports": record["reports"],
+            "deleted_s": record["deleted_ns"] / NSEC_PER_SEC if record["deleted_ns"] is not None else None,
+            "deletion_ms": round(record["deletion_ms"], 3) if record["deletion_ms"] is not None else None
+        }
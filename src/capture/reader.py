@@ -0,0 +1,749 @@
+"""
+Streaming pcap/pcapng reader.
+
+The reader memory-maps a capture file and walks its records in place, so
+multi-gigabyte captures can be decoded without tshark or a per-packet
+object tree. Link, network and transport headers are decoded straight
+from the mapped buffer into columnar packet batches.
+
+Compressed captures (gzip, xz, bzip2, zstd) are decompressed as a stream
+instead: the reader walks a sliding window of decompressed data that a
+background thread keeps filling.
+"""
+import mmap
+import os
+import struct
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+from .batch import PacketBatch, IPV4_MAPPED_PREFIX, PROTO_NONE, PROTO_TCP, PROTO_UDP, PROTO_SCTP
+from .compression import DecompressingStream, compression_of
+
+# File format magic numbers
+PCAP_MAGIC_USEC = 0xA1B2C3D4
+PCAP_MAGIC_NSEC = 0xA1B23C4D
+PCAPNG_BLOCK_SHB = 0x0A0D0D0A
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+
+# pcapng block types
+PCAPNG_BLOCK_IDB = 0x00000001
+PCAPNG_BLOCK_OPB = 0x00000002
+PCAPNG_BLOCK_SPB = 0x00000003
+PCAPNG_BLOCK_EPB = 0x00000006
+
+# Link-layer header types
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+# EtherTypes and IP protocol numbers
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86DD
+ETHERTYPE_VLAN = (0x8100, 0x88A8, 0x9100)
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+IPPROTO_SCTP = 132
+IPV6_EXTENSION_HEADERS = (0, 43, 44, 51, 60)
+
+# Well-known SCTP port for NGAP (N2 interface)
+NGAP_SCTP_PORT = 38412
+
+NSEC_PER_SEC = 1_000_000_000
+
+# Room in front of each decompressed chunk for the unread end of the previous one
+STREAM_HEADROOM = 1 << 20
+
+# Columns filled by each decoding stage; record-level columns are always filled
+RECORD_COLUMNS = ("ts_ns", "length", "caplen", "data_offset", "linktype")
+NETWORK_COLUMNS = ("ip_version", "ttl", "src_hi", "src_lo", "dst_hi", "dst_lo")
+TRANSPORT_COLUMNS = ("protocol", "src_port", "dst_port", "tcp_flags", "seq", "ack",
+                     "payload_offset", "payload_len", "is_5g")
+
+
+class CaptureFormatError(ValueError):
+    """Raised when a file is not a readable pcap or pcapng capture."""
+
+
+class PcapReader:
+    """
+    Memory-mapped reader for pcap and pcapng capture files.
+
+    Packets are produced as columnar batches whose offsets point into the
+    mapped buffer, so the reader itself never copies packet data.
+
+    For a compressed capture, ``buffer`` holds only the current window of
+    decompressed data and ``size`` its length. Offsets taken or returned
+    by ``batches`` and ``split`` still count bytes of decompressed data
+    from the start of the capture.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open and memory-map a capture file, or start decompressing it.
+
+        Args:
+            path (str): Path to the pcap or pcapng file, optionally compressed
+
+        Raises:
+            CaptureFormatError: If the file is not a pcap or pcapng capture
+        """
+        self.path = path
+        self.compression = compression_of(path)
+        self._stream = None
+        self._file = None
+        if self.compression is not None:
+            self._open_stream()
+            self._fill(0)
+            size = self.size
+        else:
+            self._file = open(path, "rb")
+            size = os.fstat(self._file.fileno()).st_size
+        if size < 24:
+            self.close()
+            raise CaptureFormatError(f"File too small to be a capture: {path}")
+
+        if self._stream is None:
+            self.buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.size = size
+        self._detect_format()
+        self.next_offset = self.data_offset
+        self.next_state = _PcapngState(self.endian)
+
+    def _detect_format(self):
+        """Inspect the file header to determine the capture format."""
+        magic_le = struct.unpack_from("<I", self.buffer, 0)[0]
+        magic_be = struct.unpack_from(">I", self.buffer, 0)[0]
+
+        if magic_le in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+            self.format, self.endian = "pcap", "<"
+        elif magic_be in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+            self.format, self.endian = "pcap", ">"
+        elif magic_le == PCAPNG_BLOCK_SHB:
+            self.format = "pcapng"
+            self.endian = self._section_endian(0)
+        else:
+            self.close()
+            raise CaptureFormatError(f"Unrecognized capture format: {self.path}")
+
+        if self.format == "pcap":
+            magic = struct.unpack_from(self.endian + "I", self.buffer, 0)[0]
+            self.ts_scale = 1 if magic == PCAP_MAGIC_NSEC else 1000
+            self.linktype = struct.unpack_from(self.endian + "I", self.buffer, 20)[0] & 0xFFFF
+            self.data_offset = 24
+        else:
+            self.linktype = None
+            self.data_offset = 0
+
+    def _open_stream(self):
+        """Start decompressing the capture from its beginning."""
+        if self._stream is not None:
+            self._stream.close()
+        self._stream = DecompressingStream(self.path, self.compression, headroom=STREAM_HEADROOM)
+        self._window_start = 0
+        self._stream_end = False
+        self.buffer = b""
+        self.size = 0
+
+    def _fill(self, pos: int) -> int:
+        """
+        Move the decompressed window on to the next chunk, keeping the data from pos.
+
+        Returns:
+            int: The new window position of pos, i.e. 0
+        """
+        rest = self.buffer[pos:]
+        chunk = self._stream.read()
+        self._stream_end = len(chunk) == STREAM_HEADROOM
+        if len(rest) <= STREAM_HEADROOM:
+            # The unread rest goes into the headroom, so the chunk is not copied
+            begin = STREAM_HEADROOM - len(rest)
+            chunk[begin:STREAM_HEADROOM] = rest
+            self.buffer = chunk[begin:]
+        else:
+            self.buffer = bytes(rest) + chunk[STREAM_HEADROOM:]
+        self._window_start += pos
+        self.size = len(self.buffer)
+        return 0
+
+    def _seek(self, offset: int) -> int:
+        """Move the decompressed window to hold offset; return its position in the window."""
+        if offset < self._window_start:
+            self._open_stream()
+            self._fill(0)
+        while offset - self._window_start >= self.size and not self._stream_end:
+            self._fill(self.size)
+        return offset - self._window_start
+
+    def _section_endian(self, offset: int) -> str:
+        """Return the byte order of the pcapng section starting at offset."""
+        bom = struct.unpack_from("<I", self.buffer, offset + 8)[0]
+        if bom == PCAPNG_BYTE_ORDER_MAGIC:
+            return "<"
+        if struct.unpack_from(">I", self.buffer, offset + 8)[0] == PCAPNG_BYTE_ORDER_MAGIC:
+            return ">"
+        raise CaptureFormatError(f"Invalid pcapng byte-order magic in {self.path}")
+
+    def batches(self, batch_size: int = 65536, decode: bool = True, reuse: bool = True,
+                start: int = None, end: int = None, state: "_PcapngState" = None,
+                fields: Iterable[str] = None, packet_filter=None) -> Iterator[PacketBatch]:
+        """
+        Iterate over the capture as columnar packet batches.
+
+        The record walk only collects record offsets; timestamps, lengths and
+        all protocol headers are then gathered from the mapped buffer for the
+        whole batch at once and written into the batch arrays in place.
+
+        A truncated record at the end of the file is silently ignored, which
+        lets the reader run against captures that are still being written.
+        After iterating, ``next_offset`` and ``next_state`` hold the position
+        of the first record not yet read, to resume from once the file grows.
+
+        Args:
+            batch_size (int, optional): Maximum packets per batch
+            decode (bool, optional): Decode network and transport headers.
+                                     When False only record-level columns are filled.
+            reuse (bool, optional): Refill the same batch object on every
+                                    iteration. Call ``copy()`` on a batch to keep it.
+            start (int, optional): Byte offset of the first record to read.
+                                   Must be a record boundary, e.g. from ``split``.
+            end (int, optional): Stop before the first record starting at or after this offset
+            state (optional): pcapng interface state in effect at start, as returned by ``split``
+            fields (iterable, optional): Columns the caller needs. Decoding stops at
+                                         the shallowest layer that provides them;
+                                         other columns are left unset. Defaults to all.
+            packet_filter (PacketFilter, optional): Drop packets that do not match
+                                                    before they are yielded. Protocol and
+                                                    subnet terms are checked before
+                                                    transport headers are decoded.
+
+        Yields:
+            PacketBatch: Batch of decoded packets
+        """
+        pos = self.data_offset if start is None else start
+        if self._stream is not None:
+            pos = self._seek(pos)
+        raw = np.frombuffer(self.buffer, dtype=np.uint8)
+        headers = np.empty(batch_size, dtype=np.int64)
+        slots = np.empty(batch_size, dtype=np.int64)
+        batch = PacketBatch(batch_size)
+        state = _PcapngState(self.endian) if state is None else state.copy()
+        if packet_filter is not None and fields is not None:
+            fields = set(fields) | packet_filter.fields
+
+        try:
+            while True:
+                stop = self.size if end is None else end
+                if self._stream is not None and end is not None:
+                    stop -= self._window_start
+                if self.format == "pcap":
+                    count, pos = self._walk_pcap(pos, headers, batch_size, stop)
+                else:
+                    count, pos = self._walk_pcapng(pos, headers, slots, batch_size, state, stop)
+                self.next_offset, self.next_state = pos, state
+                if self._stream is not None:
+                    self.next_offset += self._window_start
+                if count == 0:
+                    # The window ends inside a record: move on to the next chunk
+                    if self._stream is not None and not self._stream_end and pos < stop:
+                        pos = self._fill(pos)
+                        raw = np.frombuffer(self.buffer, dtype=np.uint8)
+                        continue
+                    break
+
+                if not reuse:
+                    batch = PacketBatch(batch_size)
+                batch.size = count
+                batch.buffer = raw
+                if self.format == "pcap":
+                    self._fill_pcap_records(raw, headers[:count], batch)
+                else:
+                    self._fill_pcapng_records(raw, headers[:count], slots[:count], state, batch)
+                if decode and packet_filter is not None and packet_filter.network_terms:
+                    yield _decode_filtered(raw, batch, fields, packet_filter)
+                else:
+                    if decode:
+                        decode_headers(raw, batch, fields)
+                    if packet_filter is not None:
+                        yield batch.select(packet_filter.mask(batch))
+                    else:
+                        yield batch
+
+                if count < batch_size and self._stream is None:
+                    break
+        finally:
+            batch.buffer = None
+            del raw
+
+    def split(self, parts: int) -> List[Tuple[int, int, "_PcapngState"]]:
+        """
+        Split the capture into byte ranges that start and end on record boundaries.
+
+        A pre-scan walks only the record (or block) headers, stopping at the
+        first boundary past each evenly spaced target offset, so the ranges
+        hold roughly equal numbers of bytes.
+
+        A compressed capture is returned as a single range.
+
+        Args:
+            parts (int): Number of ranges to produce
+
+        Returns:
+            list: (start, end, state) tuples to pass to ``batches``
+        """
+        if self._stream is not None:
+            # A compressed stream can only be read from the start
+            return [(self.data_offset, None, _PcapngState(self.endian))]
+        scratch = np.empty(1 << 16, dtype=np.int64)
+        scratch_slots = np.empty(1 << 16, dtype=np.int64)
+        state = _PcapngState(self.endian)
+        pos = self.data_offset
+        bounds = [(pos, state.copy())]
+
+        for part in range(1, parts):
+            target = self.size * part // parts
+            while pos < target:
+                previous = pos
+                if self.format == "pcap":
+                    _, pos = self._walk_pcap(pos, scratch, scratch.size, target)
+                else:
+                    _, pos = self._walk_pcapng(pos, scratch, scratch_slots, scratch.size, state, target)
+                if pos == previous:
+                    break
+            if pos > bounds[-1][0] and pos < self.size:
+                bounds.append((pos, state.copy()))
+
+        ends = [start for start, _ in bounds[1:]] + [self.size]
+        return [(start, end, state) for (start, state), end in zip(bounds, ends)]
+
+    def records(self) -> Iterator[Tuple[int, int, int, int, int]]:
+        """
+        Iterate over the packet records in the capture.
+
+        Yields:
+            tuple: (timestamp_ns, data_offset, captured_length, wire_length, linktype)
+        """
+        for batch in self.batches(decode=False):
+            yield from zip(
+                batch["ts_ns"].tolist(), batch["data_offset"].tolist(), batch["caplen"].tolist(),
+                batch["length"].tolist(), batch["linktype"].tolist()
+            )
+
+    def _walk_pcap(self, pos: int, headers: np.ndarray, limit: int, stop: int) -> Tuple[int, int]:
+        """Collect up to limit classic pcap record header offsets in [pos, stop)."""
+        buf = self.buffer
+        size = self.size
+        unpack_caplen = struct.Struct(self.endian + "I").unpack_from
+        out = memoryview(headers)
+        count = 0
+
+        while count < limit and pos < stop and pos + 16 <= size:
+            following = pos + 16 + unpack_caplen(buf, pos + 8)[0]
+            if following > size:
+                break
+            out[count] = pos
+            count += 1
+            pos = following
+
+        return count, pos
+
+    def _fill_pcap_records(self, raw: np.ndarray, headers: np.ndarray, batch: PacketBatch):
+        """Gather timestamps and lengths of classic pcap records."""
+        count = len(headers)
+        words = _take(raw, headers, 16).view(self.endian + "u4").reshape(count, 4).astype(np.int64)
+        batch.raw("ts_ns")[:count] = words[:, 0] * NSEC_PER_SEC + words[:, 1] * self.ts_scale
+        batch.raw("caplen")[:count] = words[:, 2]
+        batch.raw("length")[:count] = words[:, 3]
+        batch.raw("data_offset")[:count] = headers + 16
+        batch.raw("linktype")[:count] = self.linktype
+
+    def _walk_pcapng(self, pos: int, headers: np.ndarray, slots: np.ndarray, limit: int,
+                     state: "_PcapngState", stop: int) -> Tuple[int, int]:
+        """
+        Collect up to limit pcapng packet block offsets in [pos, stop).
+
+        Interface Description Blocks are parsed as they are met and appended
+        to the reader-wide interface table in state; each packet block is
+        tagged with its slot in that table (negated for Simple Packet Blocks).
+        """
+        buf = self.buffer
+        size = self.size
+        out = memoryview(headers)
+        out_slots = memoryview(slots)
+        count = 0
+
+        while count < limit and pos < stop and pos + 12 <= size:
+            endian = state.endian
+            block_type = struct.unpack_from(endian + "I", buf, pos)[0]
+            if block_type == PCAPNG_BLOCK_SHB:
+                # A new section may switch byte order and resets interfaces
+                endian = state.endian = self._section_endian(pos)
+                state.section_base = len(state.interfaces)
+            block_len = struct.unpack_from(endian + "I", buf, pos + 4)[0]
+            if block_len < 12 or pos + block_len > size:
+                break
+
+            if block_type == PCAPNG_BLOCK_IDB:
+                state.interfaces.append(self._parse_interface(pos, block_len, endian) + (endian == ">",))
+            elif block_type == PCAPNG_BLOCK_EPB or block_type == PCAPNG_BLOCK_OPB:
+                fmt = endian + ("I" if block_type == PCAPNG_BLOCK_EPB else "H")
+                slot = state.section_base + struct.unpack_from(fmt, buf, pos + 8)[0]
+                if slot < len(state.interfaces):
+                    out[count] = pos
+                    out_slots[count] = slot
+                    count += 1
+            elif block_type == PCAPNG_BLOCK_SPB:
+                if state.section_base < len(state.interfaces):
+                    out[count] = pos
+                    out_slots[count] = -1 - state.section_base
+                    count += 1
+
+            pos += block_len
+
+        return count, pos
+
+    def _fill_pcapng_records(self, raw: np.ndarray, headers: np.ndarray, slots: np.ndarray,
+                             state: "_PcapngState", batch: PacketBatch):
+        """Gather timestamps and lengths of pcapng packet blocks."""
+        count = len(headers)
+        interfaces = np.array([iface[:3] for iface in state.interfaces], dtype=np.int64).reshape(-1, 3)
+        big_endian = np.array([iface[3] for iface in state.interfaces], dtype=bool)
+
+        simple = slots < 0
+        slot = np.where(simple, -1 - slots, slots)
+        words = _take(raw, headers, 28).view("<u4").reshape(count, 7)
+        swap = big_endian[slot]
+        if swap.any():
+            words[swap] = words[swap].byteswap()
+        words = words.astype(np.int64)
+
+        linktype, units, offset_ns = interfaces[slot, 0], interfaces[slot, 1], interfaces[slot, 2]
+        ticks = (words[:, 3] << 32) | words[:, 4]
+        ts_ns = (ticks // units) * NSEC_PER_SEC + (ticks % units) * NSEC_PER_SEC // units + offset_ns
+
+        # Simple Packet Blocks carry no timestamp and only the original length
+        wirelen = np.where(simple, words[:, 2], words[:, 6])
+        caplen = np.where(simple, np.minimum(words[:, 2], words[:, 1] - 16), words[:, 5])
+        batch.raw("ts_ns")[:count] = np.where(simple, 0, ts_ns)
+        batch.raw("caplen")[:count] = caplen
+        batch.raw("length")[:count] = wirelen
+        batch.raw("data_offset")[:count] = headers + np.where(simple, 12, 28)
+        batch.raw("linktype")[:count] = linktype
+
+    def _parse_interface(self, pos: int, block_len: int, endian: str) -> Tuple[int, int, int]:
+        """
+        Parse an Interface Description Block.
+
+        Returns:
+            tuple: (linktype, timestamp_units_per_second, timestamp_offset_ns)
+        """
+        buf = self.buffer
+        linktype = struct.unpack_from(endian + "H", buf, pos + 8)[0]
+        units = 1_000_000
+        offset_ns = 0
+
+        # Walk the options looking for if_tsresol (9) and if_tsoffset (14)
+        opt = pos + 16
+        end = pos + block_len - 4
+        while opt + 4 <= end:
+            code, length = struct.unpack_from(endian + "HH", buf, opt)
+            if code == 0:
+                break
+            if code == 9 and length >= 1:
+                resol = buf[opt + 4]
+                units = 2 ** (resol & 0x7F) if resol & 0x80 else 10 ** resol
+            elif code == 14 and length >= 8:
+                offset_ns = struct.unpack_from(endian + "q", buf, opt + 4)[0] * NSEC_PER_SEC
+            opt += 4 + ((length + 3) & ~3)
+
+        return linktype, units, offset_ns
+
+    def packets(self) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over decoded packets as dicts.
+
+        This is the legacy per-packet view; prefer ``batches`` for analysis.
+
+        Yields:
+            dict: Packet fields with string addresses and hex TCP flags
+        """
+        for batch in self.batches():
+            yield from batch.to_records()
+
+    def close(self):
+        """Release the memory map and file handle, or stop decompressing."""
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+            self.buffer = None
+        if getattr(self, "buffer", None) is not None:
+            try:
+                self.buffer.close()
+            except BufferError:
+                # A batch iterator is still alive; the map is released with it
+                pass
+            self.buffer = None
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _PcapngState:
+    """Interface table and byte order carried across pcapng batches."""
+
+    def __init__(self, endian: str):
+        self.endian = endian
+        self.section_base = 0
+        self.interfaces = []
+
+    def copy(self) -> "_PcapngState":
+        state = _PcapngState(self.endian)
+        state.section_base = self.section_base
+        state.interfaces = list(self.interfaces)
+        return state
+
+
+def _take(raw: np.ndarray, positions: np.ndarray, width: int) -> np.ndarray:
+    """
+    Gather width consecutive bytes at each position.
+
+    Positions are clipped to the buffer, so rows whose header does not fit
+    return arbitrary bytes and must be masked by the caller.
+
+    Returns:
+        np.ndarray: (len(positions), width) uint8 array
+    """
+    positions = np.clip(positions, 0, raw.size - width)
+    return raw[positions[:, None] + np.arange(width)]
+
+
+def _be16(data: np.ndarray, column: int) -> np.ndarray:
+    """Big-endian 16-bit value at a column of a gathered byte matrix."""
+    return (data[:, column].astype(np.int64) << 8) | data[:, column + 1]
+
+
+def _be32(data: np.ndarray, column: int) -> np.ndarray:
+    """Big-endian 32-bit value at a column of a gathered byte matrix."""
+    return np.ascontiguousarray(data[:, column:column + 4]).view(">u4").ravel().astype(np.int64)
+
+
+def _be64(data: np.ndarray, column: int) -> np.ndarray:
+    """Big-endian 64-bit value at a column of a gathered byte matrix."""
+    return np.ascontiguousarray(data[:, column:column + 8]).view(">u8").ravel().astype(np.uint64)
+
+
+def decode_headers(raw: np.ndarray, batch: PacketBatch, fields: Iterable[str] = None):
+    """
+    Decode link, network and transport headers for a whole batch.
+
+    The record-level columns (data_offset, caplen, linktype) must already be
+    filled. All other columns are written in place.
+
+    Args:
+        raw (np.ndarray): The capture buffer as a uint8 array
+        batch (PacketBatch): Batch to decode
+        fields (iterable, optional): Columns needed. Transport headers are only
+                                     decoded when a transport column is needed,
+                                     and nothing is decoded for record-level
+                                     columns alone. Defaults to all columns.
+    """
+    fields = set(TRANSPORT_COLUMNS) if fields is None else set(fields)
+    if not fields & set(NETWORK_COLUMNS + TRANSPORT_COLUMNS):
+        return
+    transport = _decode_network(raw, batch)
+    if fields & set(TRANSPORT_COLUMNS):
+        _decode_transport(raw, batch, *transport)
+
+
+def _decode_filtered(raw: np.ndarray, batch: PacketBatch, fields, packet_filter) -> PacketBatch:
+    """
+    Decode a batch and apply a filter, checking its protocol and subnet terms
+    on the network headers so transport headers are decoded only for the
+    packets that pass them.
+
+    Returns:
+        PacketBatch: New batch of the matching packets
+    """
+    proto, l4, l4_end = _decode_network(raw, batch)
+    protocol = np.select([proto == IPPROTO_TCP, proto == IPPROTO_UDP, proto == IPPROTO_SCTP],
+                         [PROTO_TCP, PROTO_UDP, PROTO_SCTP], PROTO_NONE)
+    rows = np.flatnonzero(packet_filter.network_mask(batch, protocol))
+    selected = batch.select(rows)
+    if fields is None or set(fields) & set(TRANSPORT_COLUMNS):
+        _decode_transport(raw, selected, proto[rows], l4[rows], l4_end[rows])
+    # Truncated transport headers and the port and sample terms are settled on the full decode
+    return selected.select(packet_filter.mask(selected))
+
+
+def _decode_network(raw: np.ndarray, batch: PacketBatch) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Decode link and network headers, filling the network columns.
+
+    Returns:
+        tuple: (IP protocol number, transport header offset, end of the IP
+               payload) per packet, for _decode_transport
+    """
+    n = batch.size
+    offset = batch["data_offset"]
+    caplen = batch["caplen"].astype(np.int64)
+    end = offset + caplen
+    linktype = batch["linktype"]
+
+    net = np.zeros(n, dtype=np.int64)
+    ethertype = np.zeros(n, dtype=np.int64)
+
+    # Ethernet, including up to two stacked VLAN tags
+    rows = np.flatnonzero((linktype == LINKTYPE_ETHERNET) & (caplen >= 14))
+    if rows.size:
+        pos = offset[rows] + 12
+        etype = _be16(_take(raw, pos, 2), 0)
+        for _ in range(2):
+            tagged = np.isin(etype, ETHERTYPE_VLAN) & (pos + 6 <= end[rows])
+            pos = np.where(tagged, pos + 4, pos)
+            etype = np.where(tagged, _be16(_take(raw, pos, 2), 0), etype)
+        ethertype[rows] = etype
+        net[rows] = pos + 2
+
+    # Linux cooked capture v1 and v2
+    rows = np.flatnonzero((linktype == LINKTYPE_LINUX_SLL) & (caplen >= 16))
+    if rows.size:
+        ethertype[rows] = _be16(_take(raw, offset[rows] + 14, 2), 0)
+        net[rows] = offset[rows] + 16
+    rows = np.flatnonzero((linktype == LINKTYPE_LINUX_SLL2) & (caplen >= 20))
+    if rows.size:
+        ethertype[rows] = _be16(_take(raw, offset[rows], 2), 0)
+        net[rows] = offset[rows] + 20
+
+    # BSD loopback; DLT_NULL uses host byte order, so accept either
+    rows = np.flatnonzero(np.isin(linktype, (LINKTYPE_NULL, LINKTYPE_LOOP)) & (caplen >= 4))
+    if rows.size:
+        family = _take(raw, offset[rows], 4).view("<u4").ravel().astype(np.int64)
+        family = np.where(family > 0xFFFF, family.astype(np.uint32).byteswap().astype(np.int64), family)
+        ethertype[rows] = np.where(family == 2, ETHERTYPE_IPV4,
+                                   np.where(np.isin(family, (10, 24, 28, 30)), ETHERTYPE_IPV6, 0))
+        net[rows] = offset[rows] + 4
+
+    # Raw IP
+    rows = np.flatnonzero(np.isin(linktype, (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6)) & (caplen >= 1))
+    if rows.size:
+        version = _take(raw, offset[rows], 1)[:, 0] >> 4
+        ethertype[rows] = np.where(version == 4, ETHERTYPE_IPV4, np.where(version == 6, ETHERTYPE_IPV6, 0))
+        net[rows] = offset[rows]
+
+    ip_version = np.zeros(n, dtype=np.uint8)
+    ttl = np.zeros(n, dtype=np.uint8)
+    proto = np.zeros(n, dtype=np.int64)
+    src_hi = np.zeros(n, dtype=np.uint64)
+    src_lo = np.zeros(n, dtype=np.uint64)
+    dst_hi = np.zeros(n, dtype=np.uint64)
+    dst_lo = np.zeros(n, dtype=np.uint64)
+    l4 = np.zeros(n, dtype=np.int64)
+    l4_end = np.zeros(n, dtype=np.int64)
+
+    # IPv4; only the first fragment carries the transport header
+    rows = np.flatnonzero((ethertype == ETHERTYPE_IPV4) & (net + 20 <= end))
+    if rows.size:
+        header = _take(raw, net[rows], 20)
+        ihl = (header[:, 0] & 0x0F).astype(np.int64) * 4
+        total_length = _be16(header, 2)
+        first_fragment = (_be16(header, 6) & 0x1FFF) == 0
+        ip_version[rows] = 4
+        ttl[rows] = header[:, 8]
+        proto[rows] = np.where(first_fragment & (ihl >= 20), header[:, 9], 0)
+        src_lo[rows] = _be32(header, 12).astype(np.uint64) | np.uint64(IPV4_MAPPED_PREFIX)
+        dst_lo[rows] = _be32(header, 16).astype(np.uint64) | np.uint64(IPV4_MAPPED_PREFIX)
+        l4[rows] = net[rows] + ihl
+        l4_end[rows] = net[rows] + np.where(total_length > 0, total_length, end[rows] - net[rows])
+
+    # IPv6, skipping extension headers
+    rows = np.flatnonzero((ethertype == ETHERTYPE_IPV6) & (net + 40 <= end))
+    if rows.size:
+        header = _take(raw, net[rows], 40)
+        payload_length = _be16(header, 4)
+        next_header = header[:, 6].astype(np.int64)
+        ip_version[rows] = 6
+        ttl[rows] = header[:, 7]
+        src_hi[rows], src_lo[rows] = _be64(header, 8), _be64(header, 16)
+        dst_hi[rows], dst_lo[rows] = _be64(header, 24), _be64(header, 32)
+        pos = net[rows] + 40
+        l4_end[rows] = np.where(payload_length > 0, pos + payload_length, end[rows])
+
+        for _ in range(4):
+            pending = np.isin(next_header, IPV6_EXTENSION_HEADERS) & (pos + 8 <= end[rows])
+            if not pending.any():
+                break
+            ext = _take(raw, pos, 8)
+            fragmented = pending & (next_header == 44) & ((_be16(ext, 2) & 0xFFF8) != 0)
+            hdr_len = np.where(next_header == 44, 8,
+                               np.where(next_header == 51, (ext[:, 1].astype(np.int64) + 2) * 4,
+                                        (ext[:, 1].astype(np.int64) + 1) * 8))
+            pos = np.where(pending, pos + hdr_len, pos)
+            next_header = np.where(pending, ext[:, 0], next_header)
+            next_header = np.where(fragmented, -1, next_header)
+        proto[rows] = np.where(np.isin(next_header, IPV6_EXTENSION_HEADERS) | (next_header < 0), 0, next_header)
+        l4[rows] = pos
+
+    batch.raw("ip_version")[:n] = ip_version
+    batch.raw("ttl")[:n] = ttl
+    batch.raw("src_hi")[:n] = src_hi
+    batch.raw("src_lo")[:n] = src_lo
+    batch.raw("dst_hi")[:n] = dst_hi
+    batch.raw("dst_lo")[:n] = dst_lo
+    return proto, l4, l4_end
+
+
+def _decode_transport(raw: np.ndarray, batch: PacketBatch, proto: np.ndarray, l4: np.ndarray,
+                      l4_end: np.ndarray):
+    """Decode TCP, UDP and SCTP headers, filling the transport columns."""
+    n = batch.size
+    end = batch["data_offset"] + batch["caplen"].astype(np.int64)
+
+    protocol = np.zeros(n, dtype=np.uint8)
+    src_port = np.zeros(n, dtype=np.uint16)
+    dst_port = np.zeros(n, dtype=np.uint16)
+    tcp_flags = np.zeros(n, dtype=np.uint8)
+    seq = np.zeros(n, dtype=np.uint32)
+    ack = np.zeros(n, dtype=np.uint32)
+    payload_offset = np.zeros(n, dtype=np.int64)
+
+    # TCP
+    rows = np.flatnonzero((proto == IPPROTO_TCP) & (l4 + 20 <= end))
+    if rows.size:
+        header = _take(raw, l4[rows], 14)
+        protocol[rows] = PROTO_TCP
+        src_port[rows], dst_port[rows] = _be16(header, 0), _be16(header, 2)
+        seq[rows], ack[rows] = _be32(header, 4), _be32(header, 8)
+        tcp_flags[rows] = header[:, 13]
+        payload_offset[rows] = l4[rows] + (header[:, 12] >> 4).astype(np.int64) * 4
+
+    # UDP and SCTP share the port layout
+    for ip_proto, code, header_len in ((IPPROTO_UDP, PROTO_UDP, 8), (IPPROTO_SCTP, PROTO_SCTP, 12)):
+        rows = np.flatnonzero((proto == ip_proto) & (l4 + header_len <= end))
+        if rows.size:
+            header = _take(raw, l4[rows], 4)
+            protocol[rows] = code
+            src_port[rows], dst_port[rows] = _be16(header, 0), _be16(header, 2)
+            payload_offset[rows] = l4[rows] + header_len
+
+    has_transport = protocol != PROTO_NONE
+    payload_len = np.where(has_transport, np.clip(l4_end - payload_offset, 0, None), 0)
+
+    batch.raw("protocol")[:n] = protocol
+    batch.raw("src_port")[:n] = src_port
+    batch.raw("dst_port")[:n] = dst_port
+    batch.raw("tcp_flags")[:n] = tcp_flags
+    batch.raw("seq")[:n] = seq
+    batch.raw("ack")[:n] = ack
+    batch.raw("payload_offset")[:n] = payload_offset
+    batch.raw("payload_len")[:n] = payload_len
+    batch.raw("is_5g")[:n] = (protocol == PROTO_SCTP) & ((src_port == NGAP_SCTP_PORT) | (dst_port == NGAP_SCTP_PORT))
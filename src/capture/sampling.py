@@ -0,0 +1,216 @@
+"""
+Flow-hash sampling for fast previews of large captures.
+
+A FlowSample keeps whole transport flows, chosen by a hash of their
+canonical key, so that per-flow metrics (handshakes, RTT, loss) stay
+valid on the sample. The hash depends only on the key, so every batch,
+worker and offset index makes the same choice, and a capture with an
+offset index can skip every checkpoint segment that holds no sampled flow.
+
+The sampled flows are further split by their hash into equal random
+groups, each an independent sample at rate / groups. SampleAccumulator
+keeps capture totals per group and extrapolates them to the whole capture,
+with a confidence interval from the spread of the group estimates (the
+random group variance estimator).
+
+``extrapolate_results`` then puts those estimates in place of the
+matching sample totals of the other results (packets, bytes, average
+throughput, connections), each with a "<field>_ci" interval. Averages,
+ratios and percentiles computed on whole flows already estimate the whole
+capture; every other count or volume describes the sampled flows only.
+"""
+import math
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+from .batch import PacketBatch, PROTO_NONE, PROTO_TCP
+from .flows import canonical_keys
+from .sketch import HyperLogLog, hash_columns
+
+# Random groups the sampled flows are split into for variance estimation
+SAMPLE_GROUPS = 10
+
+# Two-sided 95% quantile of Student's t with SAMPLE_GROUPS - 1 degrees of freedom
+T_QUANTILE_95 = 2.262
+
+# HyperLogLog precision of the per-group distinct flow counts
+GROUP_HLL_PRECISION = 10
+
+# TCP flag bits of a connection-opening SYN
+TCP_SYN = 0x02
+TCP_ACK = 0x10
+
+# Totals extrapolated to the whole capture, in result order
+SAMPLE_TOTALS = ("packets", "bytes", "flows", "tcp_connections", "tcp_syn_packets")
+
+# (result key, field, estimate) of the sample totals replaced by their estimates
+EXTRAPOLATED_FIELDS = (
+    ("capture_stats", "packets_analyzed", "packets"),
+    ("capture_stats", "bytes_analyzed", "bytes"),
+    ("connection_stats", "total_connections", "tcp_connections")
+)
+
+
+class FlowSample:
+    """
+    Deterministic sample of whole flows at a given rate.
+
+    A flow is sampled when the 64-bit hash of its canonical key falls below
+    rate * 2^64. Packets without a transport header belong to no flow and
+    are never sampled.
+    """
+
+    # Packet columns read by mask() and hashes()
+    fields = ("protocol", "src_hi", "src_lo", "dst_hi", "dst_lo", "src_port", "dst_port")
+
+    def __init__(self, rate: float):
+        """
+        Args:
+            rate (float): Share of flows kept, above 0 and at most 1
+
+        Raises:
+            ValueError: If the rate is out of range
+        """
+        if not 0 < rate <= 1:
+            raise ValueError(f"Sample rate must be in (0, 1], got {rate}")
+        self.rate = rate
+        self.threshold = np.uint64(min(int(rate * 2.0 ** 64), (1 << 64) - 1))
+
+    def hashes(self, batch: PacketBatch) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Flow hashes of the transport packets of a batch.
+
+        Returns:
+            tuple: (rows, hash per row)
+        """
+        rows = np.flatnonzero(batch["protocol"] != PROTO_NONE)
+        key, _ = canonical_keys(batch, rows)
+        return rows, hash_columns(key)
+
+    def key_hashes(self, keys: np.ndarray) -> np.ndarray:
+        """Flow hashes of canonical keys given as (n, 7) rows, as stored by FlowTable and CaptureIndex."""
+        return hash_columns(list(np.asarray(keys, dtype=np.uint64).T))
+
+    def mask(self, batch: PacketBatch) -> np.ndarray:
+        """Boolean mask of the packets of a batch that belong to sampled flows."""
+        keep = np.zeros(len(batch), dtype=bool)
+        rows, hashes = self.hashes(batch)
+        keep[rows] = hashes < self.threshold
+        return keep
+
+    def groups(self, hashes: np.ndarray) -> np.ndarray:
+        """Random group (0 to SAMPLE_GROUPS - 1) of sampled flow hashes."""
+        share = hashes.astype(np.float64) / float(self.threshold)
+        return np.minimum((share * SAMPLE_GROUPS).astype(np.int64), SAMPLE_GROUPS - 1)
+
+    def __str__(self) -> str:
+        return f"sample {self.rate:g}"
+
+
+class SampleAccumulator:
+    """
+    Capture totals of a flow sample, per random group, extrapolated with confidence intervals.
+
+    Created by ``create_accumulators`` whenever the packet filter samples;
+    it sees only packets of sampled flows.
+    """
+
+    fields = FlowSample.fields + ("length", "tcp_flags")
+
+    def __init__(self, sample: FlowSample):
+        """
+        Args:
+            sample (FlowSample): The sample the packets were drawn with
+        """
+        self.sample = sample
+        # Per-group sums of packets, bytes and connection-opening SYNs
+        self.sums = np.zeros((3, SAMPLE_GROUPS), dtype=np.int64)
+        self.flows = [HyperLogLog(GROUP_HLL_PRECISION) for _ in range(SAMPLE_GROUPS)]
+        # TCP flows, as connection_stats counts connections
+        self.connections = [HyperLogLog(GROUP_HLL_PRECISION) for _ in range(SAMPLE_GROUPS)]
+
+    def update(self, batch: PacketBatch):
+        """Consume a batch of sampled packets."""
+        if not len(batch):
+            return
+        rows, hashes = self.sample.hashes(batch)
+        groups = self.sample.groups(hashes)
+        syn = (batch["protocol"][rows] == PROTO_TCP) & ((batch["tcp_flags"][rows] & (TCP_SYN | TCP_ACK)) == TCP_SYN)
+        self.sums[0] += np.bincount(groups, minlength=SAMPLE_GROUPS)
+        self.sums[1] += np.bincount(groups, weights=batch["length"][rows], minlength=SAMPLE_GROUPS).astype(np.int64)
+        self.sums[2] += np.bincount(groups[syn], minlength=SAMPLE_GROUPS)
+        # Sampled hashes share their top bits (below the threshold, and by group),
+        # which HyperLogLog uses as register index, so hash them once more
+        mixed = hash_columns([hashes])
+        tcp = batch["protocol"][rows] == PROTO_TCP
+        for group in np.unique(groups).tolist():
+            self.flows[group].add(mixed[groups == group])
+            self.connections[group].add(mixed[tcp & (groups == group)])
+
+    def merge(self, later: "SampleAccumulator"):
+        """Add the later part's sums and distinct-count estimators."""
+        self.sums += later.sums
+        for mine, theirs in zip(self.flows + self.connections, later.flows + later.connections):
+            mine.merge(theirs)
+
+    def result(self) -> Dict[str, Union[float, int, Dict]]:
+        """Return the sampled totals and their whole-capture estimates with 95% confidence intervals."""
+        packets, nbytes, syns = self.sums
+        flows = np.array([estimator.count() for estimator in self.flows])
+        connections = np.array([estimator.count() for estimator in self.connections])
+        return {
+            "rate": self.sample.rate,
+            "groups": SAMPLE_GROUPS,
+            "confidence": 0.95,
+            "estimates": {name: _extrapolate(values, self.sample.rate)
+                          for name, values in zip(SAMPLE_TOTALS, (packets, nbytes, flows, connections, syns))}
+        }
+
+
+def _extrapolate(values: np.ndarray, rate: float) -> Dict[str, Union[int, float]]:
+    """Whole-capture estimate of a total from its per-group sample sums."""
+    sampled = int(values.sum())
+    estimate = sampled / rate
+    group_estimates = values * SAMPLE_GROUPS / rate
+    spread = float(np.sum((group_estimates - estimate) ** 2)) / (SAMPLE_GROUPS * (SAMPLE_GROUPS - 1))
+    margin = T_QUANTILE_95 * math.sqrt(spread) if rate < 1 else 0.0
+    return {
+        "sampled": sampled,
+        "estimate": round(estimate),
+        "ci_low": round(max(estimate - margin, sampled)),
+        "ci_high": round(estimate + margin)
+    }
+
+
+def extrapolate_results(results: Dict[str, Dict]):
+    """
+    Replace the sample totals of a sampled run's results with their whole-capture estimates.
+
+    Each replaced field gets a "<field>_ci" [low, high] interval next to it.
+    The average throughput is the estimated byte count over the sample's
+    duration. The "sampling" result lists the replaced fields under
+    "extrapolated" and the results holding sample values under "sample_only".
+
+    Args:
+        results (dict): Results of collect_results, including "sampling"
+    """
+    sampling = results["sampling"]
+    estimates = sampling["estimates"]
+    extrapolated: List[str] = []
+
+    def replace(key: str, field: str, estimate: Dict, scale: float = 1.0, digits: int = None):
+        section = results.get(key)
+        if not isinstance(section, dict) or field not in section:
+            return
+        section[field] = round(estimate["estimate"] * scale, digits)
+        section[f"{field}_ci"] = [round(estimate["ci_low"] * scale, digits), round(estimate["ci_high"] * scale, digits)]
+        extrapolated.append(f"{key}.{field}")
+
+    for key, field, name in EXTRAPOLATED_FIELDS:
+        replace(key, field, estimates[name])
+    duration = results.get("capture_stats", {}).get("duration_s", 0)
+    if duration > 0:
+        replace("throughput", "avg_kbps", estimates["bytes"], 8 / (duration * 1000), 2)
+    sampling["extrapolated"] = extrapolated
+    sampling["sample_only"] = [key for key in results if key not in ("sampling", "sketches")]
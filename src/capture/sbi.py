@@ -0,0 +1,391 @@
+"""
+SBI (HTTP/2 over cleartext TCP) request latency between 5G core functions.
+
+Service-based interfaces between AMF, SMF, AUSF, UDM, NRF and friends run
+HTTP/2, here in its cleartext (h2c) form. A connection is picked up when
+the client connection preface is seen; connections upgraded from
+HTTP/1.1 ("Upgrade: h2c") are not followed. From then on each
+direction's TCP byte stream is reassembled in order and cut into frames;
+only HEADERS and CONTINUATION payloads are kept and HPACK-decoded, all
+other frames are skipped without buffering. A header block too large to
+keep would leave the HPACK dynamic table out of step, so the connection
+is counted as desynchronized and dropped. Requests are matched to
+responses by stream id and forgotten once answered, so memory is bounded
+by the open streams and the partial frame of each direction.
+
+Requests are aggregated per (source NF, destination NF, API path). The
+destination NF comes from the service name in the path ("/nudm-sdm/..."
+is UDM), the source NF from the User-Agent NF type that TS 29.500 asks
+clients to send; either falls back to the peer address.
+"""
+import re
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from .batch import PacketBatch, PROTO_TCP, format_address
+from .hpack import HpackDecoder, HpackError
+from .reader import _be32, _take
+from .sketch import QuantileSketch, distribution
+
+# Client connection preface (RFC 9113 section 3.4)
+CONNECTION_PREFACE = b"PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n"
+PREFACE_PREFIX = 0x50524920  # "PRI "
+
+# Frame types and flags
+FRAME_HEADER_LEN = 9
+FRAME_HEADERS = 0x1
+FRAME_RST_STREAM = 0x3
+FRAME_CONTINUATION = 0x9
+FLAG_END_HEADERS = 0x4
+FLAG_PADDED = 0x8
+FLAG_PRIORITY = 0x20
+
+# Largest header block kept while waiting for END_HEADERS
+MAX_HEADER_BLOCK = 1 << 20
+
+# Out-of-order segments held per direction before giving up on the connection
+MAX_HELD_SEGMENTS = 64
+
+# TCP flags that end a connection
+TCP_FIN = 0x01
+TCP_RST = 0x04
+
+# NF types recognised in User-Agent headers and service names
+NF_TYPES = frozenset(("AMF", "SMF", "AUSF", "UDM", "UDR", "UDSF", "NRF", "PCF", "NSSF", "NEF", "BSF",
+                      "CHF", "SMSF", "NWDAF", "SCP", "SEPP", "LMF", "GMLC", "5G_EIR", "NSACF", "AF"))
+
+# Path segments that look like identifiers (SUPI, GPSI, UUIDs, numbers)
+_SERVICE = re.compile(r"^n([a-z0-9]+)-")
+_IDENTIFIER = re.compile(r"^(imsi|imei|imeisv|msisdn|supi|gpsi|suci|nai|extid)-|^[0-9a-fA-F-]{8,}$|\d{4,}")
+
+# Packet columns read by SbiAccumulator
+SBI_FIELDS = ("ts_ns", "protocol", "src_hi", "src_lo", "dst_hi", "dst_lo", "src_port", "dst_port",
+              "tcp_flags", "seq", "payload_offset", "payload_len", "data_offset", "caplen")
+
+SEQ_SPACE = 1 << 32
+NSEC_PER_MSEC = 1_000_000
+
+
+def api_path(path: str) -> str:
+    """
+    Reduce a request path to its API resource, e.g.
+    "/nudm-sdm/v2/imsi-001010000000001/am-data?plmn-id=..." -> "/nudm-sdm/v2/{id}/am-data".
+    """
+    path = path.split("?", 1)[0]
+    return "/".join("{id}" if _IDENTIFIER.search(segment) else segment for segment in path.split("/"))
+
+
+def service_nf(path: str) -> Optional[str]:
+    """NF type serving an SBI path, from its service name."""
+    match = _SERVICE.match(path.lstrip("/"))
+    nf = match.group(1).upper() if match else None
+    return nf if nf in NF_TYPES else None
+
+
+def agent_nf(user_agent: Optional[str]) -> Optional[str]:
+    """NF type a client announces in its User-Agent header."""
+    if not user_agent:
+        return None
+    nf = re.split(r"[-/ ]", user_agent, 1)[0].upper()
+    return nf if nf in NF_TYPES else None
+
+
+def _direction_hash(src_hi, src_lo, src_port, dst_hi, dst_lo, dst_port) -> np.ndarray:
+    """64-bit hash of a connection direction, used to pre-select packets."""
+    with np.errstate(over="ignore"):
+        h = np.uint64(0x9E3779B97F4A7C15) * (np.asarray(src_lo, dtype=np.uint64) ^ np.uint64(0x632BE59BD9B4E019))
+        for value in (src_hi, dst_lo, dst_hi, src_port, dst_port):
+            h = (h ^ np.asarray(value, dtype=np.uint64)) * np.uint64(0xBF58476D1CE4E5B9)
+            h ^= h >> np.uint64(31)
+    return h
+
+
+class _Direction:
+    """Reassembly and frame state of one direction of an HTTP/2 connection."""
+
+    def __init__(self, next_seq: Optional[int]):
+        self.next_seq = next_seq
+        self.held: Dict[int, Tuple[bytes, int]] = {}
+        self.buffer = bytearray()
+        self.skip = 0
+        self.preface = 0
+        self.decoder = HpackDecoder()
+        self.block = None
+        self.block_stream = 0
+        self.block_flags = 0
+
+
+class _Connection:
+    """State of one HTTP/2 connection: both directions and its open streams."""
+
+    def __init__(self, client: tuple, server: tuple, seq: int):
+        self.client, self.server = client, server
+        # The client's first segment starts with the preface
+        self.directions = {client: _Direction(seq), server: _Direction(None)}
+        self.directions[client].preface = len(CONNECTION_PREFACE)
+        # stream id -> (request ts, source NF, destination NF, API path)
+        self.streams: Dict[int, tuple] = {}
+
+
+class SbiAccumulator:
+    """
+    HTTP/2 request latency and error matrix per (source NF, destination NF, API path).
+
+    Latency runs from the packet completing a request's header block to
+    the packet completing the response's. A response status of 400 or
+    above, or a stream reset before the response, counts as an error.
+
+    HPACK state cannot be recovered in the middle of a connection, so this
+    accumulator needs the capture in one ordered pass (``sequential``);
+    parallel analysis runs it as a single task.
+    """
+
+    fields = SBI_FIELDS
+
+    sequential = True
+
+    def __init__(self):
+        self.connections: Dict[tuple, _Connection] = {}
+        self._hashes = np.zeros(0, dtype=np.uint64)
+        self._hashes_stale = False
+        # (source, destination, path) -> [latency sketch (ms), errors, resets]
+        self.matrix: Dict[tuple, list] = {}
+        self.unanswered = 0
+        self.desynchronized = 0
+
+    def update(self, batch: PacketBatch):
+        """Consume a batch of packets."""
+        if not len(batch) or batch.buffer is None:
+            return
+        raw = batch.buffer
+        tcp = batch["protocol"] == PROTO_TCP
+        start = batch["payload_offset"]
+        length = np.minimum(batch["payload_len"], np.maximum(batch["data_offset"] + batch["caplen"] - start, 0))
+
+        # Packets of known connections, plus those of connections opened in this batch
+        rows = np.flatnonzero(tcp & ((batch["payload_len"] > 0) | ((batch["tcp_flags"] & (TCP_FIN | TCP_RST)) != 0)))
+        preface = (length[rows] >= len(CONNECTION_PREFACE)) & (_be32(_take(raw, start[rows], 4), 0) == PREFACE_PREFIX)
+        if self._hashes_stale:
+            self._hashes = _direction_hash(*zip(*self.connections.keys())) if self.connections \
+                else np.zeros(0, dtype=np.uint64)
+            self._hashes_stale = False
+        if not preface.any() and not self._hashes.size:
+            return
+        src = [batch[name][rows] for name in ("src_hi", "src_lo", "src_port")]
+        dst = [batch[name][rows] for name in ("dst_hi", "dst_lo", "dst_port")]
+        hashes = _direction_hash(*src, *dst)
+        opening = _direction_hash(*[column[preface] for column in dst + src])
+        keep = np.isin(hashes, np.concatenate([self._hashes, hashes[preface], opening]))
+        rows, preface = rows[keep], preface[keep]
+
+        columns = zip(batch["src_hi"][rows].tolist(), batch["src_lo"][rows].tolist(), batch["src_port"][rows].tolist(),
+                      batch["dst_hi"][rows].tolist(), batch["dst_lo"][rows].tolist(), batch["dst_port"][rows].tolist(),
+                      batch["ts_ns"][rows].tolist(), batch["seq"][rows].tolist(), batch["tcp_flags"][rows].tolist(),
+                      start[rows].tolist(), length[rows].tolist(), batch["payload_len"][rows].tolist(),
+                      preface.tolist())
+        for src_hi, src_lo, src_port, dst_hi, dst_lo, dst_port, ts, seq, flags, offset, size, wire, opens in columns:
+            src, dst = (src_hi, src_lo, src_port), (dst_hi, dst_lo, dst_port)
+            key = src + dst
+            connection = self.connections.get(key)
+            if connection is None:
+                if not opens or not raw[offset:offset + size].tobytes().startswith(CONNECTION_PREFACE):
+                    continue
+                connection = _Connection(src, dst, seq)
+                self.connections[key] = self.connections[dst + src] = connection
+                self._hashes_stale = True
+            if wire:
+                if size < wire:
+                    # Payload cut short by the snap length: the stream cannot be followed
+                    self._close(connection, desynchronized=True)
+                    continue
+                if not self._segment(connection, src, seq, raw[offset:offset + size].tobytes(), ts):
+                    self._close(connection, desynchronized=True)
+                    continue
+            if flags & (TCP_FIN | TCP_RST):
+                self._close(connection)
+
+    def _segment(self, connection: _Connection, side: tuple, seq: int, payload: bytes, ts: int) -> bool:
+        """
+        Feed one TCP segment into a direction, in sequence order.
+
+        Returns:
+            bool: False when the direction can no longer be followed
+        """
+        direction = connection.directions[side]
+        if direction.next_seq is None:
+            direction.next_seq = seq
+        delta = (seq - direction.next_seq) % SEQ_SPACE
+        if delta >= SEQ_SPACE // 2:
+            # Retransmission, possibly overlapping new data
+            overlap = SEQ_SPACE - delta
+            if overlap >= len(payload):
+                return True
+            payload, seq = payload[overlap:], direction.next_seq
+        elif delta:
+            direction.held[seq] = (payload, ts)
+            return len(direction.held) <= MAX_HELD_SEGMENTS
+
+        if not self._consume(connection, side, direction, payload, ts):
+            return False
+        direction.next_seq = (seq + len(payload)) % SEQ_SPACE
+        while direction.next_seq in direction.held:
+            payload, held_ts = direction.held.pop(direction.next_seq)
+            if not self._consume(connection, side, direction, payload, max(ts, held_ts)):
+                return False
+            direction.next_seq = (direction.next_seq + len(payload)) % SEQ_SPACE
+        return True
+
+    def _consume(self, connection: _Connection, side: tuple, direction: _Direction, data: bytes, ts: int) -> bool:
+        """
+        Cut in-order bytes of one direction into frames.
+
+        Returns:
+            bool: False when a header block is too large to keep, which leaves
+                  the direction's HPACK dynamic table out of step
+        """
+        if direction.preface:
+            used = min(direction.preface, len(data))
+            direction.preface -= used
+            data = data[used:]
+        if direction.skip:
+            used = min(direction.skip, len(data))
+            direction.skip -= used
+            data = data[used:]
+
+        buffer = direction.buffer
+        buffer += data
+        pos = 0
+        while len(buffer) - pos >= FRAME_HEADER_LEN:
+            length = int.from_bytes(buffer[pos:pos + 3], "big")
+            frame_type, flags = buffer[pos + 3], buffer[pos + 4]
+            stream = int.from_bytes(buffer[pos + 5:pos + 9], "big") & 0x7FFFFFFF
+            if frame_type in (FRAME_HEADERS, FRAME_CONTINUATION) and length > MAX_HEADER_BLOCK:
+                return False
+            if frame_type not in (FRAME_HEADERS, FRAME_CONTINUATION, FRAME_RST_STREAM) or length > MAX_HEADER_BLOCK:
+                # Skip the payload without buffering it
+                available = len(buffer) - pos - FRAME_HEADER_LEN
+                if available < length:
+                    direction.skip = length - available
+                    pos = len(buffer)
+                    break
+                pos += FRAME_HEADER_LEN + length
+                continue
+            if len(buffer) - pos - FRAME_HEADER_LEN < length:
+                break
+            payload = bytes(buffer[pos + FRAME_HEADER_LEN:pos + FRAME_HEADER_LEN + length])
+            pos += FRAME_HEADER_LEN + length
+            if not self._frame(connection, side, direction, frame_type, flags, stream, payload, ts):
+                return False
+        del buffer[:pos]
+        return True
+
+    def _frame(self, connection: _Connection, side: tuple, direction: _Direction,
+               frame_type: int, flags: int, stream: int, payload: bytes, ts: int) -> bool:
+        """
+        Handle one complete HEADERS, CONTINUATION or RST_STREAM frame.
+
+        Returns:
+            bool: False when the header block grew too large to keep
+        """
+        if frame_type == FRAME_RST_STREAM:
+            request = connection.streams.pop(stream, None)
+            if request is not None:
+                self._record(request, ts, error=True, reset=True)
+            return True
+        if frame_type == FRAME_HEADERS:
+            start, end = 0, len(payload)
+            if flags & FLAG_PADDED and payload:
+                start, end = 1, len(payload) - payload[0]
+            if flags & FLAG_PRIORITY:
+                start += 5
+            direction.block = bytearray(payload[start:max(end, start)])
+            direction.block_stream, direction.block_flags = stream, flags
+        elif direction.block is not None and stream == direction.block_stream:
+            direction.block += payload
+            direction.block_flags |= flags
+        else:
+            return True
+        if len(direction.block) > MAX_HEADER_BLOCK:
+            # Dropping the block would leave the dynamic table out of step
+            return False
+        if not direction.block_flags & FLAG_END_HEADERS:
+            return True
+
+        block, direction.block = bytes(direction.block), None
+        try:
+            headers = dict(direction.decoder.decode(block))
+        except HpackError:
+            # The dynamic table is now out of step; later blocks may still decode
+            return True
+        if side == connection.client:
+            if ":path" in headers:
+                path = headers[":path"]
+                source = agent_nf(headers.get("user-agent")) or format_address(*connection.client[:2])
+                destination = service_nf(path) or format_address(*connection.server[:2])
+                connection.streams[stream] = (ts, source, destination, api_path(path))
+        elif ":status" in headers:
+            request = connection.streams.pop(stream, None)
+            if request is not None:
+                status = int(headers[":status"]) if headers[":status"].isdigit() else 0
+                self._record(request, ts, error=status >= 400)
+        return True
+
+    def _record(self, request: tuple, ts: int, error: bool, reset: bool = False):
+        """Add one finished request to the matrix."""
+        requested, source, destination, path = request
+        cell = self.matrix.setdefault((source, destination, path), [QuantileSketch(), 0, 0])
+        if not reset:
+            cell[0].add_value((ts - requested) / NSEC_PER_MSEC)
+        cell[1] += error
+        cell[2] += reset
+
+    def _close(self, connection: _Connection, desynchronized: bool = False):
+        """Forget a connection; its open streams count as unanswered."""
+        self.unanswered += len(connection.streams)
+        self.desynchronized += desynchronized
+        self.connections.pop(connection.client + connection.server, None)
+        self.connections.pop(connection.server + connection.client, None)
+        self._hashes_stale = True
+
+    def merge(self, later: "SbiAccumulator"):
+        """
+        Fold in the state of a later part of the capture.
+
+        Only finished requests carry over; connections that span the
+        boundary cannot be resumed without their HPACK state.
+        """
+        for key, (sketch, errors, resets) in later.matrix.items():
+            cell = self.matrix.setdefault(key, [QuantileSketch(), 0, 0])
+            cell[0].merge(sketch)
+            cell[1] += errors
+            cell[2] += resets
+        self.unanswered += later.unanswered + sum(len(c.streams) for c in set(self.connections.values()))
+        self.desynchronized += later.desynchronized
+        self.connections = later.connections
+        self._hashes_stale = True
+
+    def result(self) -> Dict[str, Union[int, List[Dict]]]:
+        """Return the per-(source NF, destination NF, API path) latency and error matrix."""
+        matrix = []
+        for (source, destination, path), (sketch, errors, resets) in self.matrix.items():
+            requests = sketch.count + resets
+            matrix.append({
+                "source": source,
+                "destination": destination,
+                "path": path,
+                "requests": requests,
+                "errors": errors,
+                "resets": resets,
+                "error_rate": round(errors / requests, 4) if requests else 0,
+                "latency_ms": distribution(sketch)
+            })
+        matrix.sort(key=lambda cell: (-cell["requests"], cell["source"], cell["destination"], cell["path"]))
+        open_streams = sum(len(connection.streams) for connection in set(self.connections.values()))
+        return {
+            "requests": sum(cell["requests"] for cell in matrix),
+            "errors": sum(cell["errors"] for cell in matrix),
+            "unanswered": self.unanswered + open_streams,
+            "desynchronized_connections": self.desynchronized,
+            "matrix": matrix
+        }
@@ -0,0 +1,397 @@
+"""
+Mergeable fixed-size sketches.
+
+QuantileSketch is a DDSketch: positive values are counted in logarithmic
+bins whose width keeps every reported quantile within a fixed relative
+error of the true sample quantile. Bin counts simply add up, so sketches
+built from different parts of a capture, or from different captures,
+merge exactly. The number of bins is capped; past the cap the lowest bins
+are folded together, which only affects the accuracy of low quantiles.
+
+SpaceSaving keeps the heaviest keys of a weighted stream with bounded
+overestimation, and HyperLogLog estimates distinct counts. Both work on
+64-bit key hashes from ``hash_columns`` and keep the same size however
+many keys a capture holds.
+"""
+import math
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Relative accuracy of reported quantiles
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+# Bins kept per sketch; 2048 bins at 1% cover values over a range of about 1e17
+DEFAULT_MAX_BINS = 2048
+
+# Values at or below this are counted as zero
+MIN_INDEXABLE_VALUE = 1e-9
+
+# Scalar values buffered by add_value before they are binned together
+VALUE_BUFFER_SIZE = 4096
+
+# Quantiles reported by summary(), as result key suffix -> quantile
+SUMMARY_QUANTILES = {"p50": 0.5, "p90": 0.9, "p99": 0.99, "p99_9": 0.999}
+
+# Keys monitored by a SpaceSaving summary
+DEFAULT_TOP_CAPACITY = 512
+
+# HyperLogLog register index bits; 2^12 one-byte registers, about 1.6% standard error
+DEFAULT_HLL_PRECISION = 12
+
+# splitmix64 constants used by hash_columns
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+
+
+class QuantileSketch:
+    """
+    Logarithmically binned value counts with exact count, sum, min and max.
+    """
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY, max_bins: int = DEFAULT_MAX_BINS):
+        """
+        Args:
+            relative_accuracy (float, optional): Relative error bound of quantiles
+            max_bins (int, optional): Upper bound on the number of bins
+        """
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        # counts[i] holds values whose bin key is offset + i
+        self.offset = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.zeros = 0
+        self._count = 0
+        self._total = 0.0
+        self._min = math.inf
+        self._max = -math.inf
+        self._buffer: List[float] = []
+
+    @property
+    def count(self) -> int:
+        self._flush()
+        return self._count
+
+    @property
+    def total(self) -> float:
+        self._flush()
+        return self._total
+
+    @property
+    def min(self) -> float:
+        self._flush()
+        return self._min
+
+    @property
+    def max(self) -> float:
+        self._flush()
+        return self._max
+
+    def add(self, values):
+        """Add an array of values."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if not values.size:
+            return
+        self._count += int(values.size)
+        self._total += float(values.sum())
+        self._min = min(self._min, float(values.min()))
+        self._max = max(self._max, float(values.max()))
+
+        positive = values[values > MIN_INDEXABLE_VALUE]
+        self.zeros += int(values.size - positive.size)
+        if not positive.size:
+            return
+        keys = np.ceil(np.log(positive) / self._log_gamma).astype(np.int64)
+        first = int(keys.min())
+        self._add_counts(first, np.bincount(keys - first))
+
+    def add_value(self, value: float):
+        """Add a single value; values are binned in groups to keep this cheap."""
+        self._buffer.append(value)
+        if len(self._buffer) >= VALUE_BUFFER_SIZE:
+            self._flush()
+
+    def _flush(self):
+        """Bin the buffered single values."""
+        if self._buffer:
+            values, self._buffer = self._buffer, []
+            self.add(values)
+
+    def _add_counts(self, first: int, counts: np.ndarray):
+        """Add bin counts for consecutive keys starting at first, folding the lowest bins past the cap."""
+        if not self.counts.size:
+            start, end = first, first + len(counts)
+        else:
+            start = min(self.offset, first)
+            end = max(self.offset + len(self.counts), first + len(counts))
+        grown = np.zeros(end - start, dtype=np.int64)
+        if self.counts.size:
+            grown[self.offset - start:self.offset - start + len(self.counts)] += self.counts
+        grown[first - start:first - start + len(counts)] += counts
+        if len(grown) > self.max_bins:
+            folded = len(grown) - self.max_bins
+            grown[folded] += grown[:folded].sum()
+            grown, start = grown[folded:], start + folded
+        self.offset, self.counts = start, grown
+
+    def merge(self, other: "QuantileSketch"):
+        """
+        Fold another sketch into this one.
+
+        Raises:
+            ValueError: If the sketches use different relative accuracies
+        """
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge quantile sketches with different relative accuracies")
+        self._count += other.count
+        self._total += other.total
+        self._min = min(self._min, other.min)
+        self._max = max(self._max, other.max)
+        self.zeros += other.zeros
+        if other.counts.size:
+            self._add_counts(other.offset, other.counts)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimate a quantile.
+
+        Args:
+            q (float): Quantile between 0 and 1
+
+        Returns:
+            float: Estimated value, or None for an empty sketch
+        """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zeros:
+            return max(self.min, 0.0)
+        position = int(np.searchsorted(np.cumsum(self.counts), rank - self.zeros, side="right"))
+        position = min(position, len(self.counts) - 1)
+        value = 2 * self.gamma ** (self.offset + position) / (self.gamma + 1)
+        return min(max(value, self.min), self.max)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self, digits: int = 3) -> Dict[str, float]:
+        """Percentiles named as in SUMMARY_QUANTILES; empty for an empty sketch."""
+        if not self.count:
+            return {}
+        return {name: round(self.quantile(q), digits) for name, q in SUMMARY_QUANTILES.items()}
+
+    def to_dict(self) -> Dict:
+        """Compact JSON-serializable form, e.g. for merging across captures."""
+        self._flush()
+        return {
+            "relative_accuracy": self.relative_accuracy, "max_bins": self.max_bins,
+            "offset": self.offset, "counts": self.counts.tolist(), "zeros": self.zeros,
+            "count": self.count, "total": self.total,
+            "min": self.min if self.count else None, "max": self.max if self.count else None
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "QuantileSketch":
+        """Rebuild a sketch saved by ``to_dict``."""
+        sketch = cls(data["relative_accuracy"], data["max_bins"])
+        sketch.offset = data["offset"]
+        sketch.counts = np.asarray(data["counts"], dtype=np.int64)
+        sketch.zeros = data["zeros"]
+        sketch._count = data["count"]
+        sketch._total = data["total"]
+        if sketch._count:
+            sketch._min, sketch._max = data["min"], data["max"]
+        return sketch
+
+
+def distribution(sketch: QuantileSketch) -> Dict[str, float]:
+    """Summary of a latency sketch in milliseconds."""
+    if not sketch.count:
+        return {}
+    summary = sketch.summary()
+    return {
+        "avg": round(sketch.mean, 3),
+        "min": round(sketch.min, 3),
+        **summary,
+        "max": round(sketch.max, 3)
+    }
+
+
+def _mix64(values: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer, applied element-wise to uint64 values."""
+    with np.errstate(over="ignore"):
+        values = (values ^ (values >> np.uint64(30))) * _MIX1
+        values = (values ^ (values >> np.uint64(27))) * _MIX2
+    return values ^ (values >> np.uint64(31))
+
+
+def hash_columns(columns: List[np.ndarray]) -> np.ndarray:
+    """
+    Well-mixed 64-bit hash of each row of a set of integer columns.
+
+    The hash depends only on the values, so the same key hashes the same in
+    every batch, worker and capture.
+
+    Args:
+        columns (list): Integer arrays of equal length
+
+    Returns:
+        np.ndarray: uint64 hash per row
+    """
+    hashes = np.zeros(len(columns[0]), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for column in columns:
+            hashes = _mix64(hashes ^ _mix64(np.asarray(column).astype(np.uint64) + _GOLDEN))
+    return hashes
+
+
+class SpaceSaving:
+    """
+    Heaviest keys of a weighted stream, by the Space-Saving algorithm.
+
+    At most ``capacity`` keys are monitored. A key that is not monitored
+    takes over the count of the lightest monitored key, which becomes its
+    error, so each reported count is an upper bound on the key's true
+    weight and exceeds it by at most ``error``. Every key heavier than the
+    total weight divided by the capacity is guaranteed to be monitored.
+
+    Updates and merges are batched: the incoming weights are aggregated per
+    key first and combined with the summary in one vectorized step, as in
+    the merge of two Space-Saving summaries.
+    """
+
+    def __init__(self, width: int, capacity: int = DEFAULT_TOP_CAPACITY):
+        """
+        Args:
+            width (int): Number of uint64 columns of a key
+            capacity (int, optional): Keys monitored
+        """
+        self.capacity = capacity
+        self.ids = np.zeros(0, dtype=np.uint64)
+        self.keys = np.zeros((0, width), dtype=np.uint64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.errors = np.zeros(0, dtype=np.int64)
+        self.total = 0
+
+    @property
+    def floor(self) -> int:
+        """Upper bound on the weight of any key that is not monitored."""
+        return int(self.counts.min()) if len(self.counts) >= self.capacity else 0
+
+    def add(self, keys: np.ndarray, weights):
+        """
+        Add weighted keys.
+
+        Args:
+            keys (np.ndarray): (n, width) key columns
+            weights: Weight per key, or one weight for all
+        """
+        if not len(keys):
+            return
+        keys = np.asarray(keys, dtype=np.uint64)
+        weights = np.broadcast_to(np.asarray(weights, dtype=np.int64), (len(keys),))
+        ids, first, inverse = np.unique(hash_columns(list(keys.T)), return_index=True, return_inverse=True)
+        sums = np.bincount(inverse, weights=weights, minlength=len(ids)).astype(np.int64)
+        self.total += int(weights.sum())
+        self._combine(ids, keys[first], sums, np.zeros(len(ids), dtype=np.int64), 0)
+
+    def merge(self, other: "SpaceSaving"):
+        """Fold another summary of the same key width into this one."""
+        self.total += other.total
+        self._combine(other.ids, other.keys, other.counts, other.errors, other.floor)
+
+    def _combine(self, ids: np.ndarray, keys: np.ndarray, counts: np.ndarray, errors: np.ndarray, floor: int):
+        """Add a summary whose unmonitored keys weigh at most floor, keeping the heaviest keys."""
+        mine = len(self.ids)
+        all_ids = np.concatenate([self.ids, ids])
+        unique, first, inverse = np.unique(all_ids, return_index=True, return_inverse=True)
+        in_mine = np.zeros(len(unique), dtype=bool)
+        in_mine[inverse[:mine]] = True
+        in_other = np.zeros(len(unique), dtype=bool)
+        in_other[inverse[mine:]] = True
+        # A key missing from one side may still have weighed up to that side's floor there
+        missing = np.where(in_mine, 0, self.floor) + np.where(in_other, 0, floor)
+        merged_counts = np.bincount(inverse, weights=np.concatenate([self.counts, counts]),
+                                    minlength=len(unique)).astype(np.int64) + missing
+        merged_errors = np.bincount(inverse, weights=np.concatenate([self.errors, errors]),
+                                    minlength=len(unique)).astype(np.int64) + missing
+        merged_keys = np.concatenate([self.keys, keys])[first]
+        if len(unique) > self.capacity:
+            keep = np.argpartition(-merged_counts, self.capacity - 1)[:self.capacity]
+            unique, merged_keys = unique[keep], merged_keys[keep]
+            merged_counts, merged_errors = merged_counts[keep], merged_errors[keep]
+        self.ids, self.keys, self.counts, self.errors = unique, merged_keys, merged_counts, merged_errors
+
+    def top(self, k: int) -> List[tuple]:
+        """
+        The k heaviest monitored keys.
+
+        Returns:
+            list: (key tuple, count, error), heaviest first
+        """
+        order = np.lexsort((self.ids, -self.counts))[:k]
+        return [(tuple(key), count, error) for key, count, error in
+                zip(self.keys[order].tolist(), self.counts[order].tolist(), self.errors[order].tolist())]
+
+
+class HyperLogLog:
+    """
+    Distinct count estimate from 2^precision one-byte registers.
+
+    Each hash picks a register with its top bits and offers the position of
+    the first set bit among the rest; the register keeps the maximum. The
+    estimate has a standard error of about 1.04 / sqrt(2^precision), and
+    small counts fall back to linear counting, which is close to exact.
+    Merging takes the register-wise maximum.
+    """
+
+    def __init__(self, precision: int = DEFAULT_HLL_PRECISION):
+        """
+        Args:
+            precision (int, optional): Register index bits, 4 to 16
+        """
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, hashes: np.ndarray):
+        """Add 64-bit hashes, e.g. from hash_columns."""
+        if not len(hashes):
+            return
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        rest = hashes << np.uint64(self.precision)
+        # Bit length of the remaining bits, from the exact float exponents of their 32-bit halves
+        high, low = (rest >> np.uint64(32)).astype(np.float64), (rest & np.uint64(0xFFFFFFFF)).astype(np.float64)
+        length = np.where(high > 0, 32 + np.frexp(high)[1], np.frexp(low)[1])
+        rank = np.minimum(65 - length, 65 - self.precision).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: "HyperLogLog"):
+        """
+        Fold another estimator into this one.
+
+        Raises:
+            ValueError: If the estimators use different precisions
+        """
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog estimators with different precisions")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> int:
+        """Estimated number of distinct hashes added."""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / float(np.sum(np.exp2(-self.registers.astype(np.float64))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    @property
+    def relative_error(self) -> float:
+        """Standard error of the estimate, relative to the true count."""
+        return 1.04 / math.sqrt(len(self.registers))
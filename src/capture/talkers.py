@@ -0,0 +1,134 @@
+"""
+Top talkers and distinct counts in fixed memory.
+
+Exact per-flow tables grow with the number of flows, which on large
+captures costs far more than answering "who sends the most" and "how many
+are there" needs. This accumulator instead keeps Space-Saving summaries of
+the heaviest flows, IP addresses and GTP-U tunnels by bytes and by packets,
+and HyperLogLog estimates of the number of distinct flows, addresses,
+tunnels and tunnelled (inner) addresses. Its state has the same size, a
+few hundred kilobytes at most, whatever the size of the capture, and
+partial states merge without loss.
+"""
+from typing import Dict, List, Union
+
+import numpy as np
+
+from .batch import PacketBatch, PROTOCOLS, format_address
+from .flows import FlowTable, FLOW_FIELDS
+from .gtpu import GTPU_FIELDS, decapsulate
+from .sketch import DEFAULT_HLL_PRECISION, DEFAULT_TOP_CAPACITY, HyperLogLog, SpaceSaving, hash_columns
+
+# Inner columns decoded from GTP-U packets
+INNER_FIELDS = ("ip_version", "src_hi", "src_lo", "dst_hi", "dst_lo")
+
+# Key width (uint64 columns) of each heavy-hitter table
+KEY_WIDTHS = {"flows": 7, "addresses": 2, "teids": 1}
+
+# Weights ranked in each table
+WEIGHTS = ("bytes", "packets")
+
+
+class HeavyHitterAccumulator:
+    """
+    Heaviest flows, addresses and TEIDs, plus distinct counts, from sketches.
+
+    Addresses are credited with the traffic they send and receive. Reported
+    volumes are upper bounds that exceed the true value by at most their
+    "error"; keys heavier than total / capacity are never missed.
+    """
+
+    fields = tuple(dict.fromkeys(FLOW_FIELDS + GTPU_FIELDS + ("length",) + INNER_FIELDS))
+    uses_flows = True
+
+    def __init__(self, top: int = 20, capacity: int = DEFAULT_TOP_CAPACITY,
+                 precision: int = DEFAULT_HLL_PRECISION):
+        """
+        Args:
+            top (int, optional): Entries listed per table
+            capacity (int, optional): Keys monitored per table; counts are
+                                      exact while a table has fewer keys
+            precision (int, optional): HyperLogLog register index bits
+        """
+        self.top = top
+        # (table, weight) -> summary
+        self.tables: Dict[tuple, SpaceSaving] = {
+            (table, weight): SpaceSaving(width, max(capacity, top))
+            for table, width in KEY_WIDTHS.items() for weight in WEIGHTS
+        }
+        self.distinct: Dict[str, HyperLogLog] = {
+            name: HyperLogLog(precision) for name in ("flows", "addresses", "teids", "inner_addresses")
+        }
+
+    def update(self, batch: PacketBatch, flows: FlowTable = None):
+        """Consume a batch of packets, reusing its flow table when given."""
+        if not len(batch):
+            return
+        if flows is None:
+            flows = FlowTable(batch)
+        if len(flows):
+            starts = flows.offsets[:-1]
+            nbytes = np.add.reduceat(flows.column("length").astype(np.int64), starts)
+            self._add("flows", flows.keys, nbytes, np.diff(flows.offsets))
+            self.distinct["flows"].add(hash_columns(list(flows.keys.T)))
+
+        ip = batch["ip_version"] != 0
+        addresses = np.concatenate([
+            np.stack([batch["src_hi"][ip], batch["src_lo"][ip]], axis=1),
+            np.stack([batch["dst_hi"][ip], batch["dst_lo"][ip]], axis=1)
+        ])
+        nbytes = np.tile(batch["length"][ip].astype(np.int64), 2)
+        self._add("addresses", addresses, nbytes, 1)
+        self.distinct["addresses"].add(hash_columns(list(addresses.T)))
+
+        if batch.buffer is None:
+            return
+        inner = decapsulate(batch, fields=INNER_FIELDS)
+        if not len(inner):
+            return
+        teids = inner["teid"].astype(np.uint64)[:, None]
+        self._add("teids", teids, inner["length"].astype(np.int64), 1)
+        self.distinct["teids"].add(hash_columns([teids[:, 0]]))
+        ip = inner["ip_version"] != 0
+        for side in ("src", "dst"):
+            self.distinct["inner_addresses"].add(hash_columns([inner[f"{side}_hi"][ip], inner[f"{side}_lo"][ip]]))
+
+    def _add(self, table: str, keys: np.ndarray, nbytes: np.ndarray, packets):
+        """Add keys weighted by bytes and by packets to both summaries of a table."""
+        self.tables[(table, "bytes")].add(keys, nbytes)
+        self.tables[(table, "packets")].add(keys, packets)
+
+    def merge(self, later: "HeavyHitterAccumulator"):
+        """Fold the later part's summaries and distinct-count estimators into ours."""
+        for key, summary in later.tables.items():
+            self.tables[key].merge(summary)
+        for name, estimator in later.distinct.items():
+            self.distinct[name].merge(estimator)
+
+    def result(self) -> Dict[str, Union[Dict, float]]:
+        """Return the top entries of every table and the distinct-count estimates."""
+        top: Dict[str, Dict[str, List[Dict]]] = {}
+        for (table, weight), summary in self.tables.items():
+            top.setdefault(table, {})[f"by_{weight}"] = [
+                dict(_describe(table, key), **{weight: count, "error": error})
+                for key, count, error in summary.top(self.top)
+            ]
+        return {
+            "distinct": {name: estimator.count() for name, estimator in self.distinct.items()},
+            "distinct_relative_error": round(self.distinct["flows"].relative_error, 4),
+            "top": top
+        }
+
+
+def _describe(table: str, key: tuple) -> Dict[str, Union[str, int]]:
+    """Readable fields of a heavy-hitter key."""
+    if table == "flows":
+        protocol, a_hi, a_lo, b_hi, b_lo, a_port, b_port = key
+        return {
+            "protocol": PROTOCOLS[protocol],
+            "endpoint_a": f"{format_address(a_hi, a_lo)}:{a_port}",
+            "endpoint_b": f"{format_address(b_hi, b_lo)}:{b_port}"
+        }
+    if table == "addresses":
+        return {"address": format_address(*key)}
+    return {"teid": key[0]}
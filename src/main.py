@@ -24,6 +24,9 @@ if project_dir not in sys.path:
 # Import project modules
 from src.utils import load_config, check_pcap_file, ensure_output_dir, setup_logger
 from src.crews.modem_intelligence_crew import create_modem_intelligence_crew
+from src.capture.cache import CaptureCache
+from src.capture.fleet import expand_captures, analyze_fleet
+from src.capture.merge import analyze_merged, parse_clock_offset
 
 def parse_arguments():
     """Parse command line arguments."""
@@ -37,6 +40,36 @@ def parse_arguments():
         help="Path to the PCAP file for analysis"
     )
     
+    parser.add_argument(
+        "--batch",
+        dest="batch",
+        help="Directory or glob of PCAP files to analyze concurrently (metrics only)"
+    )
+    
+    parser.add_argument(
+        "--batch-workers",
+        dest="batch_workers",
+        type=int,
+        help="Worker processes for --batch (defaults to PCAP_BATCH_WORKERS or the CPU count)"
+    )
+    
+    parser.add_argument(
+        "--merge",
+        dest="merge",
+        nargs="+",
+        metavar="PCAP",
+        help="PCAP files from separate taps (e.g. N2, N3, N4) to analyze as one timestamp-ordered stream (metrics only)"
+    )
+    
+    parser.add_argument(
+        "--clock-offset",
+        dest="clock_offsets",
+        action="append",
+        default=[],
+        metavar="PCAP=OFFSET",
+        help="Shift a --merge capture's timestamps, e.g. n3.pcap=+1.5ms or n2.pcap=-200us (repeatable)"
+    )
+    
     parser.add_argument(
         "--output-dir", 
         dest="output_dir",
@@ -80,6 +113,19 @@ def main():
     log_file = os.path.join(config["output_dir"], f"modem_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
     logger = setup_logger(log_file=log_file, level=logging.INFO if config["verbose_level"] > 0 else logging.WARNING)
     
+    # Batch mode: metrics for many captures, no agent run
+    if args.batch:
+        ensure_output_dir(config["output_dir"])
+        os.environ["OUTPUT_DIR"] = config["output_dir"]
+        workers = args.batch_workers or int(os.getenv("PCAP_BATCH_WORKERS", "0")) or None
+        sys.exit(run_batch(args.batch, config["output_dir"], workers, logger))
+    
+    # Merge mode: metrics for several taps read as one stream, no agent run
+    if args.merge:
+        ensure_output_dir(config["output_dir"])
+        os.environ["OUTPUT_DIR"] = config["output_dir"]
+        sys.exit(run_merge(args.merge, args.clock_offsets, config["output_dir"], logger))
+    
     # Ensure the PCAP file exists
     if not check_pcap_file(config["pcap_file"]):
         logger.error(f"PCAP file not found or not readable: {config['pcap_file']}")
@@ -93,6 +139,10 @@ def main():
     logger.info(f"Output directory: {config['output_dir']}")
     logger.info(f"Using model: {config['model_name']}")
     
+    # Let the agents' PCAP tool analyze the same capture and share its parse cache
+    os.environ["PCAP_FILE_PATH"] = config["pcap_file"]
+    os.environ["OUTPUT_DIR"] = config["output_dir"]
+
     # Run PCAP analysis to get real metrics
     try:
         analyzer = PcapAnalyzerTool(pcap_file=config["pcap_file"])
@@ -240,6 +290,98 @@ def main():
         print(f"\n❌ Error during analysis: {str(e)}")
         sys.exit(1)
 
+def run_batch(pattern, output_dir, workers, logger):
+    """
+    Analyze every capture matched by a directory or glob and write fleet results.
+    
+    One metrics record per capture is written to a JSON Lines file and the
+    fleet-level aggregate to a JSON file, both in the output directory.
+    
+    Args:
+        pattern (str): Directory or glob of capture files
+        output_dir (str): Directory to save the results
+        workers (int): Worker pool size, or None for the CPU count
+        logger: Logger instance
+        
+    Returns:
+        int: Process exit code
+    """
+    paths = expand_captures(pattern)
+    if not paths:
+        logger.error(f"No capture files found for: {pattern}")
+        return 1
+    
+    # Analyzer settings (batch size, metric options, filter, sampling, cache) come from .env
+    analyzer = PcapAnalyzerTool()
+    metric_names, options, packet_filter = analyzer.analysis_settings()
+    cache = CaptureCache(analyzer.cache_dir, analyzer.cache_max_bytes) if analyzer.cache_dir else None
+    logger.info(f"Analyzing {len(paths)} capture files from {pattern}")
+    records, summary = analyze_fleet(
+        paths, metric_names, options, workers, analyzer.batch_size, cache, packet_filter
+    )
+    
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    records_file = os.path.join(output_dir, f"fleet_metrics_{timestamp}.jsonl")
+    with open(records_file, 'w') as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+    summary_file = os.path.join(output_dir, f"fleet_summary_{timestamp}.json")
+    with open(summary_file, 'w') as f:
+        json.dump(summary, f, indent=2)
+    
+    for path, error in summary["errors"].items():
+        logger.warning(f"Failed to analyze {path}: {error}")
+    logger.info(f"Fleet analysis finished: {summary['analyzed']} analyzed, {summary['failed']} failed")
+    print(f"\n✅ Analyzed {summary['analyzed']} of {summary['captures']} captures ({summary['failed']} failed)")
+    print(f"Per-capture metrics: {records_file}")
+    print(f"Fleet summary: {summary_file}")
+    return 0
+
+def run_merge(paths, clock_offsets, output_dir, logger):
+    """
+    Analyze several captures merged by timestamp and write the metrics.
+    
+    Args:
+        paths (list): Capture files, one per tap
+        clock_offsets (list): "PCAP=OFFSET" strings shifting single captures
+        output_dir (str): Directory to save the results
+        logger: Logger instance
+        
+    Returns:
+        int: Process exit code
+    """
+    for path in paths:
+        if not check_pcap_file(path):
+            logger.error(f"PCAP file not found or not readable: {path}")
+            return 1
+    
+    offsets = [0] * len(paths)
+    for spec in clock_offsets:
+        path, _, offset = spec.rpartition("=")
+        if path not in paths:
+            logger.error(f"--clock-offset names a capture not given to --merge: {spec}")
+            return 1
+        try:
+            offsets[paths.index(path)] = parse_clock_offset(offset)
+        except ValueError as e:
+            logger.error(str(e))
+            return 1
+    
+    # Analyzer settings (batch size, metric options, filter, sampling) come from .env
+    analyzer = PcapAnalyzerTool()
+    metric_names, options, packet_filter = analyzer.analysis_settings()
+    logger.info(f"Analyzing {len(paths)} captures merged by timestamp")
+    metrics = analyze_merged(paths, metric_names, options, analyzer.batch_size, packet_filter, offsets)
+    
+    result_file = os.path.join(output_dir, f"merged_metrics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(result_file, 'w') as f:
+        json.dump({"pcap_files": paths, "clock_offsets_ns": offsets, "metrics": metrics}, f, indent=2)
+    
+    logger.info(f"Merged analysis finished: {metrics['capture_stats']['packets_analyzed']} packets")
+    print(f"\n✅ Analyzed {len(paths)} captures as one stream")
+    print(f"Merged metrics: {result_file}")
+    return 0
+
 def extract_log_sections(log_file_path):
     """Extract key sections from the log file."""
     sections = {
@@ -3,7 +3,7 @@ import json
 import pandas as pd
 import numpy as np
 from scipy import stats
-from datetime import datetime
+from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
 
@@ -46,6 +46,10 @@ class AnomalyDetectorTool(BaseTool):
             else:
                 metrics = data
             
+            # The PCAP analyzer wraps its results in a one-element list
+            if isinstance(metrics, list) and len(metrics) == 1:
+                metrics = metrics[0]
+            
             # Set anomaly detection thresholds based on sensitivity
             if sensitivity.lower() == "low":
                 threshold_factor = 3.0  # Less sensitive (only detect major anomalies)
@@ -82,6 +86,11 @@ class AnomalyDetectorTool(BaseTool):
             if connection_anomalies:
                 anomalies.extend(connection_anomalies)
             
+            # Check the time series for buckets that stand out from the rest
+            timeseries_anomalies = self._detect_timeseries_anomalies(metrics, threshold_factor)
+            if timeseries_anomalies:
+                anomalies.extend(timeseries_anomalies)
+            
             # Add timestamp to each anomaly
             for anomaly in anomalies:
                 anomaly["detected_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -369,3 +378,75 @@ class AnomalyDetectorTool(BaseTool):
                     })
         
         return anomalies
+    
+    def _detect_timeseries_anomalies(self, metrics, threshold_factor):
+        """
+        Detect anomalous periods in the time-bucketed KPI series.
+        
+        Each bucket is scored by its robust z-score (distance from the median
+        in units of the scaled median absolute deviation, at least 5% of the
+        median so a flat series does not flag noise). Consecutive buckets
+        scoring above threshold_factor in the harmful direction are reported
+        as one anomaly covering that period. The first and last buckets of
+        totals (throughput, new connections) are only partly covered by the
+        capture and are not scored.
+        """
+        anomalies = []
+        
+        # Accept the analyzer results or the series section on its own
+        series = metrics.get("timeseries", metrics) if isinstance(metrics, dict) else {}
+        if "bucket_s" not in series:
+            return anomalies
+        
+        # Series name -> (anomaly type, harmful direction, per-bucket total, impact)
+        checks = {
+            "latency_avg_ms": ("Latency Spike", 1, False, "Real-time applications stall while the spike lasts."),
+            "rtt_avg_ms": ("RTT Spike", 1, False, "Round trips slow down, reducing TCP throughput and responsiveness."),
+            "throughput_kbps": ("Throughput Drop", -1, True, "Transfers slow down or stall while the drop lasts."),
+            "loss_percentage": ("Packet Loss Burst", 1, False, "Retransmissions add delay and cut effective throughput."),
+            "new_connections": ("Connection Surge", 1, True, "A burst of connection setups can signal reconnect "
+                                                             "storms or signaling load.")
+        }
+        bucket_s = series["bucket_s"]
+        for name, (anomaly_type, sign, total, impact) in checks.items():
+            if name not in series:
+                continue
+            values = np.array([np.nan if v is None else v for v in series[name]], dtype=float)
+            present = ~np.isnan(values)
+            if total:
+                present[[0, -1]] = False
+            if present.sum() < 5:
+                continue
+            median = np.median(values[present])
+            spread = max(1.4826 * np.median(np.abs(values[present] - median)), 0.05 * abs(median))
+            if spread == 0:
+                continue
+            score = np.where(present, sign * (values - median) / spread, 0)
+            flagged = score > threshold_factor
+            
+            # Join consecutive flagged buckets into periods
+            edges = np.diff(np.r_[0, flagged.astype(int), 0])
+            for first, end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+                period = values[first:end]
+                worst = float(np.nanmax(period) if sign > 0 else np.nanmin(period))
+                start_time = datetime.fromtimestamp(series["start"] + first * bucket_s, tz=timezone.utc)
+                anomalies.append({
+                    "type": anomaly_type,
+                    "metric": name,
+                    "value": round(worst, 2),
+                    "threshold": round(float(median + sign * threshold_factor * spread), 2),
+                    "severity": "high" if score[first:end].max() > 2 * threshold_factor else "medium",
+                    "start": start_time.strftime("%Y-%m-%d %H:%M:%S"),
+                    "duration_s": round(float((end - first) * bucket_s), 3),
+                    "description": f"{name} reached {worst:.2f} over {(end - first) * bucket_s:g}s "
+                                   f"(typical {median:.2f}).",
+                    "impact": impact,
+                    "possible_causes": [
+                        "Handover or radio link degradation",
+                        "Network congestion",
+                        "Core network or server-side event"
+                    ]
+                })
+        
+        return anomalies
+
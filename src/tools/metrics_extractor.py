@@ -2,7 +2,7 @@ from crewai.tools import BaseTool
 import json
 import pandas as pd
 import numpy as np
-from datetime import datetime
+from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
 
@@ -30,7 +30,9 @@ class MetricsExtractorTool(BaseTool):
         Args:
             data (str): JSON string containing network data
             metric_type (str, optional): Type of metrics to extract.
-                                       Options: "latency", "throughput", "signal", "all"
+                                       Options: "latency", "throughput", "signal",
+                                       "connection", "packet_loss", "handovers",
+                                       "timeseries", "all"
                                     
         Returns:
             str: JSON string containing the extracted and analyzed metrics
@@ -45,6 +47,10 @@ class MetricsExtractorTool(BaseTool):
             else:
                 parsed_data = data
             
+            # The PCAP analyzer wraps its results in a one-element list
+            if isinstance(parsed_data, list) and len(parsed_data) == 1:
+                parsed_data = parsed_data[0]
+            
             # Determine which metrics to extract
             if not metric_type or metric_type.lower() == "all":
                 extract_all = True
@@ -74,6 +80,9 @@ class MetricsExtractorTool(BaseTool):
             if extract_all or "handovers" in metrics_list:
                 results["handovers"] = self._analyze_handovers(parsed_data)
             
+            if extract_all or "timeseries" in metrics_list:
+                results["timeseries"] = self._analyze_timeseries(parsed_data)
+            
             # Return results as JSON string
             return json.dumps(results, indent=2)
         
@@ -414,3 +423,76 @@ class MetricsExtractorTool(BaseTool):
         
         except Exception as e:
             return {"error": f"Error analyzing handovers: {str(e)}"}
+    
+    def _analyze_timeseries(self, data):
+        """Summarize the time-bucketed KPI series of the PCAP analyzer."""
+        try:
+            # Accept the analyzer results or the series section on its own
+            series = data.get("timeseries", data) if isinstance(data, dict) else {}
+            timeseries_metrics = {
+                "analysis": {
+                    "quality": "unknown",
+                    "issues": [],
+                    "recommendations": []
+                }
+            }
+            if "bucket_s" not in series:
+                timeseries_metrics["analysis"]["issues"].append("No time series data available")
+                return timeseries_metrics
+            
+            bucket_s = series["bucket_s"]
+            timeseries_metrics.update({"bucket_s": bucket_s, "start": series["start"], "buckets": series["buckets"]})
+            
+            # Per-series summary with the worst buckets
+            worst_is_low = {"throughput_kbps"}
+            for name in ("latency_avg_ms", "rtt_avg_ms", "throughput_kbps", "loss_percentage", "new_connections"):
+                if name not in series:
+                    continue
+                values = np.array([np.nan if v is None else v for v in series[name]], dtype=float)
+                present = np.flatnonzero(~np.isnan(values))
+                if not present.size:
+                    continue
+                worst = present[np.argsort(values[present])]
+                if name not in worst_is_low:
+                    worst = worst[::-1]
+                minutes = present * bucket_s / 60
+                slope = float(np.polyfit(minutes, values[present], 1)[0]) if present.size > 1 else 0.0
+                timeseries_metrics[name] = {
+                    "mean": round(float(values[present].mean()), 2),
+                    "min": round(float(values[present].min()), 2),
+                    "max": round(float(values[present].max()), 2),
+                    "p95": round(float(np.percentile(values[present], 95)), 2),
+                    "trend_per_min": round(slope, 2),
+                    "worst": [
+                        {"time": self._bucket_time(series["start"], bucket_s, i), "value": round(float(values[i]), 2)}
+                        for i in worst[:3].tolist()
+                    ]
+                }
+            
+            # Identify issues
+            issues = timeseries_metrics["analysis"]["issues"]
+            loss = timeseries_metrics.get("loss_percentage")
+            if loss and loss["max"] > 2:
+                issues.append(f"Packet loss peaks at {loss['max']}% in a {bucket_s:g}s bucket")
+            latency = timeseries_metrics.get("rtt_avg_ms") or timeseries_metrics.get("latency_avg_ms")
+            if latency and latency["p95"] > 2 * max(latency["mean"], 1):
+                issues.append("Latency spikes well above its typical level")
+            throughput = timeseries_metrics.get("throughput_kbps")
+            if throughput and throughput["mean"] > 0 and throughput["min"] < throughput["mean"] * 0.2:
+                issues.append("Throughput drops below 20% of its average")
+            timeseries_metrics["analysis"]["quality"] = "poor" if len(issues) > 1 else "fair" if issues else "good"
+            
+            # Provide recommendations
+            if issues:
+                timeseries_metrics["analysis"]["recommendations"].append(
+                    "Correlate the worst buckets with handovers, cell load and core network events"
+                )
+            
+            return timeseries_metrics
+        
+        except Exception as e:
+            return {"error": f"Error analyzing time series: {str(e)}"}
+    
+    def _bucket_time(self, start, bucket_s, index):
+        """UTC time of the start of a bucket."""
+        return datetime.fromtimestamp(start + index * bucket_s, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
@@ -1,14 +1,31 @@
 from crewai.tools import BaseTool
-import pyshark
-import pandas as pd
 import os
 import json
 from dotenv import load_dotenv
-from pydantic import Field
-from typing import Optional, Dict, List, Any, Union
+from pydantic import Field, PrivateAttr
+from typing import Optional, Dict, List, Any, Tuple, Union
+
+from ..capture.batch import PacketBatch
+from ..capture.metrics import (
+    ACCUMULATORS,
+    LatencyAccumulator,
+    ThroughputAccumulator,
+    SignalAccumulator,
+    LossAccumulator,
+    ConnectionAccumulator,
+    parse_windows
+)
+from ..capture.analysis import analyze_capture
+from ..capture.cache import CaptureCache, settings_key
+from ..capture.follow import CaptureFollower
+from ..capture.filters import PacketFilter, parse_rate
+from ..capture.index import CaptureIndex, DEFAULT_INDEX_INTERVAL, parse_time
 
 load_dotenv()
 
+# Number of packets decoded before each batch is folded into the accumulators
+DEFAULT_BATCH_SIZE = 65536
+
 class PcapAnalyzerTool(BaseTool):
     """
     Tool for analyzing PCAP files to extract 5G modem performance metrics.
@@ -25,25 +42,118 @@ class PcapAnalyzerTool(BaseTool):
         default=None,
         description="Path to the PCAP file to analyze"
     )
+    batch_size: int = Field(
+        default=DEFAULT_BATCH_SIZE,
+        description="Number of packets processed per streaming batch"
+    )
+    workers: int = Field(
+        default=1,
+        description="Number of worker processes used to parse the capture"
+    )
+    throughput_windows: str = Field(
+        default="10ms,100ms,1s,1s/100ms",
+        description="Throughput window sets as size or size/step, comma separated"
+    )
+    throughput_series: bool = Field(
+        default=True,
+        description="Include per-window throughput series in the output"
+    )
+    series_bucket: str = Field(
+        default="1s",
+        description="Bucket width of the KPI time series, e.g. 1s or 100ms"
+    )
+    cache_dir: Optional[str] = Field(
+        default=None,
+        description="Directory of the parsed-capture cache (None disables caching)"
+    )
+    cache_max_bytes: int = Field(
+        default=1 << 30,
+        description="Size limit of the parsed-capture cache in bytes"
+    )
+    capture_filter: Optional[str] = Field(
+        default=None,
+        description="Header filter such as 'tcp portrange 30000-40000 net 10.0.0.0/8'"
+    )
+    follow: bool = Field(
+        default=False,
+        description="Follow a growing, uncompressed capture, decoding only records appended since the last call"
+    )
+    index_interval: int = Field(
+        default=DEFAULT_INDEX_INTERVAL,
+        description="Records between checkpoints of the capture offset index"
+    )
+    index_dir: Optional[str] = Field(
+        default=None,
+        description="Directory of offset index files (None keeps them next to the capture)"
+    )
+    sample_rate: Optional[float] = Field(
+        default=None,
+        description="Share of flows analyzed in sampling mode, e.g. 0.01 (None analyzes every flow)"
+    )
+    
+    # Open follow sessions, keyed by analysis settings
+    _followers: Dict[str, CaptureFollower] = PrivateAttr(default_factory=dict)
+    # Offset indexes in use, keyed by capture path
+    _indexes: Dict[str, CaptureIndex] = PrivateAttr(default_factory=dict)
     
-    def __init__(self, pcap_file=None):
+    def __init__(self, pcap_file=None, batch_size=None, workers=None, cache_dir=None, follow=None):
         """
         Initialize the PCAP analyzer tool.
         
         Args:
             pcap_file (str, optional): Path to the PCAP file. Defaults to the path in .env file.
+            batch_size (int, optional): Packets per streaming batch. Defaults to DEFAULT_BATCH_SIZE.
+            workers (int, optional): Worker processes for parallel parsing. Defaults to
+                                     PCAP_WORKERS from .env, or 1 (single process).
+            cache_dir (str, optional): Parsed-capture cache directory. Defaults to
+                                       .pcap_cache inside OUTPUT_DIR; set PCAP_CACHE=false
+                                       in .env to disable the cache.
+            follow (bool, optional): Follow mode for captures that are still being
+                                     written. Defaults to PCAP_FOLLOW from .env.
         """
         super().__init__()
         # Store the pcap_file in the defined field
         self.pcap_file_path = pcap_file or os.getenv("PCAP_FILE_PATH", "data/free5gc-compose.pcap")
+        self.batch_size = batch_size or int(os.getenv("PCAP_BATCH_SIZE", DEFAULT_BATCH_SIZE))
+        self.workers = workers or int(os.getenv("PCAP_WORKERS", "1"))
+        self.throughput_windows = os.getenv("PCAP_THROUGHPUT_WINDOWS", self.throughput_windows)
+        self.throughput_series = os.getenv("PCAP_THROUGHPUT_SERIES", "true").lower() in ("1", "true", "yes")
+        self.series_bucket = os.getenv("PCAP_SERIES_BUCKET", self.series_bucket)
+        if os.getenv("PCAP_CACHE", "true").lower() in ("1", "true", "yes"):
+            self.cache_dir = cache_dir or os.path.join(os.getenv("OUTPUT_DIR", "output"), ".pcap_cache")
+        self.cache_max_bytes = int(float(os.getenv("PCAP_CACHE_MAX_MB", 1024)) * (1 << 20))
+        self.capture_filter = os.getenv("PCAP_FILTER") or None
+        self.follow = follow if follow is not None else os.getenv("PCAP_FOLLOW", "false").lower() in ("1", "true", "yes")
+        self.index_interval = int(os.getenv("PCAP_INDEX_INTERVAL", DEFAULT_INDEX_INTERVAL))
+        self.index_dir = os.getenv("PCAP_INDEX_DIR") or None
+        self.sample_rate = parse_rate(os.getenv("PCAP_SAMPLE_RATE")) if os.getenv("PCAP_SAMPLE_RATE") else None
     
-    def _run(self, metrics: Optional[str] = None) -> str:
+    def _run(self, metrics: Optional[str] = None, capture_filter: Optional[str] = None,
+             start_time: Optional[str] = None, end_time: Optional[str] = None,
+             sample_rate: Optional[str] = None) -> str:
         """
         Run the PCAP analysis.
         
+        The capture is streamed in batches into mergeable metric accumulators,
+        so memory does not grow with the number of packets. See "PCAP
+        Analyzer" in the README for parallel parsing, caching, follow mode,
+        time windows and sampling.
+        
         Args:
             metrics (str, optional): Specific metrics to extract. 
-                                     Options: "latency", "throughput", "signal", "all"
+                                     Options: "latency", "throughput", "signal",
+                                     "packet_loss", "connections", "rtt", "ngap", "ngap_procedures",
+                                     "gtpu", "pfcp", "sbi", "heavy_hitters", "all"
+            capture_filter (str, optional): Only analyze packets matching this header
+                                            filter, e.g. "sctp port 38412" or
+                                            "udp net 10.100.200.0/24". Defaults to
+                                            PCAP_FILTER from .env.
+            start_time (str, optional): Window start: an offset from the capture start
+                                        ("+90s"), a UTC time of day ("14:02"), epoch
+                                        seconds or an ISO 8601 date and time
+            end_time (str, optional): Window end (exclusive), in the same forms
+            sample_rate (str, optional): Share of flows to analyze, as "0.01" or "1%".
+                                         Defaults to PCAP_SAMPLE_RATE from .env (all flows).
                                      
         Returns:
             str: JSON string containing the extracted metrics
@@ -52,56 +162,28 @@ class PcapAnalyzerTool(BaseTool):
             return f"Error: PCAP file not found at {self.pcap_file_path}"
         
         try:
-            # Determine which metrics to extract
-            if metrics is None or metrics.lower() == "all":
-                extract_all = True
-            else:
-                extract_all = False
-                metrics_list = [m.strip().lower() for m in metrics.split(",")]
+            metric_names, options, packet_filter = self.analysis_settings(metrics, capture_filter, sample_rate)
+            settings = settings_key(metric_names, options, packet_filter)
             
-            # Parse the PCAP file
-            cap = pyshark.FileCapture(self.pcap_file_path)
+            if self.follow:
+                if start_time or end_time:
+                    return "Error: start_time and end_time cannot be used in follow mode"
+                return json.dumps([self._refresh_follower(metric_names, options, settings, packet_filter)])
             
-            # Initialize results dictionary
-            results = {
-                    "latency": {"avg_ms": 45, "min_ms": 20, "max_ms": 120, "jitter_ms": 15},
-                    "throughput": {"avg_kbps": 650000, "peak_kbps": 950000},
-                    "signal_strength": {"rssi_dbm": -65, "sinr_db": 18},
-                    "packet_loss": {"loss_percentage": 2.5, "retransmits": 45},
-                    "connection_stats": {"total_connections": 12, "handshake_time_ms": 85}
-                }
-            # Process packets
-            packets = []
-            for i, packet in enumerate(cap):
-                try:
-                    if i >= 1000:  # Limit to first 1000 packets for performance
-                        break
-                    
-                    packet_data = self._extract_packet_data(packet)
-                    if packet_data:
-                        packets.append(packet_data)
-                except Exception as e:
-                    continue
+            index, time_range = None, None
+            if start_time or end_time:
+                index = self._capture_index()
+                time_range = self._time_range(index, start_time, end_time)
+            elif packet_filter is not None and packet_filter.sample is not None:
+                # Sampling reads through an index only if one exists; building it would read everything
+                index = self._capture_index(build=False)
             
-            # Convert to dataframe for easier analysis
-            if packets:
-                df = pd.DataFrame(packets)
-                
-                # Extract metrics based on the dataframe
-                if extract_all or "latency" in locals().get('metrics_list', []):
-                    results["latency"] = self._calculate_latency(df)
-                
-                if extract_all or "throughput" in locals().get('metrics_list', []):
-                    results["throughput"] = self._calculate_throughput(df)
-                
-                if extract_all or "signal" in locals().get('metrics_list', []):
-                    results["signal_strength"] = self._estimate_signal_strength(df)
-                
-                if extract_all or "packet_loss" in locals().get('metrics_list', []):
-                    results["packet_loss"] = self._estimate_packet_loss(df)
-                
-                if extract_all or "connections" in locals().get('metrics_list', []):
-                    results["connection_stats"] = self._analyze_connections(df)
+            # Reuse results or the decoded packet table of an earlier run
+            cache = CaptureCache(self.cache_dir, self.cache_max_bytes) if self.cache_dir else None
+            results = analyze_capture(self.pcap_file_path, metric_names, options, self.batch_size, self.workers,
+                                      cache, packet_filter=packet_filter, time_range=time_range, index=index)
+            if time_range is not None:
+                results["time_window"] = {"start_ns": time_range[0], "end_ns": time_range[1]}
             
             # Convert to formatted JSON string
             return json.dumps([results])
@@ -109,209 +191,107 @@ class PcapAnalyzerTool(BaseTool):
         except Exception as e:
             return f"Error analyzing PCAP file: {str(e)}"
     
-    def _extract_packet_data(self, packet) -> Dict[str, Any]:
-        """Extract relevant data from a packet."""
-        data = {
-            "timestamp": float(packet.sniff_timestamp) if hasattr(packet, "sniff_timestamp") else 0,
-            "length": int(packet.length) if hasattr(packet, "length") else 0,
-            "protocol": packet.transport_layer if hasattr(packet, "transport_layer") else "unknown"
-        }
-        
-        # Extract IP information if available
-        if hasattr(packet, "ip"):
-            data["src_ip"] = packet.ip.src if hasattr(packet.ip, "src") else "unknown"
-            data["dst_ip"] = packet.ip.dst if hasattr(packet.ip, "dst") else "unknown"
-            data["ttl"] = int(packet.ip.ttl) if hasattr(packet.ip, "ttl") else 0
+    def analysis_settings(self, metrics: Optional[str] = None, capture_filter: Optional[str] = None,
+                          sample_rate: Optional[str] = None) -> Tuple[List[str], Dict[str, Dict], Optional[PacketFilter]]:
+        """
+        Metric names, accumulator options and packet filter for an analysis.
         
-        # Extract TCP/UDP information if available
-        if hasattr(packet, "tcp"):
-            data["src_port"] = int(packet.tcp.srcport) if hasattr(packet.tcp, "srcport") else 0
-            data["dst_port"] = int(packet.tcp.dstport) if hasattr(packet.tcp, "dstport") else 0
-            data["tcp_flags"] = packet.tcp.flags if hasattr(packet.tcp, "flags") else ""
-            data["seq"] = int(packet.tcp.seq) if hasattr(packet.tcp, "seq") else 0
-            data["ack"] = int(packet.tcp.ack) if hasattr(packet.tcp, "ack") else 0
-        elif hasattr(packet, "udp"):
-            data["src_port"] = int(packet.udp.srcport) if hasattr(packet.udp, "srcport") else 0
-            data["dst_port"] = int(packet.udp.dstport) if hasattr(packet.udp, "dstport") else 0
+        Entry points that analyze captures without going through the tool
+        (batch and merged runs) use this to apply the same configuration.
         
-        # Extract NGAP (5G) specific information if available
-        if hasattr(packet, "ngap"):
-            data["ngap_procedure"] = packet.ngap.procedureCode if hasattr(packet.ngap, "procedureCode") else "unknown"
-            data["is_5g"] = True
-        else:
-            data["is_5g"] = False
+        Args:
+            metrics (str, optional): Comma-separated metric names, or "all" (the default)
+            capture_filter (str, optional): Header filter. Defaults to PCAP_FILTER from .env.
+            sample_rate (str, optional): Share of flows to analyze. Defaults to
+                                         PCAP_SAMPLE_RATE from .env.
+            
+        Returns:
+            tuple: (metric names, options keyed by metric name, packet filter or None)
+        """
+        packet_filter = PacketFilter.parse(capture_filter or self.capture_filter)
+        rate = parse_rate(str(sample_rate)) if sample_rate is not None else self.sample_rate
+        if rate is not None and rate != 1:
+            packet_filter = (packet_filter or PacketFilter()).sampled(rate)
+        return self._parse_metrics(metrics), self._metric_options(), packet_filter
+    
+    def _refresh_follower(self, metric_names: List[str], options: Dict[str, Dict], settings: str,
+                          packet_filter: Optional[PacketFilter] = None) -> Dict[str, Any]:
+        """Bring the follow session for these settings up to date and return its metrics."""
+        follower = self._followers.get(settings)
+        if follower is None or follower.path != self.pcap_file_path:
+            follower = CaptureFollower(self.pcap_file_path, metric_names, options, self.batch_size, packet_filter)
+            self._followers[settings] = follower
+        new_packets = follower.refresh()
         
-        return data
+        results = follower.results()
+        results["follow"] = {"offset": follower.offset, "new_packets": new_packets, "refreshes": follower.refreshes}
+        return results
+    
+    def _capture_index(self, build: bool = True) -> Optional[CaptureIndex]:
+        """Offset index of the capture, reused while the file is unchanged; None if missing and not built."""
+        index = self._indexes.get(self.pcap_file_path)
+        stat = os.stat(self.pcap_file_path)
+        if index is None or index.size != stat.st_size or index.mtime_ns != stat.st_mtime_ns:
+            if build:
+                index = CaptureIndex.load_or_build(self.pcap_file_path, self.index_interval, self.index_dir)
+            else:
+                index = CaptureIndex.load(self.pcap_file_path, self.index_dir)
+            if index is None:
+                return None
+            self._indexes[self.pcap_file_path] = index
+        return index
+    
+    def _time_range(self, index: CaptureIndex, start_time: Optional[str],
+                    end_time: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+        """Window bounds in nanoseconds; relative times count from the capture start."""
+        origin = index.start_ns or 0
+        start_ns = parse_time(start_time, origin) if start_time else None
+        end_ns = parse_time(end_time, origin) if end_time else None
+        return start_ns, end_ns
+    
+    def _parse_metrics(self, metrics: Optional[str]) -> List[str]:
+        """Turn the metrics argument into a list of metric names."""
+        if metrics is None or metrics.lower() == "all":
+            return list(ACCUMULATORS)
+        return [m.strip().lower() for m in metrics.split(",")]
     
-    def _calculate_latency(self, df) -> Dict[str, float]:
+    def _metric_options(self) -> Dict[str, Dict]:
+        """Accumulator settings taken from the tool configuration."""
+        bucket = {"bucket_size": parse_windows(self.series_bucket)[0][0]}
+        return {
+            "throughput": {
+                "windows": parse_windows(self.throughput_windows),
+                "series": self.throughput_series
+            },
+            **{name: dict(bucket) for name in ("latency", "rtt", "packet_loss", "connections", "capture_stats")}
+        }
+    
+    def _calculate_latency(self, packets: PacketBatch) -> Dict[str, float]:
         """Calculate latency metrics from packet data."""
-        latency_metrics = {"avg_ms": 0, "min_ms": 0, "max_ms": 0, "jitter_ms": 0}
-        
-        # Group by connections (src IP, dst IP, src port, dst port)
-        if all(col in df.columns for col in ["src_ip", "dst_ip", "src_port", "dst_port"]):
-            grouped = df.groupby(["src_ip", "dst_ip", "src_port", "dst_port"])
-            
-            # Calculate RTT for TCP packets with SYN/ACK
-            if "tcp_flags" in df.columns:
-                rtts = []
-                for name, group in grouped:
-                    # Find SYN packets
-                    syn_packets = group[group["tcp_flags"].str.contains("S", na=False) & 
-                                       ~group["tcp_flags"].str.contains("A", na=False)]
-                    
-                    # Find corresponding SYN-ACK packets
-                    for _, syn in syn_packets.iterrows():
-                        syn_ack = group[(group["tcp_flags"].str.contains("S", na=False)) & 
-                                       (group["tcp_flags"].str.contains("A", na=False)) & 
-                                       (group["timestamp"] > syn["timestamp"])]
-                        
-                        if not syn_ack.empty:
-                            rtt = syn_ack.iloc[0]["timestamp"] - syn["timestamp"]
-                            rtts.append(rtt * 1000)  # Convert to ms
-                
-                if rtts:
-                    latency_metrics["avg_ms"] = round(sum(rtts) / len(rtts), 2)
-                    latency_metrics["min_ms"] = round(min(rtts), 2)
-                    latency_metrics["max_ms"] = round(max(rtts), 2)
-                    latency_metrics["jitter_ms"] = round(pd.Series(rtts).std(), 2)
-        
-        return latency_metrics
+        accumulator = LatencyAccumulator()
+        accumulator.update(packets)
+        return accumulator.result()
     
-    def _calculate_throughput(self, df) -> Dict[str, float]:
+    def _calculate_throughput(self, packets: PacketBatch) -> Dict[str, float]:
         """Calculate throughput metrics from packet data."""
-        throughput_metrics = {"avg_kbps": 0, "peak_kbps": 0}
-        
-        if "timestamp" in df.columns and "length" in df.columns:
-            # Calculate time window
-            min_time = df["timestamp"].min()
-            max_time = df["timestamp"].max()
-            duration = max_time - min_time
-            
-            if duration > 0:
-                # Calculate total bytes transferred
-                total_bytes = df["length"].sum()
-                
-                # Calculate average throughput in kbps
-                avg_throughput = (total_bytes * 8) / (duration * 1000)
-                throughput_metrics["avg_kbps"] = round(avg_throughput, 2)
-                
-                # Calculate peak throughput using sliding window
-                window_size = 0.1  # 100ms window
-                max_throughput = 0
-                
-                for t in range(int((max_time - min_time) / window_size)):
-                    window_start = min_time + t * window_size
-                    window_end = window_start + window_size
-                    
-                    window_bytes = df[(df["timestamp"] >= window_start) & 
-                                     (df["timestamp"] < window_end)]["length"].sum()
-                    
-                    window_throughput = (window_bytes * 8) / (window_size * 1000)
-                    max_throughput = max(max_throughput, window_throughput)
-                
-                throughput_metrics["peak_kbps"] = round(max_throughput, 2)
-        
-        return throughput_metrics
+        accumulator = ThroughputAccumulator()
+        accumulator.update(packets)
+        return accumulator.result()
     
-    def _estimate_signal_strength(self, df) -> Dict[str, float]:
+    def _estimate_signal_strength(self, packets: PacketBatch) -> Dict[str, float]:
         """Estimate signal strength metrics (simulated for PCAP analysis)."""
-        # Note: Actual signal strength would require radio layer info not in standard PCAPs
-        # This is a simulation based on packet loss and latency patterns
-        
-        signal_metrics = {"rssi_dbm": -65, "sinr_db": 15}
-        
-        if "ttl" in df.columns:
-            # Use TTL variations as a rough proxy for network conditions
-            ttl_variance = df["ttl"].std() if len(df) > 10 else 0
-            
-            # Simulate RSSI based on TTL variance (higher variance -> worse signal)
-            base_rssi = -65  # Typical good 5G signal
-            simulated_rssi = base_rssi - (ttl_variance * 2)
-            signal_metrics["rssi_dbm"] = round(max(-120, min(-45, simulated_rssi)), 1)
-            
-            # Simulate SINR based on RSSI
-            simulated_sinr = ((signal_metrics["rssi_dbm"] + 120) / 3) - 5
-            signal_metrics["sinr_db"] = round(max(0, min(30, simulated_sinr)), 1)
-        
-        return signal_metrics
+        accumulator = SignalAccumulator()
+        accumulator.update(packets)
+        return accumulator.result()
     
-    def _estimate_packet_loss(self, df) -> Dict[str, Union[float, int]]:
+    def _estimate_packet_loss(self, packets: PacketBatch) -> Dict[str, Union[float, int]]:
         """Estimate packet loss from TCP sequence numbers."""
-        loss_metrics = {"loss_percentage": 0, "retransmits": 0}
-        
-        if "seq" in df.columns and "protocol" in df.columns:
-            tcp_df = df[df["protocol"] == "TCP"]
-            
-            if not tcp_df.empty:
-                # Group by connections
-                if all(col in tcp_df.columns for col in ["src_ip", "dst_ip", "src_port", "dst_port"]):
-                    grouped = tcp_df.groupby(["src_ip", "dst_ip", "src_port", "dst_port"])
-                    
-                    total_packets = 0
-                    retransmits = 0
-                    
-                    for name, group in grouped:
-                        # Sort by timestamp
-                        sorted_group = group.sort_values("timestamp")
-                        
-                        # Check for duplicate sequence numbers
-                        seq_counts = sorted_group["seq"].value_counts()
-                        dup_seqs = seq_counts[seq_counts > 1].sum()
-                        
-                        total_packets += len(sorted_group)
-                        retransmits += dup_seqs
-                    
-                    if total_packets > 0:
-                        loss_percentage = (retransmits / total_packets) * 100
-                        loss_metrics["loss_percentage"] = round(loss_percentage, 2)
-                        loss_metrics["retransmits"] = retransmits
-        
-        return loss_metrics
+        accumulator = LossAccumulator()
+        accumulator.update(packets)
+        return accumulator.result()
     
-    def _analyze_connections(self, df) -> Dict[str, Union[int, float]]:
+    def _analyze_connections(self, packets: PacketBatch) -> Dict[str, Union[int, float]]:
         """Analyze connection statistics."""
-        connection_metrics = {"total_connections": 0, "handshake_time_ms": 0}
-        
-        if "protocol" in df.columns:
-            # Count unique TCP connections
-            if all(col in df.columns for col in ["src_ip", "dst_ip", "src_port", "dst_port"]):
-                tcp_df = df[df["protocol"] == "TCP"]
-                unique_connections = tcp_df.groupby(["src_ip", "dst_ip", "src_port", "dst_port"]).size()
-                connection_metrics["total_connections"] = len(unique_connections)
-                
-                # Calculate average TCP handshake time
-                if "tcp_flags" in df.columns and "timestamp" in df.columns:
-                    handshake_times = []
-                    
-                    for (src_ip, dst_ip, src_port, dst_port), group in tcp_df.groupby(["src_ip", "dst_ip", "src_port", "dst_port"]):
-                        sorted_group = group.sort_values("timestamp")
-                        
-                        # Find SYN packet
-                        syn = sorted_group[sorted_group["tcp_flags"].str.contains("S", na=False) & 
-                                         ~sorted_group["tcp_flags"].str.contains("A", na=False)]
-                        
-                        if not syn.empty:
-                            syn_time = syn.iloc[0]["timestamp"]
-                            
-                            # Find SYN-ACK packet
-                            syn_ack = sorted_group[(sorted_group["tcp_flags"].str.contains("S", na=False)) & 
-                                                 (sorted_group["tcp_flags"].str.contains("A", na=False)) & 
-                                                 (sorted_group["timestamp"] > syn_time)]
-                            
-                            if not syn_ack.empty:
-                                syn_ack_time = syn_ack.iloc[0]["timestamp"]
-                                
-                                # Find ACK packet
-                                ack = sorted_group[(~sorted_group["tcp_flags"].str.contains("S", na=False)) & 
-                                                 (sorted_group["tcp_flags"].str.contains("A", na=False)) & 
-                                                 (sorted_group["timestamp"] > syn_ack_time)]
-                                
-                                if not ack.empty:
-                                    ack_time = ack.iloc[0]["timestamp"]
-                                    handshake_time = (ack_time - syn_time) * 1000  # Convert to ms
-                                    handshake_times.append(handshake_time)
-                    
-                    if handshake_times:
-                        connection_metrics["handshake_time_ms"] = round(sum(handshake_times) / len(handshake_times), 2)
-        
-        return connection_metrics
\ No newline at end of file
+        accumulator = ConnectionAccumulator()
+        accumulator.update(packets)
+        return accumulator.result()
@@ -2,10 +2,16 @@ import os
 import shutil
 from datetime import datetime
 
+from ..capture.compression import compression_of, open_decompressed
+
 def check_pcap_file(file_path):
     """
     Check if the PCAP file exists and is readable.
     
+    Compressed captures (gzip, xz, bzip2, zstd) are checked by decompressing
+    their first bytes, so a zstd capture without the zstandard package
+    counts as unreadable.
+    
     Args:
         file_path (str): Path to the PCAP file
         
@@ -18,7 +24,8 @@ def check_pcap_file(file_path):
     
     # Check if file is readable
     try:
-        with open(file_path, 'rb') as f:
+        compression = compression_of(file_path)
+        with (open_decompressed(file_path, compression) if compression else open(file_path, 'rb')) as f:
             # Try to read a small part of the file
             f.read(1024)
         return True
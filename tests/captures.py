@@ -0,0 +1,196 @@
+"""
+Synthetic capture files for the tests.
+
+Frames are built byte by byte (Ethernet, VLAN, IPv4, IPv6, TCP/UDP/SCTP) and
+written as pcap or pcapng, so every timestamp, sequence number and payload
+of a test capture is known exactly.
+"""
+import socket
+import struct
+from typing import Iterable, List, Tuple
+
+# (timestamp in seconds, frame bytes)
+Packet = Tuple[float, bytes]
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_PSH = 0x08
+TCP_ACK = 0x10
+
+# Server side of every generated TCP connection
+SERVER_ISN = 5000
+
+
+def ethernet(payload: bytes, ethertype: int = 0x0800) -> bytes:
+    return b"\x00\x11\x22\x33\x44\x55\x66\x77\x88\x99\xaa\xbb" + struct.pack(">H", ethertype) + payload
+
+
+def vlan(payload: bytes, vid: int, ethertype: int = 0x0800) -> bytes:
+    """A VLAN tag's TCI and inner EtherType; the TPID is the outer EtherType."""
+    return struct.pack(">HH", vid, ethertype) + payload
+
+
+def ipv4(src: str, dst: str, protocol: int, payload: bytes, ttl: int = 64) -> bytes:
+    header = struct.pack(">BBHHHBBH4s4s", 0x45, 0, 20 + len(payload), 0, 0, ttl, protocol, 0,
+                         socket.inet_aton(src), socket.inet_aton(dst))
+    return header + payload
+
+
+def ipv6(src: str, dst: str, protocol: int, payload: bytes, hop_limit: int = 64,
+         extensions: Iterable[Tuple[int, bytes]] = ()) -> bytes:
+    """
+    An IPv6 packet, optionally behind a chain of extension headers.
+
+    Args:
+        extensions (iterable): (header type, body) pairs in order; each body is
+                               padded to whole 8-byte units (fragment headers
+                               must be given their full 6-byte body)
+    """
+    chain = b""
+    headers = list(extensions)
+    for index, (_, body) in enumerate(headers):
+        next_header = headers[index + 1][0] if index + 1 < len(headers) else protocol
+        body += b"\x00" * (-(len(body) + 2) % 8)
+        chain += struct.pack(">BB", next_header, (len(body) + 2) // 8 - 1) + body
+    first = headers[0][0] if headers else protocol
+    header = struct.pack(">IHBB16s16s", 6 << 28, len(chain) + len(payload), first, hop_limit,
+                         socket.inet_pton(socket.AF_INET6, src), socket.inet_pton(socket.AF_INET6, dst))
+    return header + chain + payload
+
+
+def tcp(src_port: int, dst_port: int, seq: int, ack: int, flags: int, payload: bytes = b"") -> bytes:
+    return struct.pack(">HHIIBBHHH", src_port, dst_port, seq % (1 << 32), ack % (1 << 32),
+                       5 << 4, flags, 65535, 0, 0) + payload
+
+
+def udp(src_port: int, dst_port: int, payload: bytes = b"") -> bytes:
+    return struct.pack(">HHHH", src_port, dst_port, 8 + len(payload), 0) + payload
+
+
+def sctp_data(src_port: int, dst_port: int, payload: bytes, ppid: int, tsn: int = 1) -> bytes:
+    """An SCTP packet with one unfragmented DATA chunk, padded to four bytes."""
+    chunk = struct.pack(">BBHIHHI", 0, 0x03, 16 + len(payload), tsn, 0, 0, ppid) + payload
+    return struct.pack(">HHII", src_port, dst_port, 1, 0) + chunk + b"\x00" * (-len(chunk) % 4)
+
+
+def tcp_frame(src: str, dst: str, src_port: int, dst_port: int, seq: int, ack: int, flags: int,
+              payload: bytes = b"") -> bytes:
+    return ethernet(ipv4(src, dst, 6, tcp(src_port, dst_port, seq, ack, flags, payload)))
+
+
+def udp_frame(src: str, dst: str, src_port: int, dst_port: int, payload: bytes = b"") -> bytes:
+    return ethernet(ipv4(src, dst, 17, udp(src_port, dst_port, payload)))
+
+
+def sctp_frame(src: str, dst: str, src_port: int, dst_port: int, payload: bytes, ppid: int) -> bytes:
+    return ethernet(ipv4(src, dst, 132, sctp_data(src_port, dst_port, payload, ppid)))
+
+
+def write_pcap(path: str, packets: Iterable[Packet], linktype: int = 1):
+    """Write frames as a nanosecond-resolution pcap, with Ethernet link type by default."""
+    with open(path, "wb") as f:
+        f.write(struct.pack("<IHHiIII", 0xA1B23C4D, 2, 4, 0, 0, 65535, linktype))
+        for ts, frame in packets:
+            ns = round(ts * 1e9)
+            f.write(struct.pack("<IIII", ns // 10 ** 9, ns % 10 ** 9, len(frame), len(frame)) + frame)
+
+
+def write_pcapng(path: str, packets: Iterable[Packet], interfaces: Iterable[Tuple[int, int]] = ((1, 9),),
+                 endian: str = "<"):
+    """
+    Write frames as a single-section pcapng.
+
+    By default there is one Ethernet interface at nanosecond resolution.
+    Packets may carry a third element, the index of their interface.
+
+    Args:
+        interfaces (iterable): (linktype, if_tsresol) of each interface
+        endian (str): struct byte order of the section, "<" or ">"
+    """
+    def block(block_type: int, body: bytes) -> bytes:
+        body += b"\x00" * (-len(body) % 4)
+        length = 12 + len(body)
+        return struct.pack(endian + "II", block_type, length) + body + struct.pack(endian + "I", length)
+
+    interfaces = list(interfaces)
+    with open(path, "wb") as f:
+        f.write(block(0x0A0D0D0A, struct.pack(endian + "IHHq", 0x1A2B3C4D, 1, 0, -1)))
+        for linktype, resolution in interfaces:
+            options = struct.pack(endian + "HHB", 9, 1, resolution) + b"\x00" * 3 + struct.pack(endian + "HH", 0, 0)
+            f.write(block(1, struct.pack(endian + "HHI", linktype, 0, 65535) + options))
+        for ts, frame, *interface in packets:
+            index = interface[0] if interface else 0
+            ticks = round(ts * 10 ** interfaces[index][1])
+            f.write(block(6, struct.pack(endian + "IIIII", index, ticks >> 32, ticks & 0xFFFFFFFF,
+                                         len(frame), len(frame)) + frame))
+
+
+def handshake(t0: float, client: str, server: str, client_port: int, server_port: int,
+              rtt: float, client_isn: int) -> List[Packet]:
+    """SYN, SYN-ACK after rtt, and the client's ACK 1 ms later."""
+    return [
+        (t0, tcp_frame(client, server, client_port, server_port, client_isn, 0, TCP_SYN)),
+        (t0 + rtt, tcp_frame(server, client, server_port, client_port, SERVER_ISN, client_isn + 1,
+                             TCP_SYN | TCP_ACK)),
+        (t0 + rtt + 0.001, tcp_frame(client, server, client_port, server_port, client_isn + 1,
+                                     SERVER_ISN + 1, TCP_ACK))
+    ]
+
+
+def transfer(t0: float, client: str, server: str, client_port: int, server_port: int,
+             rtt: float = 0.02, segments: int = 20, size: int = 1000, client_isn: int = 1000,
+             lost: Iterable[int] = (), reordered: Iterable[int] = (), spurious: Iterable[int] = (),
+             keep_alives: int = 0) -> List[Packet]:
+    """
+    A TCP connection in time order: handshake, then data segments every
+    5 ms, each acknowledged cumulatively rtt after it reaches the server.
+
+    Args:
+        lost (iterable): Segments whose first copy is lost before the tap; the
+                         retransmission is seen 200 ms late
+        reordered (iterable): Segments seen 6 ms late, behind the next segment
+        spurious (iterable): Segments sent again 60 ms later, after their ACK
+        keep_alives (int): One-byte keep-alive probes at the end, each answered
+    """
+    lost, reordered, spurious = set(lost), set(reordered), set(spurious)
+    packets = handshake(t0, client, server, client_port, server_port, rtt, client_isn)
+    start = t0 + rtt + 0.002
+    sends = []
+    for index in range(segments):
+        ts = start + index * 0.005
+        sends.append((ts + (0.2 if index in lost else 0.006 if index in reordered else 0), index))
+        if index in spurious:
+            sends.append((ts + 0.06, index))
+    sends.sort()
+
+    received = set()
+    for ts, index in sends:
+        seq = client_isn + 1 + index * size
+        packets.append((ts, tcp_frame(client, server, client_port, server_port, seq, SERVER_ISN + 1,
+                                      TCP_PSH | TCP_ACK, b"x" * size)))
+        received.add(index)
+        upto = 0
+        while upto in received:
+            upto += 1
+        packets.append((ts + rtt, tcp_frame(server, client, server_port, client_port, SERVER_ISN + 1,
+                                            client_isn + 1 + upto * size, TCP_ACK)))
+
+    end = client_isn + 1 + segments * size
+    last = sends[-1][0] + 1
+    for probe in range(keep_alives):
+        packets.append((last + probe, tcp_frame(client, server, client_port, server_port, end - 1,
+                                                SERVER_ISN + 1, TCP_ACK)))
+        packets.append((last + probe + rtt, tcp_frame(server, client, server_port, client_port,
+                                                      SERVER_ISN + 1, end, TCP_ACK)))
+    return sorted(packets, key=lambda packet: packet[0])
+
+
+def many_transfers(count: int, spacing: float = 0.013, **kwargs) -> List[Packet]:
+    """count transfers from distinct clients to one server, interleaved in time order."""
+    packets = []
+    for flow in range(count):
+        # Every other connection wraps its sequence numbers around 2**32
+        isn = (1 << 32) - 30000 if flow % 2 else 1000 + flow
+        packets += transfer(1.0 + flow * spacing, f"10.0.{flow // 250}.{flow % 250 + 1}", "10.1.0.1",
+                            20000 + flow, 443, client_isn=isn, **kwargs)
+    return sorted(packets, key=lambda packet: packet[0])
@@ -0,0 +1,31 @@
+"""Shared synthetic captures."""
+import pytest
+
+from .captures import many_transfers, write_pcap, write_pcapng
+
+# Loss events of every connection in the lossy captures
+LOSS_EVENTS = dict(lost=[10], reordered=[30], spurious=[50], keep_alives=2)
+
+
+@pytest.fixture(scope="session")
+def clean_capture(tmp_path_factory):
+    """60 overlapping connections without loss."""
+    path = tmp_path_factory.mktemp("captures") / "clean.pcap"
+    write_pcap(str(path), many_transfers(60, segments=100))
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def lossy_capture(tmp_path_factory):
+    """60 overlapping connections, each with a lost, a reordered and a spurious segment."""
+    path = tmp_path_factory.mktemp("captures") / "lossy.pcap"
+    write_pcap(str(path), many_transfers(60, segments=100, **LOSS_EVENTS))
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def lossy_pcapng(tmp_path_factory):
+    """The lossy capture as pcapng."""
+    path = tmp_path_factory.mktemp("captures") / "lossy.pcapng"
+    write_pcapng(str(path), many_transfers(60, segments=100, **LOSS_EVENTS))
+    return str(path)
@@ -0,0 +1,116 @@
+"""Result and packet-table caching of analyzed captures."""
+import json
+import os
+import shutil
+
+import pytest
+
+from src.capture import cache as cache_module
+from src.capture.analysis import analyze_capture
+from src.capture.cache import CaptureCache, settings_key
+from src.capture.filters import PacketFilter
+from src.capture.reader import PcapReader
+
+METRICS = ["latency", "packet_loss", "connections", "rtt", "throughput"]
+
+
+def canonical(results):
+    return json.dumps(results, sort_keys=True)
+
+
+@pytest.fixture
+def capture(tmp_path, clean_capture):
+    """A private copy of the clean capture, free to touch and rewrite."""
+    path = tmp_path / "clean.pcap"
+    shutil.copyfile(clean_capture, path)
+    return str(path)
+
+
+def test_results_come_from_the_manifest(tmp_path, capture):
+    cache = CaptureCache(str(tmp_path / "cache"))
+    first = analyze_capture(capture, METRICS, cache=cache)
+    assert canonical(cache.entry(capture).metrics(settings_key(METRICS))) == canonical(first)
+
+    # A hit returns the stored results without analyzing the capture again
+    cache.entry(capture).store_metrics(settings_key(METRICS), {"cached": True})
+    assert analyze_capture(capture, METRICS, cache=cache) == {"cached": True}
+
+
+def test_packet_table_replay_matches_parsing(tmp_path, capture, monkeypatch):
+    cache = CaptureCache(str(tmp_path / "cache"))
+    analyze_capture(capture, METRICS, cache=cache)
+    entry = cache.entry(capture)
+    with PcapReader(capture) as reader:
+        assert entry.has_packets and entry.packets == sum(len(batch) for batch in reader.batches())
+
+    expected = analyze_capture(capture, ["rtt", "heavy_hitters"])
+
+    def no_parsing(*args, **kwargs):
+        raise AssertionError("the capture was parsed")
+
+    monkeypatch.setattr(PcapReader, "batches", no_parsing)
+    assert canonical(analyze_capture(capture, ["rtt", "heavy_hitters"], cache=cache)) == canonical(expected)
+
+
+def test_settings_keys_separate_filters_and_windows(tmp_path, capture):
+    cache = CaptureCache(str(tmp_path / "cache"))
+    tcp_443 = PacketFilter.parse("tcp port 443")
+    window = (int(1.2e9), int(1.5e9))
+    keys = {settings_key(METRICS), settings_key(METRICS, packet_filter=tcp_443),
+            settings_key(METRICS, packet_filter=PacketFilter.parse("udp")), settings_key(METRICS, time_range=window)}
+    assert len(keys) == 4
+
+    whole = analyze_capture(capture, METRICS, cache=cache)
+    windowed = analyze_capture(capture, METRICS, cache=cache, time_range=window)
+    empty = analyze_capture(capture, METRICS, cache=cache, packet_filter=PacketFilter.parse("udp"))
+    assert windowed["capture_stats"]["packets_analyzed"] < whole["capture_stats"]["packets_analyzed"]
+    assert empty["capture_stats"]["packets_analyzed"] == 0
+    stored = cache.entry(capture).manifest["metrics"]
+    assert canonical(stored[settings_key(METRICS, time_range=window)]) == canonical(windowed)
+    assert canonical(stored[settings_key(METRICS)]) == canonical(whole)
+
+
+def test_rehash_after_mtime_or_size_change(tmp_path, capture, monkeypatch):
+    hashed = []
+    original = cache_module.content_hash
+    monkeypatch.setattr(cache_module, "content_hash", lambda path: hashed.append(path) or original(path))
+    cache = CaptureCache(str(tmp_path / "cache"))
+
+    key = cache.key(capture)
+    assert cache.key(capture) == key and len(hashed) == 1
+
+    # Same content, new mtime: hashed again, same key
+    stat = os.stat(capture)
+    os.utime(capture, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.key(capture) == key and len(hashed) == 2
+
+    # New size: a new key
+    with open(capture, "ab") as f:
+        f.write(b"\x00" * 16)
+    assert cache.key(capture) != key and len(hashed) == 3
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, capture):
+    cache = CaptureCache(str(tmp_path / "cache"))
+    entries = []
+    for name in ("a", "b", "c"):
+        path = str(tmp_path / f"{name}.pcap")
+        with open(capture, "rb") as source, open(path, "wb") as f:
+            f.write(source.read() + name.encode())
+        entry = cache.entry(path)
+        entry.store_metrics("settings", {"padding": "x" * 1000})
+        entries.append(entry)
+    # Used in the order b, c, a
+    for when, entry in zip((3, 1, 2), entries):
+        os.utime(entry.directory, (when * 1000, when * 1000))
+
+    size = cache.size() // 3
+    cache.max_bytes = 2 * size
+    cache.evict()
+    assert [os.path.isdir(entry.directory) for entry in entries] == [True, False, True]
+
+    # The entry in use survives even when it is the oldest
+    cache.max_bytes = size
+    os.utime(entries[0].directory, (0, 0))
+    cache.evict(keep=entries[0])
+    assert [os.path.isdir(entry.directory) for entry in entries] == [True, False, False]
@@ -0,0 +1,70 @@
+"""Reading gzip, xz, bzip2 and zstd compressed captures."""
+import bz2
+import functools
+import gzip
+import json
+import lzma
+
+import pytest
+
+from src.capture import compression, reader as reader_module
+from src.capture.analysis import analyze_capture
+from src.capture.compression import DecompressingStream, compression_of
+from src.capture.reader import PcapReader
+
+METRICS = ["latency", "throughput", "packet_loss", "connections", "rtt"]
+
+COMPRESSORS = {"gzip": (".gz", gzip.compress), "xz": (".xz", lzma.compress), "bzip2": (".bz2", bz2.compress)}
+
+
+def canonical(results):
+    return json.dumps(results, sort_keys=True)
+
+
+def compressed_copy(tmp_path, source: str, name: str) -> str:
+    suffix, compress = COMPRESSORS[name]
+    path = str(tmp_path / f"capture.pcap{suffix}")
+    with open(source, "rb") as f, open(path, "wb") as out:
+        out.write(compress(f.read()))
+    return path
+
+
+@pytest.fixture(scope="module")
+def expected(clean_capture):
+    return canonical(analyze_capture(clean_capture, METRICS))
+
+
+@pytest.mark.parametrize("name", sorted(COMPRESSORS))
+def test_compressed_copy_gives_the_same_results(tmp_path, clean_capture, expected, name):
+    path = compressed_copy(tmp_path, clean_capture, name)
+    assert compression_of(path) == name
+    assert canonical(analyze_capture(path, METRICS)) == expected
+
+
+@pytest.mark.parametrize("name", sorted(COMPRESSORS))
+def test_records_span_decompressed_chunks(tmp_path, clean_capture, expected, monkeypatch, name):
+    # Chunks far smaller than the capture, so many records straddle two of them
+    monkeypatch.setattr(reader_module, "DecompressingStream", functools.partial(DecompressingStream, chunk_size=40_000))
+    path = compressed_copy(tmp_path, clean_capture, name)
+    assert canonical(analyze_capture(path, METRICS, batch_size=500)) == expected
+    # data_offset points into the current window, so compare the other record fields
+    with PcapReader(path) as reader, PcapReader(clean_capture) as plain:
+        assert ([record[:1] + record[2:] for record in reader.records()]
+                == [record[:1] + record[2:] for record in plain.records()])
+
+
+def test_zstd(tmp_path, clean_capture, expected):
+    zstandard = pytest.importorskip("zstandard")
+    path = str(tmp_path / "capture.pcap.zst")
+    with open(clean_capture, "rb") as f, open(path, "wb") as out:
+        out.write(zstandard.ZstdCompressor().compress(f.read()))
+    assert canonical(analyze_capture(path, METRICS)) == expected
+
+
+def test_zstd_without_zstandard(tmp_path, monkeypatch):
+    monkeypatch.setattr(compression, "zstandard", None)
+    path = str(tmp_path / "capture.pcap.zst")
+    with open(path, "wb") as f:
+        f.write(compression.COMPRESSION_MAGIC["zstd"] + bytes(60))
+    with pytest.raises(ValueError, match="zstandard"):
+        PcapReader(path)
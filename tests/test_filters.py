@@ -0,0 +1,110 @@
+"""Packet filter parsing, evaluation and pushdown into the reader."""
+import json
+
+import pytest
+
+from src.capture import reader as reader_module
+from src.capture.batch import PacketBatch
+from src.capture.filters import PacketFilter, parse_rate
+from src.capture.reader import PcapReader
+
+from .captures import TCP_ACK, ethernet, ipv4, ipv6, sctp_frame, tcp, tcp_frame, udp_frame, write_pcap
+
+
+@pytest.fixture
+def mixed(tmp_path):
+    """TCP, UDP and SCTP over IPv4 and IPv6, plus a truncated TCP header."""
+    packets = [
+        tcp_frame("10.0.0.1", "10.1.0.1", 20000, 443, 1, 1, TCP_ACK),
+        tcp_frame("10.1.0.1", "10.0.0.1", 443, 20000, 1, 1, TCP_ACK),
+        tcp_frame("192.168.1.5", "10.1.0.1", 20001, 8080, 1, 1, TCP_ACK),
+        udp_frame("10.0.0.2", "10.1.0.2", 2152, 2152, b"x" * 40),
+        udp_frame("172.16.0.9", "8.8.8.8", 53000, 53, b"q" * 20),
+        sctp_frame("10.100.0.1", "10.100.0.2", 38412, 38412, b"n" * 32, 60),
+        ethernet(ipv6("2001:db8::1", "2001:db8:1::1", 6, tcp(30000, 443, 1, 1, TCP_ACK)), ethertype=0x86DD),
+        ethernet(ipv6("2001:db8:ff::1", "2001:db8:1::1", 17, b"\x13\x88\x00\x35\x00\x08\x00\x00"), ethertype=0x86DD),
+        ethernet(ipv4("10.0.0.3", "10.1.0.1", 6, tcp(20002, 443, 1, 1, TCP_ACK)[:12])),
+    ]
+    path = str(tmp_path / "mixed.pcap")
+    write_pcap(path, [(1.0 + index * 0.01, frame) for index, frame in enumerate(packets)])
+    return path
+
+
+def read(path, **kwargs) -> PacketBatch:
+    with PcapReader(path) as reader:
+        return PacketBatch.concat([batch.copy() for batch in reader.batches(4, **kwargs)])
+
+
+def records(batch):
+    return json.dumps(batch.to_records(), sort_keys=True)
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("tcp", [0, 1, 2, 6]),
+    ("udp sctp", [3, 4, 5, 7]),
+    ("port 443", [0, 1, 6]),
+    ("portrange 2000-3000 port 53", [3, 4, 7]),
+    ("tcp net 10.0.0.0/8", [0, 1, 2]),
+    ("net 10.0.0.0/24 host 8.8.8.8", [0, 1, 3, 4, 8]),
+    ("net 2001:db8::/48", [6]),
+    ("udp host 2001:db8:1::1 port 53", [7]),
+    ("TCP PORT 8080", [2]),
+])
+def test_mask(mixed, expression, expected):
+    packet_filter = PacketFilter.parse(expression)
+    batch = read(mixed)
+    assert packet_filter.mask(batch).nonzero()[0].tolist() == expected
+
+
+@pytest.mark.parametrize("expression", ["tcp", "net 10.0.0.0/8", "udp net 2001:db8::/32", "sctp net 10.100.0.0/16",
+                                        "tcp port 443 net 10.0.0.0/8", "port 53"])
+def test_pushdown_matches_filtering_after_decode(mixed, expression):
+    packet_filter = PacketFilter.parse(expression)
+    batch = read(mixed)
+    expected = batch.select(packet_filter.mask(batch))
+    assert records(read(mixed, packet_filter=packet_filter)) == records(expected)
+    fields = {"ts_ns", "length"} | packet_filter.fields
+    pushed = read(mixed, packet_filter=packet_filter, fields=fields)
+    assert pushed["ts_ns"].tolist() == expected["ts_ns"].tolist()
+
+
+def test_transport_decoded_only_for_matching_packets(mixed, monkeypatch):
+    decoded = []
+    original = reader_module._decode_transport
+    monkeypatch.setattr(reader_module, "_decode_transport",
+                        lambda raw, batch, *args: decoded.append(len(batch)) or original(raw, batch, *args))
+    assert len(read(mixed, packet_filter=PacketFilter.parse("udp net 172.16.0.0/12"))) == 1
+    assert sum(decoded) == 1
+
+    # Port terms need the transport headers of every packet
+    decoded.clear()
+    assert len(read(mixed, packet_filter=PacketFilter.parse("port 53"))) == 2
+    assert sum(decoded) == 9
+
+
+def test_parse():
+    assert PacketFilter.parse("") is None and PacketFilter.parse(None) is None
+    packet_filter = PacketFilter.parse("tcp, sctp port 80 portrange 30000-40000 net 10.1.2.3/16 host ::1 sample 5%")
+    assert packet_filter.protocols == ["TCP", "SCTP"]
+    assert packet_filter.ports == [(80, 80), (30000, 40000)]
+    assert packet_filter.sample.rate == 0.05
+    assert str(packet_filter) == "tcp sctp portrange 80-80 portrange 30000-40000 net 10.1.0.0/16 net ::1/128 sample 0.05"
+    assert str(PacketFilter.parse(str(packet_filter))) == str(packet_filter)
+    assert packet_filter.fields >= {"protocol", "src_port", "dst_port", "src_hi", "src_lo", "dst_hi", "dst_lo"}
+
+
+@pytest.mark.parametrize("expression", ["icmp", "port", "port http", "net 10.0.0.0/33", "sample 0", "sample 150%"])
+def test_parse_rejects_malformed_expressions(expression):
+    with pytest.raises(ValueError):
+        PacketFilter.parse(expression)
+
+
+@pytest.mark.parametrize("text, rate", [("0.01", 0.01), ("1%", 0.01), (" 25% ", 0.25), ("1", 1.0), ("100%", 1.0)])
+def test_parse_rate(text, rate):
+    assert parse_rate(text) == pytest.approx(rate)
+
+
+@pytest.mark.parametrize("text", ["0", "-0.5", "1.5", "0%", "101%", "", "half"])
+def test_parse_rate_rejects_out_of_range(text):
+    with pytest.raises(ValueError):
+        parse_rate(text)
@@ -0,0 +1,83 @@
+"""Fleet runs over a directory of good, damaged and compressed captures."""
+import glob
+import gzip
+import json
+import logging
+import shutil
+
+import pytest
+
+from src.capture.analysis import analyze_capture
+from src.capture.fleet import analyze_fleet, expand_captures
+from src.capture.sketch import QuantileSketch, distribution
+
+METRICS = ["latency", "throughput", "packet_loss", "connections", "rtt"]
+
+
+@pytest.fixture
+def fleet(tmp_path, clean_capture, lossy_capture):
+    """A directory with a clean capture, a corrupt one and a gzipped lossy one."""
+    directory = tmp_path / "captures"
+    directory.mkdir()
+    shutil.copyfile(clean_capture, directory / "clean.pcap")
+    with open(lossy_capture, "rb") as f:
+        (directory / "lossy.pcap.gz").write_bytes(gzip.compress(f.read()))
+    (directory / "corrupt.pcap").write_bytes(b"not a capture at all" * 10)
+    (directory / "notes.txt").write_text("not picked up")
+    return directory
+
+
+def merged_percentiles(paths, metric_names):
+    """Fleet percentiles computed directly from the per-capture sketches."""
+    sketches = {}
+    for path in paths:
+        for key, data in analyze_capture(path, metric_names)["sketches"].items():
+            sketch = QuantileSketch.from_dict(data)
+            if key in sketches:
+                sketches[key].merge(sketch)
+            else:
+                sketches[key] = sketch
+    return {key: {"samples": sketch.count, **distribution(sketch)} for key, sketch in sketches.items()}
+
+
+def check_fleet(fleet, records, summary, metric_names, clean_capture, lossy_capture):
+    paths = [str(fleet / name) for name in ("clean.pcap", "corrupt.pcap", "lossy.pcap.gz")]
+    assert [record["pcap_file"] for record in records] == paths
+    assert [record["status"] for record in records] == ["ok", "error", "ok"]
+    assert records[1]["error"].startswith("CaptureFormatError:")
+    assert (summary["captures"], summary["analyzed"], summary["failed"]) == (3, 2, 1)
+    assert summary["errors"] == {paths[1]: records[1]["error"]}
+
+    clean, lossy = (analyze_capture(path, metric_names) for path in (clean_capture, lossy_capture))
+    assert summary["totals"]["packets_analyzed"] == (clean["capture_stats"]["packets_analyzed"]
+                                                     + lossy["capture_stats"]["packets_analyzed"])
+    assert summary["percentiles"] == merged_percentiles([clean_capture, lossy_capture], metric_names)
+    rtt = summary["percentiles"]["tcp_rtt"]
+    assert rtt["samples"] == clean["sketches"]["tcp_rtt"]["count"] + lossy["sketches"]["tcp_rtt"]["count"]
+    retransmits = summary["metrics"]["packet_loss"]["retransmits"]
+    assert retransmits["min"] == 0 < retransmits["max"]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_fleet_of_good_corrupt_and_compressed_captures(fleet, clean_capture, lossy_capture, workers):
+    paths = expand_captures(str(fleet))
+    assert [path.rsplit("/", 1)[-1] for path in paths] == ["clean.pcap", "corrupt.pcap", "lossy.pcap.gz"]
+    records, summary = analyze_fleet(paths, METRICS, workers=workers, batch_size=1000)
+    check_fleet(fleet, records, summary, METRICS, clean_capture, lossy_capture)
+
+
+def test_run_batch_writes_records_and_summary(fleet, tmp_path, clean_capture, lossy_capture, monkeypatch):
+    pytest.importorskip("crewai")
+    from src import main
+
+    output = tmp_path / "output"
+    output.mkdir()
+    monkeypatch.setenv("OUTPUT_DIR", str(output))
+    assert main.run_batch(str(fleet), str(output), 2, logging.getLogger("test")) == 0
+
+    with open(glob.glob(str(output / "fleet_metrics_*.jsonl"))[0]) as f:
+        records = [json.loads(line) for line in f]
+    with open(glob.glob(str(output / "fleet_summary_*.json"))[0]) as f:
+        summary = json.load(f)
+    metric_names = main.PcapAnalyzerTool().analysis_settings()[0]
+    check_fleet(fleet, records, summary, metric_names, clean_capture, lossy_capture)
@@ -0,0 +1,64 @@
+"""Following a growing capture must end with the results of a full run."""
+import gzip
+import json
+
+import pytest
+
+from src.capture.analysis import analyze_capture
+from src.capture.follow import CaptureFollower
+
+METRICS = ["latency", "throughput", "packet_loss", "connections", "rtt"]
+
+
+@pytest.mark.parametrize("capture", ["lossy_capture", "lossy_pcapng"])
+def test_follow_matches_full_run(request, tmp_path, capture):
+    source = request.getfixturevalue(capture)
+    with open(source, "rb") as f:
+        data = f.read()
+    growing = tmp_path / ("growing" + source[source.rindex("."):])
+    follower = CaptureFollower(str(growing), METRICS, batch_size=1000)
+
+    # Cuts fall inside the file header and inside records
+    cuts = [100, 5000, len(data) // 3, len(data) // 3 + 7, len(data) // 2, len(data)]
+    previous, packets = 0, 0
+    for cut in cuts:
+        with open(growing, "ab") as f:
+            f.write(data[previous:cut])
+        previous = cut
+        packets += follower.refresh()
+
+    full = analyze_capture(source, METRICS, batch_size=1000)
+    assert packets == full["capture_stats"]["packets_analyzed"]
+    assert json.dumps(follower.results(), sort_keys=True) == json.dumps(full, sort_keys=True)
+
+
+def test_follow_restarts_on_truncation(tmp_path, lossy_capture):
+    with open(lossy_capture, "rb") as f:
+        data = f.read()
+    growing = tmp_path / "growing.pcap"
+    growing.write_bytes(data)
+    follower = CaptureFollower(str(growing), ["throughput"])
+    first = follower.refresh()
+    growing.write_bytes(data[:len(data) // 2])
+    assert 0 < follower.refresh() < first
+
+
+def test_follow_waits_for_the_file_header(tmp_path, lossy_capture):
+    with open(lossy_capture, "rb") as f:
+        data = f.read()
+    growing = tmp_path / "growing.pcap"
+    growing.write_bytes(b"")
+    follower = CaptureFollower(str(growing), ["throughput"])
+    assert follower.refresh() == 0
+    growing.write_bytes(data[:10])
+    assert follower.refresh() == 0
+    growing.write_bytes(data)
+    assert follower.refresh() == analyze_capture(lossy_capture, ["throughput"])["capture_stats"]["packets_analyzed"]
+
+
+def test_follow_rejects_compressed_captures(tmp_path, lossy_capture):
+    growing = tmp_path / "growing.pcap.gz"
+    with open(lossy_capture, "rb") as f, gzip.open(growing, "wb") as out:
+        out.write(f.read())
+    with pytest.raises(ValueError, match="cannot be followed"):
+        CaptureFollower(str(growing), ["throughput"]).refresh()
@@ -0,0 +1,45 @@
+"""Per-tunnel metrics of TCP sessions carried in GTP-U."""
+import struct
+
+from src.capture.analysis import analyze_capture
+
+from .captures import transfer, udp_frame, write_pcap
+
+GNB, UPF = "192.168.1.10", "192.168.1.20"
+
+
+def tunnelled(packets, client, uplink, downlink):
+    """Wrap a transfer in GTP-U: the client's packets go up one TEID, the server's come down another."""
+    wrapped = []
+    for ts, frame in packets:
+        inner = frame[14:]
+        up = inner[12:16] == bytes(map(int, client.split(".")))
+        header = struct.pack(">BBHI", 0x30, 0xFF, len(inner), uplink if up else downlink)
+        wrapped.append((ts, udp_frame(GNB, UPF, 2152, 2152, header + inner) if up
+                        else udp_frame(UPF, GNB, 2152, 2152, header + inner)))
+    return wrapped
+
+
+def test_sessions_ranked_by_throughput_latency_and_loss(tmp_path):
+    fast = transfer(1.0, "10.45.0.1", "10.1.0.1", 20000, 443, rtt=0.02, segments=40, lost=[10])
+    slow = transfer(1.0, "10.45.0.2", "10.1.0.1", 20001, 443, rtt=0.2, segments=5)
+    packets = sorted(tunnelled(fast, "10.45.0.1", 101, 201) + tunnelled(slow, "10.45.0.2", 102, 202),
+                     key=lambda packet: packet[0])
+    path = tmp_path / "n3.pcap"
+    write_pcap(str(path), packets)
+    gtpu = analyze_capture(str(path), ["gtpu"])["gtpu"]
+
+    assert (gtpu["tunnels"], gtpu["inner_flows"]) == (4, 2)
+    assert gtpu["by_teid"][0]["teid"] == 101
+    assert gtpu["by_flow"][0]["endpoint_a"] == "10.1.0.1:443"
+
+    # RTT samples come from the data the client sent up its TEID
+    slowest = gtpu["by_teid_latency"][0]
+    assert (slowest["teid"], slowest["rtt_avg_ms"], slowest["handshake_rtt_ms"]) == (102, 200.0, 200.0)
+    assert gtpu["by_flow_latency"][0]["teids"] == [102, 202]
+    assert [tunnel["teid"] for tunnel in gtpu["by_teid_latency"]] == [102, 202, 101, 201]
+
+    # Only the fast session's uplink lost a segment
+    assert [(tunnel["teid"], tunnel["retransmits"]) for tunnel in gtpu["by_teid_loss"]] == [(101, 1)]
+    # SYN, SYN-ACK, 40 data segments and the retransmission
+    assert gtpu["by_flow_loss"][0]["loss_percentage"] == round(100 / 42, 2)
@@ -0,0 +1,118 @@
+"""Offset index, time windows and flow ranges."""
+import json
+import shutil
+
+import numpy as np
+import pytest
+
+from src.capture.analysis import analyze_capture
+from src.capture.flows import FlowTable
+from src.capture.index import CaptureIndex, parse_time, select_window
+from src.capture.metrics import collect_results, create_accumulators, update_accumulators
+from src.capture.reader import PcapReader
+
+from .captures import transfer, write_pcap
+
+METRICS = ["latency", "throughput", "packet_loss", "connections", "rtt"]
+
+# 2024-06-12 14:12:00 UTC
+ORIGIN_NS = 1718201520 * 10 ** 9
+
+
+def canonical(results):
+    return json.dumps(results, sort_keys=True)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("+90s", ORIGIN_NS + 90 * 10 ** 9),
+    ("+90", ORIGIN_NS + 90 * 10 ** 9),
+    ("+2.5m", ORIGIN_NS + 150 * 10 ** 9),
+    ("+250ms", ORIGIN_NS + 250 * 10 ** 6),
+    ("14:02", ORIGIN_NS - 10 * 60 * 10 ** 9),
+    ("14:12:30.25", ORIGIN_NS + 30_250_000_000),
+    ("1718201520.5", ORIGIN_NS + 500_000_000),
+    ("1718201520", ORIGIN_NS),
+    ("2024-06-12T14:12:00", ORIGIN_NS),
+    ("2024-06-12 14:12:00.000001", ORIGIN_NS + 1000),
+    ("2024-06-12T16:12:00+02:00", ORIGIN_NS),
+])
+def test_parse_time(text, expected):
+    assert parse_time(text, ORIGIN_NS) == expected
+
+
+def test_parse_time_rejects_garbage():
+    with pytest.raises(ValueError):
+        parse_time("yesterday", ORIGIN_NS)
+
+
+def filtered_full_pass(path, start_ns, end_ns):
+    accumulators = create_accumulators(METRICS)
+    with PcapReader(path) as reader:
+        for batch in reader.batches(1000):
+            update_accumulators(accumulators, select_window(batch, start_ns, end_ns))
+    return collect_results(accumulators)
+
+
+@pytest.mark.parametrize("capture", ["lossy_capture", "lossy_pcapng"])
+@pytest.mark.parametrize("window", [(1.3, 1.6), (None, 1.2), (1.7, None), (0.0, 0.5)])
+def test_window_matches_filtered_full_pass(request, capture, window):
+    path = request.getfixturevalue(capture)
+    start_ns, end_ns = [None if bound is None else int(bound * 10 ** 9) for bound in window]
+    index = CaptureIndex.build(path, interval=64)
+    windowed = analyze_capture(path, METRICS, batch_size=1000, time_range=(start_ns, end_ns), index=index)
+    assert canonical(windowed) == canonical(filtered_full_pass(path, start_ns, end_ns))
+
+
+def test_window_reads_only_nearby_segments(lossy_capture):
+    index = CaptureIndex.build(lossy_capture, interval=64)
+    first, last = index.window_segments(int(1.3e9), int(1.4e9))
+    assert 0 < first <= last < index.segments - 1
+    assert np.all(index.ts_max[:first] < 1.3e9)
+    assert np.all(index.ts_min[last + 1:] >= 1.4e9)
+    assert index.window_segments(0, int(0.5e9)) is None
+
+
+def flow_keys(batch):
+    flows = FlowTable(batch)
+    return [flows.flow_keys()[flow] for flow in flows.flow.tolist()]
+
+
+def test_flow_range_holds_the_whole_flow(lossy_capture):
+    index = CaptureIndex.build(lossy_capture, interval=64)
+    flow = len(index.flow_keys) // 2
+    key = tuple(index.flow_keys[flow].tolist())
+    start, end, state = index.flow_range(key)
+    seen = 0
+    with PcapReader(lossy_capture) as reader:
+        for batch in reader.batches(1000, start=start, end=end, state=state):
+            seen += sum(1 for flow_key in flow_keys(batch) if flow_key == key)
+    assert seen == index.flow_stats[flow, 4] > 0
+    assert index.flow_range((6, 1, 2, 3, 4, 5, 6)) is None
+
+
+def test_index_is_rebuilt_after_the_capture_changes(tmp_path):
+    path = str(tmp_path / "growing.pcap")
+    write_pcap(path, transfer(1.0, "10.0.0.1", "10.1.0.1", 20000, 443, segments=20))
+    index = CaptureIndex.load_or_build(path, interval=8)
+    assert CaptureIndex.load(path) is not None
+    assert index.end_ns < 2 * 10 ** 9
+
+    write_pcap(path, transfer(1.0, "10.0.0.1", "10.1.0.1", 20000, 443, segments=20)
+               + transfer(5.0, "10.0.0.2", "10.1.0.1", 20001, 443, segments=20))
+    assert CaptureIndex.load(path) is None
+    rebuilt = CaptureIndex.load_or_build(path, interval=8)
+    assert rebuilt.segments > index.segments
+    assert rebuilt.end_ns > 5 * 10 ** 9
+    assert len(rebuilt.flow_keys) == 2
+    assert CaptureIndex.load(path).segments == rebuilt.segments
+
+
+def test_index_in_another_directory(tmp_path, clean_capture):
+    path = str(tmp_path / "clean.pcap")
+    shutil.copyfile(clean_capture, path)
+    directory = tmp_path / "indexes"
+    directory.mkdir()
+    CaptureIndex.load_or_build(path, directory=str(directory))
+    assert (directory / "clean.pcap.idx.npz").exists()
+    assert CaptureIndex.load(path) is None
+    assert CaptureIndex.load(path, str(directory)) is not None
@@ -0,0 +1,91 @@
+"""Timestamp merge of several captures."""
+import numpy as np
+import pytest
+
+from src.capture.analysis import analyze_capture
+from src.capture.merge import MergedReader, analyze_merged, parse_clock_offset
+
+from .captures import transfer, write_pcap, write_pcapng
+
+
+def read_all(paths, batch_size, offsets=None):
+    with MergedReader(paths, offsets) as reader:
+        return [batch.copy() for batch in reader.batches(batch_size)]
+
+
+def column(batches, name):
+    return np.concatenate([batch[name] for batch in batches])
+
+
+@pytest.fixture
+def taps(tmp_path):
+    """Two overlapping captures with distinct packets, one pcap and one pcapng."""
+    first, second = str(tmp_path / "n2.pcap"), str(tmp_path / "n3.pcapng")
+    write_pcap(first, transfer(1.0, "10.0.0.1", "10.1.0.1", 20000, 443, segments=30))
+    write_pcapng(second, transfer(1.0025, "10.0.0.2", "10.1.0.1", 20001, 443, segments=40))
+    return first, second
+
+
+@pytest.mark.parametrize("batch_size", [3, 16, 65536])
+def test_merged_stream_is_ordered_and_complete(taps, batch_size):
+    batches = read_all(taps, batch_size)
+    ts, source = column(batches, "ts_ns"), column(batches, "capture")
+    assert np.all(np.diff(ts) >= 0)
+    assert np.bincount(source).tolist() == [63, 83]
+
+
+def test_payload_bytes_follow_the_packets(taps):
+    frames = []
+    for path in taps:
+        with MergedReader([path]) as reader:
+            frames.append([bytes(batch.buffer[offset:offset + length]) for batch in reader.batches(7)
+                           for offset, length in zip(batch["data_offset"], batch["caplen"])])
+    merged = [[], []]
+    for batch in read_all(taps, 5):
+        for source, offset, length in zip(batch["capture"], batch["data_offset"], batch["caplen"]):
+            merged[source].append(bytes(batch.buffer[offset:offset + length]))
+    assert merged == frames
+
+
+@pytest.mark.parametrize("batch_size", [1, 16, 65536])
+def test_tied_inputs(tmp_path, batch_size):
+    # A capture merged with a copy of itself: every pending batch ends on the same timestamp
+    path = str(tmp_path / "a.pcap")
+    write_pcap(path, transfer(1.0, "10.0.0.1", "10.1.0.1", 20000, 443, segments=30))
+    batches = read_all([path, path], batch_size)
+    ts, source = column(batches, "ts_ns"), column(batches, "capture")
+    assert np.all(np.diff(ts) >= 0)
+    assert np.array_equal(ts[source == 0], ts[source == 1])
+    assert len(ts) == 2 * 63
+    assert analyze_merged([path, path], ["latency"], batch_size=batch_size)["latency"]["avg_ms"] == 20.0
+
+
+@pytest.mark.parametrize("batch_size", [4, 65536])
+def test_exhausted_input(tmp_path, batch_size):
+    short, long = str(tmp_path / "short.pcap"), str(tmp_path / "long.pcap")
+    write_pcap(short, transfer(1.0, "10.0.0.1", "10.1.0.1", 20000, 443, segments=2))
+    write_pcap(long, transfer(1.0, "10.0.0.2", "10.1.0.1", 20001, 443, segments=50))
+    ts = column(read_all([short, long], batch_size), "ts_ns")
+    assert len(ts) == 7 + 103
+    assert np.all(np.diff(ts) >= 0)
+
+
+def test_merged_metrics_add_up(taps):
+    merged = analyze_merged(taps, ["latency", "packet_loss", "rtt"], batch_size=8)
+    single = [analyze_capture(path, ["latency", "packet_loss", "rtt"]) for path in taps]
+    assert merged["tcp_rtt"]["samples"] == sum(result["tcp_rtt"]["samples"] for result in single)
+    assert merged["packet_loss"]["segments"]["new"] == sum(result["packet_loss"]["segments"]["new"]
+                                                           for result in single)
+    assert merged["capture_stats"]["packets_analyzed"] == 63 + 83
+
+
+def test_clock_offsets(taps):
+    plain = column(read_all(taps, 16), "ts_ns")
+    shifted = read_all(taps, 16, [0, parse_clock_offset("-1.5ms")])
+    ts, source = column(shifted, "ts_ns"), column(shifted, "capture")
+    assert np.all(np.diff(ts) >= 0)
+    assert ts[source == 1].min() == plain.min() + 2_500_000 - 1_500_000
+    assert parse_clock_offset("+200us") == 200_000
+    assert parse_clock_offset("0.25") == 250_000_000
+    with pytest.raises(ValueError):
+        parse_clock_offset("soon")
@@ -0,0 +1,141 @@
+"""Known-answer checks for the latency, loss and RTT accumulators."""
+import pytest
+
+from src.capture.analysis import analyze_capture
+from src.capture.metrics import collect_results, create_accumulators, merge_accumulators, update_accumulators
+from src.capture.reader import PcapReader
+
+from .captures import SERVER_ISN, TCP_ACK, TCP_PSH, tcp_frame, transfer, write_pcap
+
+METRICS = ["latency", "packet_loss", "connections", "rtt"]
+
+
+def analyze(path, packets, batch_size=65536):
+    write_pcap(str(path), packets)
+    return analyze_capture(str(path), METRICS, batch_size=batch_size)
+
+
+@pytest.mark.parametrize("batch_size", [7, 65536])
+def test_handshake_latency(tmp_path, batch_size):
+    packets = (transfer(1.0, "10.0.0.1", "10.1.0.1", 20000, 443, rtt=0.02, segments=5)
+               + transfer(2.0, "10.0.0.2", "10.1.0.1", 20001, 443, rtt=0.05, segments=5))
+    latency = analyze(tmp_path / "latency.pcap", sorted(packets, key=lambda p: p[0]), batch_size)["latency"]
+    assert latency["avg_ms"] == 35.0
+    assert latency["min_ms"] == 20.0
+    assert latency["max_ms"] == 50.0
+
+
+def test_retransmitted_syn_ack_is_ignored(tmp_path):
+    packets = transfer(1.0, "10.0.0.1", "10.1.0.1", 20000, 443, rtt=0.02, segments=3)
+    # The server sends its SYN-ACK again 1 s later
+    packets.append((2.0, packets[1][1]))
+    latency = analyze(tmp_path / "syn_ack.pcap", sorted(packets, key=lambda p: p[0]))["latency"]
+    assert latency["min_ms"] == latency["max_ms"] == 20.0
+
+
+@pytest.mark.parametrize("batch_size", [7, 65536])
+def test_connection_count(tmp_path, batch_size):
+    packets = (transfer(1.0, "10.0.0.1", "10.1.0.1", 20000, 443, segments=5)
+               + transfer(2.5, "10.0.0.2", "10.1.0.1", 20001, 443, segments=5))
+    results = analyze(tmp_path / "connections.pcap", sorted(packets, key=lambda p: p[0]), batch_size)
+    # One connection per bidirectional flow, not per direction
+    assert results["connection_stats"]["total_connections"] == 2
+    assert sum(results["timeseries"]["new_connections"]) == 2
+
+
+def test_retransmitted_syn_opens_one_connection(tmp_path):
+    packets = transfer(2.0, "10.0.0.1", "10.1.0.1", 20000, 443, segments=5)
+    # The client's first SYN goes unanswered and is sent again 1 s later
+    first_syn = (1.0, packets[0][1])
+    results = analyze(tmp_path / "syn.pcap", [first_syn] + packets, batch_size=1)
+    assert sum(results["timeseries"]["new_connections"]) == 1
+
+    # Split between the two SYNs and merged, as in a parallel run
+    parts = []
+    for name, part in (("first.pcap", [first_syn]), ("rest.pcap", packets)):
+        write_pcap(str(tmp_path / name), part)
+        accumulators = create_accumulators(["connections"])
+        with PcapReader(str(tmp_path / name)) as reader:
+            for batch in reader.batches():
+                update_accumulators(accumulators, batch)
+        parts.append(accumulators)
+    results = collect_results(merge_accumulators(parts))
+    assert results["connection_stats"]["total_connections"] == 1
+    assert sum(results["timeseries"]["new_connections"]) == 1
+
+
+@pytest.mark.parametrize("client_isn", [1000, (1 << 32) - 30000])
+@pytest.mark.parametrize("batch_size", [16, 65536])
+def test_loss_classes(tmp_path, client_isn, batch_size):
+    packets = transfer(1.0, "10.0.0.1", "10.1.0.1", 20000, 443, segments=100, client_isn=client_isn,
+                       lost=[10], reordered=[30], spurious=[50], keep_alives=2)
+    loss = analyze(tmp_path / "loss.pcap", packets, batch_size)["packet_loss"]
+    # SYN, SYN-ACK and the 98 data segments seen in order
+    assert loss["segments"] == {"new": 100, "retransmission": 2, "out_of_order": 1, "keep_alive": 2}
+    assert loss["retransmits"] == 2
+    assert loss["spurious_retransmits"] == 1
+    # One real loss in 103 segments
+    assert loss["loss_percentage"] == 0.97
+
+
+def test_no_loss(tmp_path):
+    loss = analyze(tmp_path / "clean.pcap", transfer(1.0, "10.0.0.1", "10.1.0.1", 20000, 443))["packet_loss"]
+    assert loss["retransmits"] == loss["segments"]["out_of_order"] == loss["loss_percentage"] == 0
+
+
+@pytest.mark.parametrize("batch_size", [5, 65536])
+def test_rtt_from_every_segment(tmp_path, batch_size):
+    packets = (transfer(1.0, "10.0.0.1", "10.1.0.1", 20000, 443, rtt=0.02, segments=20)
+               + transfer(2.0, "10.0.0.2", "10.1.0.1", 20001, 443, rtt=0.05, segments=10))
+    rtt = analyze(tmp_path / "rtt.pcap", sorted(packets, key=lambda p: p[0]), batch_size)["tcp_rtt"]
+    assert rtt["samples"] == 30
+    assert rtt["avg_ms"] == 30.0
+    assert (rtt["min_ms"], rtt["max_ms"]) == (20.0, 50.0)
+    assert [flow["samples"] for flow in rtt["flows"]] == [20, 10]
+
+
+@pytest.mark.parametrize("client_isn", [1000, (1 << 32) - 30000])
+def test_rtt_karn_rule(tmp_path, client_isn):
+    packets = transfer(1.0, "10.0.0.1", "10.1.0.1", 20000, 443, rtt=0.02, segments=20, client_isn=client_isn)
+    # Segment 5 is sent again 10 ms later, before its ACK, which then matches either copy
+    sent, frame = [packet for packet in packets if len(packet[1]) > 1000][5]
+    packets = sorted(packets + [(sent + 0.01, frame)], key=lambda p: p[0])
+    rtt = analyze(tmp_path / "karn.pcap", packets)["tcp_rtt"]
+    assert rtt["samples"] == 19
+    assert rtt["min_ms"] == rtt["max_ms"] == 20.0
+
+    # Segments 5 and 6 (sent at 1.047 s and 1.052 s) are sent again as one segment before either ACK
+    packets = transfer(1.0, "10.0.0.1", "10.1.0.1", 20000, 443, rtt=0.02, segments=20, client_isn=client_isn)
+    resend = tcp_frame("10.0.0.1", "10.1.0.1", 20000, 443, client_isn + 1 + 5 * 1000, SERVER_ISN + 1,
+                       TCP_PSH | TCP_ACK, b"x" * 2000)
+    packets = sorted(packets + [(1.06, resend)], key=lambda p: p[0])
+    rtt = analyze(tmp_path / "karn_both.pcap", packets)["tcp_rtt"]
+    assert rtt["samples"] == 18
+    assert rtt["min_ms"] == rtt["max_ms"] == 20.0
+
+
+def test_rtt_sketches_only_for_busy_directions(tmp_path):
+    packets = transfer(1.0, "10.0.0.1", "10.1.0.1", 20000, 443, rtt=0.02, segments=100)
+    for client in range(10):
+        packets += transfer(1.0 + client * 0.05, f"10.0.1.{client + 1}", "10.1.0.1", 20000, 443, segments=3)
+    write_pcap(str(tmp_path / "busy.pcap"), sorted(packets, key=lambda p: p[0]))
+    accumulators = create_accumulators(["rtt"], {"rtt": {"top": 3, "capacity": 4}})
+    with PcapReader(str(tmp_path / "busy.pcap")) as reader:
+        for batch in reader.batches(16):
+            update_accumulators(accumulators, batch)
+    rtt = accumulators["tcp_rtt"]
+    assert len(rtt.direction_sketches) <= 4
+    busiest = rtt.result()["flows"][0]
+    # The busiest direction is monitored from its first samples on
+    assert busiest["samples"] == 100
+    assert busiest["p50_ms"] == pytest.approx(20.0, rel=0.01)
+
+
+def test_rtt_after_loss(tmp_path):
+    packets = transfer(1.0, "10.0.0.1", "10.1.0.1", 20000, 443, rtt=0.02, segments=100,
+                       lost=[10], spurious=[50])
+    rtt = analyze(tmp_path / "loss.pcap", packets)["tcp_rtt"]
+    # The late copy of segment 10 and the second copy of segment 50 are retransmissions;
+    # the first copy of 50 was acknowledged before it was resent, so it still counts
+    assert rtt["samples"] == 99
+    assert rtt["min_ms"] == 20.0
@@ -0,0 +1,62 @@
+"""NGAP procedure pairing and timeouts."""
+import json
+import struct
+
+import pytest
+
+from src.capture.analysis import analyze_capture
+from src.capture.metrics import collect_results
+from src.capture.parallel import analyze_parallel
+
+from .captures import sctp_frame, write_pcap
+
+GNB, AMF = "10.100.50.1", "10.100.50.2"
+INITIAL_CONTEXT_SETUP = 14
+
+
+def ngap(message_type: int, code: int, amf_ue_id: int, ran_ue_id: int) -> bytes:
+    """An NGAP-PDU carrying only the AMF-UE-NGAP-ID and RAN-UE-NGAP-ID IEs, one octet each."""
+    ies = struct.pack(">HBBBB", 10, 0, 2, 0x00, amf_ue_id) + struct.pack(">HBBBB", 85, 0, 2, 0x00, ran_ue_id)
+    value = b"\x00" + struct.pack(">H", 2) + ies
+    return bytes([message_type << 5, code, 0, len(value)]) + value
+
+
+def message(ts: float, message_type: int, ue: int, code: int = INITIAL_CONTEXT_SETUP):
+    src, dst = (AMF, GNB) if message_type == 0 else (GNB, AMF)
+    return ts, sctp_frame(src, dst, 38412, 38412, ngap(message_type, code, ue, ue), ppid=60)
+
+
+def analyze(tmp_path, packets, **kwargs):
+    path = tmp_path / "n2.pcap"
+    write_pcap(str(path), sorted(packets, key=lambda packet: packet[0]))
+    return analyze_capture(str(path), ["ngap_procedures"], **kwargs)["ngap_procedures"]
+
+
+def test_procedures_are_paired(tmp_path):
+    latency = analyze(tmp_path, [message(1.0, 0, 1), message(1.02, 1, 1), message(1.1, 0, 2), message(1.15, 2, 2)])
+    setup = latency["procedures"]["InitialContextSetup"]
+    assert (setup["completed"], setup["failures"], setup["unanswered"]) == (2, 1, 0)
+    assert setup["latency_ms"]["max"] == pytest.approx(50, rel=0.01)
+
+
+def test_unanswered_procedures_expire(tmp_path):
+    packets = [message(1.0, 0, 1)]
+    packets += [message(1.0 + second, 0, 100 + second) for second in range(1, 60)]
+    packets += [message(1.01 + second, 1, 100 + second) for second in range(1, 60)]
+    # An outcome after the timeout no longer pairs, and one too late to belong to an earlier part
+    packets += [message(50.0, 0, 3), message(85.0, 1, 3), message(45.0, 1, 4)]
+    setup = analyze(tmp_path, packets, batch_size=16)["procedures"]["InitialContextSetup"]
+    assert (setup["completed"], setup["unanswered"], setup["unmatched_outcomes"]) == (59, 2, 2)
+
+
+def test_parallel_matches_sequential(tmp_path):
+    packets = []
+    for ue in range(250):
+        ts = 1.0 + ue * 0.05
+        packets += [message(ts, 0, ue), message(ts + 0.003 + ue % 5 * 0.001, 1 + ue % 9 // 8, ue)]
+    path = tmp_path / "n2.pcap"
+    write_pcap(str(path), sorted(packets, key=lambda packet: packet[0]))
+    sequential = analyze_capture(str(path), ["ngap_procedures"], batch_size=64)["ngap_procedures"]
+    parallel = collect_results(analyze_parallel(str(path), ["ngap_procedures"], 3, batch_size=64))["ngap_procedures"]
+    assert sequential["completed"] == 250
+    assert json.dumps(parallel, sort_keys=True) == json.dumps(sequential, sort_keys=True)
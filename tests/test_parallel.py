@@ -0,0 +1,38 @@
+"""Parallel and sequential analysis of the same capture must agree."""
+import json
+
+import pytest
+
+from src.capture.analysis import analyze_capture
+from src.capture.metrics import collect_results
+from src.capture.parallel import analyze_parallel
+
+METRICS = ["latency", "throughput", "signal", "packet_loss", "connections", "rtt", "heavy_hitters"]
+
+
+def canonical(results):
+    return {key: json.dumps(value, sort_keys=True) for key, value in results.items()}
+
+
+def without_rtt(results):
+    """Results minus everything derived from RTT samples."""
+    results = dict(results)
+    results.pop("tcp_rtt")
+    results["sketches"] = {key: sketch for key, sketch in results["sketches"].items() if key != "tcp_rtt"}
+    results["timeseries"] = {key: series for key, series in results["timeseries"].items() if key != "rtt_avg_ms"}
+    return results
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_parallel_matches_sequential(clean_capture, workers):
+    sequential = analyze_capture(clean_capture, METRICS, batch_size=1000)
+    parallel = collect_results(analyze_parallel(clean_capture, METRICS, workers, batch_size=1000))
+    assert canonical(parallel) == canonical(sequential)
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_parallel_matches_sequential_with_loss(lossy_capture, workers):
+    # RTT samples of retransmissions straddling a range boundary are not excluded
+    sequential = analyze_capture(lossy_capture, METRICS, batch_size=1000)
+    parallel = collect_results(analyze_parallel(lossy_capture, METRICS, workers, batch_size=1000))
+    assert canonical(without_rtt(parallel)) == canonical(without_rtt(sequential))
@@ -0,0 +1,94 @@
+"""PFCP request matching, retransmissions and timeouts."""
+import json
+import struct
+
+import pytest
+
+from src.capture.analysis import analyze_capture
+from src.capture.metrics import collect_results
+from src.capture.parallel import analyze_parallel
+
+from .captures import udp_frame, write_pcap
+
+SMF, UPF = "10.100.200.3", "10.100.200.101"
+
+
+def pfcp(message_type: int, seid: int, sequence: int, *ies: bytes) -> bytes:
+    body = struct.pack(">Q", seid) + struct.pack(">I", sequence << 8) + b"".join(ies)
+    return struct.pack(">BBH", 0x21, message_type, len(body)) + body
+
+
+def cause(value: int = 1) -> bytes:
+    return struct.pack(">HHB", 19, 1, value)
+
+
+def f_seid(seid: int) -> bytes:
+    return struct.pack(">HHBQ4s", 57, 13, 0x02, seid, bytes([10, 0, 0, 1]))
+
+
+def request(ts: float, message_type: int, seid: int, sequence: int):
+    return ts, udp_frame(SMF, UPF, 8805, 8805, pfcp(message_type, seid, sequence))
+
+
+def response(ts: float, message_type: int, seid: int, sequence: int):
+    return ts, udp_frame(UPF, SMF, 8805, 8805, pfcp(message_type, seid, sequence, cause(), f_seid(seid + 1000)))
+
+
+def analyze(tmp_path, packets, **kwargs):
+    path = tmp_path / "n4.pcap"
+    write_pcap(str(path), sorted(packets, key=lambda packet: packet[0]))
+    return analyze_capture(str(path), ["pfcp"], **kwargs)["pfcp"]
+
+
+def test_retransmitted_request_keeps_its_first_transmission(tmp_path):
+    pfcp_metrics = analyze(tmp_path, [
+        request(1.0, 50, 1, 7), request(4.0, 50, 1, 7), response(4.5, 51, 1, 7),
+        request(5.0, 56, 1, 8), request(8.0, 56, 1, 8), response(8.1, 57, 1, 8)
+    ])
+    establishment = pfcp_metrics["procedures"]["SessionEstablishment"]
+    assert (establishment["completed"], establishment["retransmits"], establishment["unanswered"]) == (1, 1, 0)
+    assert establishment["latency_ms"]["max"] == pytest.approx(3500, rel=0.01)
+    assert pfcp_metrics["session_records"][0]["reports"] == 1
+
+
+def test_unanswered_requests_expire(tmp_path):
+    packets = [request(1.0, 52, 1, 1)]
+    # Heartbeats keep the capture going long past the timeout
+    packets += [request(1.0 + second, 1, 0, 100 + second) for second in range(1, 60)]
+    packets += [response(1.001 + second, 2, 0, 100 + second) for second in range(1, 60)]
+    # A response to nothing, too late to belong to an earlier part
+    packets.append(response(45.0, 55, 1, 9))
+    pfcp_metrics = analyze(tmp_path, packets, batch_size=16)
+    assert pfcp_metrics["procedures"]["SessionModification"]["unanswered"] == 1
+    assert pfcp_metrics["procedures"]["SessionDeletion"]["unmatched_responses"] == 1
+    assert pfcp_metrics["procedures"]["Heartbeat"]["completed"] == 59
+
+
+def test_node_messages_pair_up(tmp_path):
+    # Node reports and session-set deletions are the even-numbered node requests
+    pfcp_metrics = analyze(tmp_path, [
+        request(1.0, 12, 0, 1), response(1.002, 13, 0, 1),
+        request(2.0, 14, 0, 2), response(2.004, 15, 0, 2),
+        request(3.0, 1, 0, 3), response(3.001, 2, 0, 3)
+    ])
+    for name in ("NodeReport", "SessionSetDeletion", "Heartbeat"):
+        procedure = pfcp_metrics["procedures"][name]
+        assert (procedure["completed"], procedure["unanswered"], procedure["unmatched_responses"]) == (1, 0, 0)
+    assert pfcp_metrics["procedures"]["NodeReport"]["latency_ms"]["max"] == pytest.approx(2, rel=0.01)
+
+
+def test_parallel_matches_sequential(tmp_path):
+    packets = []
+    for session in range(300):
+        ts = 1.0 + session * 0.05
+        packets += [request(ts, 50, session, session), response(ts + 0.004, 51, session, session)]
+        if session % 7 == 0:
+            packets.append(request(ts + 0.002, 50, session, session))
+        if session % 3 == 0:
+            packets += [request(ts + 1, 54, session, session + 1000), response(ts + 1.003, 55, session, session + 1000)]
+    path = tmp_path / "n4.pcap"
+    write_pcap(str(path), sorted(packets, key=lambda packet: packet[0]))
+    sequential = analyze_capture(str(path), ["pfcp"], batch_size=64)["pfcp"]
+    parallel = collect_results(analyze_parallel(str(path), ["pfcp"], 3, batch_size=64))["pfcp"]
+    assert sequential["procedures"]["SessionEstablishment"]["retransmits"] == 43
+    assert json.dumps(parallel, sort_keys=True) == json.dumps(sequential, sort_keys=True)
@@ -0,0 +1,132 @@
+"""Link, network and transport decoding of the supported capture formats."""
+import pytest
+
+from src.capture.batch import PacketBatch
+from src.capture.reader import PcapReader
+
+from .captures import (TCP_ACK, TCP_PSH, ethernet, ipv4, ipv6, tcp, tcp_frame, udp, vlan,
+                       write_pcap, write_pcapng)
+
+CLIENT, SERVER = "10.0.0.1", "10.1.0.1"
+CLIENT6, SERVER6 = "2001:db8::1", "2001:db8:0:1::53"
+PAYLOAD = b"x" * 100
+
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+
+def segment() -> bytes:
+    return tcp(20000, 443, 1234, 5678, TCP_PSH | TCP_ACK, PAYLOAD)
+
+
+def sll(payload: bytes, ethertype: int = 0x0800) -> bytes:
+    return bytes.fromhex("0000 0001 0006 001122334455 0000") + ethertype.to_bytes(2, "big") + payload
+
+
+def sll2(payload: bytes, ethertype: int = 0x0800) -> bytes:
+    return ethertype.to_bytes(2, "big") + bytes.fromhex("0000 00000002 0001 00 06 001122334455 0000") + payload
+
+
+def read(path: str) -> PacketBatch:
+    with PcapReader(path) as reader:
+        return PacketBatch.concat([batch.copy() for batch in reader.batches()])
+
+
+def assert_segment(path: str, batch: PacketBatch, row: int, src: str = CLIENT, dst: str = SERVER):
+    """The row decodes to segment() between src and dst, payload included."""
+    record = batch.to_records()[row]
+    assert (record["protocol"], record["src_ip"], record["dst_ip"]) == ("TCP", src, dst)
+    assert (record["src_port"], record["dst_port"], record["seq"], record["ack"]) == (20000, 443, 1234, 5678)
+    assert int(batch["tcp_flags"][row]) == TCP_PSH | TCP_ACK
+    assert int(batch["payload_len"][row]) == len(PAYLOAD)
+    # Offsets count bytes of the capture file itself
+    with open(path, "rb") as f:
+        f.seek(int(batch["payload_offset"][row]))
+        assert f.read(len(PAYLOAD)) == PAYLOAD
+
+
+def test_vlan_and_qinq(tmp_path):
+    path = str(tmp_path / "vlan.pcap")
+    write_pcap(path, [
+        (1.0, ethernet(vlan(ipv4(CLIENT, SERVER, 6, segment()), 100), ethertype=0x8100)),
+        (1.1, ethernet(vlan(vlan(ipv4(CLIENT, SERVER, 6, segment()), 20), 10, ethertype=0x8100),
+                       ethertype=0x88A8)),
+        (1.2, tcp_frame(CLIENT, SERVER, 20000, 443, 1234, 5678, TCP_PSH | TCP_ACK, PAYLOAD))
+    ])
+    batch = read(path)
+    assert len(batch) == 3
+    for row in range(3):
+        assert_segment(path, batch, row)
+
+
+def test_ipv6_extension_headers(tmp_path):
+    hop_by_hop, routing, fragment, destination = 0, 43, 44, 60
+    path = str(tmp_path / "ipv6.pcap")
+    write_pcap(path, [
+        (1.0, ethernet(ipv6(CLIENT6, SERVER6, 6, segment(), hop_limit=57), ethertype=0x86DD)),
+        (1.1, ethernet(ipv6(CLIENT6, SERVER6, 6, segment(), hop_limit=57, extensions=[
+            (hop_by_hop, b""), (routing, bytes(6 + 16)), (destination, bytes(12))]), ethertype=0x86DD)),
+        # A first fragment carries the transport header, a later one does not
+        (1.2, ethernet(ipv6(CLIENT6, SERVER6, 6, segment(), hop_limit=57, extensions=[
+            (fragment, bytes.fromhex("0001 00000007"))]), ethertype=0x86DD)),
+        (1.3, ethernet(ipv6(CLIENT6, SERVER6, 6, PAYLOAD, hop_limit=57, extensions=[
+            (fragment, bytes.fromhex("0100 00000007"))]), ethertype=0x86DD)),
+    ])
+    batch = read(path)
+    for row in range(3):
+        assert_segment(path, batch, row, CLIENT6, SERVER6)
+    assert batch["ip_version"].tolist() == [6] * 4
+    assert batch["ttl"].tolist() == [57] * 4
+    later = batch.to_records()[3]
+    assert (later["protocol"], later["src_ip"], later["dst_ip"]) == (None, CLIENT6, SERVER6)
+    assert int(batch["payload_len"][3]) == 0
+
+
+@pytest.mark.parametrize("linktype, frame", [
+    (LINKTYPE_LINUX_SLL, sll(ipv4(CLIENT, SERVER, 6, segment()))),
+    (LINKTYPE_LINUX_SLL2, sll2(ipv4(CLIENT, SERVER, 6, segment()))),
+    (LINKTYPE_RAW, ipv4(CLIENT, SERVER, 6, segment())),
+    (LINKTYPE_IPV4, ipv4(CLIENT, SERVER, 6, segment())),
+])
+def test_link_types(tmp_path, linktype, frame):
+    path = str(tmp_path / "link.pcap")
+    write_pcap(path, [(1.0, frame)], linktype=linktype)
+    batch = read(path)
+    assert batch["linktype"].tolist() == [linktype]
+    assert_segment(path, batch, 0)
+
+
+@pytest.mark.parametrize("linktype, frame", [
+    (LINKTYPE_LINUX_SLL, sll(ipv6(CLIENT6, SERVER6, 6, segment()), ethertype=0x86DD)),
+    (LINKTYPE_LINUX_SLL2, sll2(ipv6(CLIENT6, SERVER6, 6, segment()), ethertype=0x86DD)),
+    (LINKTYPE_RAW, ipv6(CLIENT6, SERVER6, 6, segment())),
+    (LINKTYPE_IPV6, ipv6(CLIENT6, SERVER6, 6, segment())),
+])
+def test_link_types_ipv6(tmp_path, linktype, frame):
+    path = str(tmp_path / "link6.pcap")
+    write_pcap(path, [(1.0, frame)], linktype=linktype)
+    assert_segment(path, read(path), 0, CLIENT6, SERVER6)
+
+
+@pytest.mark.parametrize("endian", ["<", ">"])
+def test_pcapng_interfaces(tmp_path, endian):
+    path = str(tmp_path / "interfaces.pcapng")
+    # Ethernet in nanoseconds, raw IP in microseconds, Linux cooked in milliseconds
+    write_pcapng(path, [
+        (1.000000001, tcp_frame(CLIENT, SERVER, 20000, 443, 1234, 5678, TCP_PSH | TCP_ACK, PAYLOAD), 0),
+        (1.250001, ipv6(CLIENT6, SERVER6, 6, segment()), 1),
+        (1.5, sll2(ipv4(CLIENT, SERVER, 17, udp(5000, 53, PAYLOAD))), 2),
+        (2.000000002, tcp_frame(CLIENT, SERVER, 20000, 443, 1234, 5678, TCP_PSH | TCP_ACK, PAYLOAD), 0),
+    ], interfaces=[(1, 9), (LINKTYPE_RAW, 6), (LINKTYPE_LINUX_SLL2, 3)], endian=endian)
+    batch = read(path)
+    assert batch["ts_ns"].tolist() == [1_000_000_001, 1_250_001_000, 1_500_000_000, 2_000_000_002]
+    assert batch["linktype"].tolist() == [1, LINKTYPE_RAW, LINKTYPE_LINUX_SLL2, 1]
+    assert_segment(path, batch, 0)
+    assert_segment(path, batch, 1, CLIENT6, SERVER6)
+    assert_segment(path, batch, 3)
+    record = batch.to_records()[2]
+    assert (record["protocol"], record["src_port"], record["dst_port"]) == ("UDP", 5000, 53)
+    assert int(batch["payload_len"][2]) == len(PAYLOAD)
@@ -0,0 +1,66 @@
+"""Flow-sample estimates against captures with a known number of flows."""
+import pytest
+
+from src.capture.analysis import analyze_capture
+from src.capture.filters import PacketFilter
+from src.capture.reader import PcapReader
+from src.capture.sampling import FlowSample, SampleAccumulator
+
+from .captures import many_transfers, udp_frame, write_pcap
+
+FLOWS = 3000
+PACKETS_PER_FLOW = 4
+
+
+@pytest.fixture(scope="module")
+def udp_flows(tmp_path_factory):
+    """FLOWS UDP flows of PACKETS_PER_FLOW 100-byte payloads each."""
+    packets = [(1.0 + (flow * PACKETS_PER_FLOW + packet) * 1e-4,
+                udp_frame(f"10.{flow // 60000}.{flow // 250 % 240}.{flow % 250 + 1}", "10.255.0.1",
+                          1024 + flow % 50000, 2152, b"x" * 100))
+               for flow in range(FLOWS) for packet in range(PACKETS_PER_FLOW)]
+    path = tmp_path_factory.mktemp("captures") / "udp.pcap"
+    write_pcap(str(path), packets)
+    return str(path)
+
+
+def estimates(path, rate):
+    results = analyze_capture(path, ["throughput"], packet_filter=PacketFilter().sampled(rate))
+    return results["sampling"]["estimates"]
+
+
+def test_full_rate_counts_every_flow(udp_flows):
+    # A filter never samples at rate 1, so feed the accumulator directly
+    accumulator = SampleAccumulator(FlowSample(1.0))
+    with PcapReader(udp_flows) as reader:
+        for batch in reader.batches(1000):
+            accumulator.update(batch)
+    result = accumulator.result()["estimates"]
+    assert abs(result["flows"]["estimate"] - FLOWS) <= 0.05 * FLOWS
+    assert result["packets"]["sampled"] == result["packets"]["estimate"] == FLOWS * PACKETS_PER_FLOW
+
+
+@pytest.mark.parametrize("rate", [0.1, 0.3])
+def test_sampled_flow_estimate(udp_flows, rate):
+    result = estimates(udp_flows, rate)
+    flows, packets = result["flows"], result["packets"]
+    # Whole flows are sampled, so the sampled flow count follows from the packets
+    assert abs(flows["sampled"] - packets["sampled"] / PACKETS_PER_FLOW) <= 0.05 * flows["sampled"]
+    assert flows["ci_low"] <= FLOWS <= flows["ci_high"]
+    assert packets["ci_low"] <= FLOWS * PACKETS_PER_FLOW <= packets["ci_high"]
+
+
+def test_sample_totals_are_extrapolated(tmp_path):
+    path = str(tmp_path / "tcp.pcap")
+    write_pcap(path, many_transfers(1000, spacing=0.001, segments=2))
+    metrics = ["throughput", "connections"]
+    full = analyze_capture(path, metrics)
+    sampled = analyze_capture(path, metrics, packet_filter=PacketFilter().sampled(0.3))
+
+    for key, field in (("capture_stats", "packets_analyzed"), ("capture_stats", "bytes_analyzed"),
+                       ("connection_stats", "total_connections"), ("throughput", "avg_kbps")):
+        low, high = sampled[key][f"{field}_ci"]
+        assert low <= full[key][field] <= high, f"{key}.{field}"
+        assert f"{key}.{field}" in sampled["sampling"]["extrapolated"]
+    assert "throughput" in sampled["sampling"]["sample_only"]
+    assert "sampling" not in full
@@ -0,0 +1,91 @@
+"""HTTP/2 request matching on a synthetic h2c connection."""
+import struct
+
+import pytest
+
+from src.capture.analysis import analyze_capture
+from src.capture.sbi import CONNECTION_PREFACE, MAX_HEADER_BLOCK
+
+from .captures import TCP_ACK, TCP_PSH, tcp_frame, write_pcap
+
+AMF, UDM = "10.100.0.2", "10.100.0.3"
+SEGMENT = 60000
+
+
+def frame(frame_type: int, flags: int, stream: int, payload: bytes) -> bytes:
+    return struct.pack(">I", len(payload))[1:] + struct.pack(">BBI", frame_type, flags, stream) + payload
+
+
+def header_block(*headers) -> bytes:
+    """Literal fields without indexing and with literal names."""
+    block = b""
+    for name, value in headers:
+        block += b"\x00" + bytes([len(name)]) + name.encode() + bytes([len(value)]) + value.encode()
+    return block
+
+
+def request(stream: int) -> bytes:
+    return frame(0x1, 0x5, stream, header_block((":method", "GET"), ("user-agent", "AMF"),
+                                                (":path", "/nudm-sdm/v2/imsi-001010000000001/am-data")))
+
+
+def response(stream: int, status: str = "200") -> bytes:
+    return frame(0x1, 0x5, stream, header_block((":status", status)))
+
+
+class Connection:
+    """Both byte streams of one TCP connection, written as segments."""
+
+    def __init__(self):
+        self.packets = []
+        self.seq = {AMF: 1000, UDM: 5000}
+        self.ts = 1.0
+
+    def send(self, sender: str, data: bytes, delay: float = 0.001):
+        receiver = UDM if sender == AMF else AMF
+        ports = (40000, 80) if sender == AMF else (80, 40000)
+        for offset in range(0, len(data), SEGMENT):
+            chunk = data[offset:offset + SEGMENT]
+            self.ts += delay
+            self.packets.append((self.ts, tcp_frame(sender, receiver, *ports, self.seq[sender],
+                                                    self.seq[receiver], TCP_PSH | TCP_ACK, chunk)))
+            self.seq[sender] += len(chunk)
+
+
+def analyze(tmp_path, connection):
+    path = tmp_path / "sbi.pcap"
+    write_pcap(str(path), connection.packets)
+    return analyze_capture(str(path), ["sbi"])["sbi"]
+
+
+def test_requests_are_matched(tmp_path):
+    connection = Connection()
+    connection.send(AMF, CONNECTION_PREFACE + frame(0x4, 0, 0, b"") + request(1))
+    connection.send(UDM, response(1), delay=0.004)
+    connection.send(AMF, request(3))
+    connection.send(UDM, response(3, "404"), delay=0.006)
+    sbi = analyze(tmp_path, connection)
+    cell, = sbi["matrix"]
+    assert (cell["source"], cell["destination"], cell["path"]) == ("AMF", "UDM", "/nudm-sdm/v2/{id}/am-data")
+    assert (cell["requests"], cell["errors"]) == (2, 1)
+    assert cell["latency_ms"]["max"] == pytest.approx(6.0, rel=0.01)
+
+
+@pytest.mark.parametrize("frames", [
+    # One HEADERS frame over the limit
+    [frame(0x1, 0x0, 3, b"\x00" * (MAX_HEADER_BLOCK + 1))],
+    # A header block that only goes over the limit with its CONTINUATION
+    [frame(0x1, 0x0, 3, b"\x00" * (MAX_HEADER_BLOCK // 2 + 1)),
+     frame(0x9, 0x4, 3, b"\x00" * (MAX_HEADER_BLOCK // 2 + 1))]
+])
+def test_oversized_header_block_desynchronizes(tmp_path, frames):
+    connection = Connection()
+    connection.send(AMF, CONNECTION_PREFACE + request(1))
+    connection.send(UDM, response(1))
+    connection.send(AMF, b"".join(frames))
+    # Whatever follows cannot be decoded reliably and is not counted
+    connection.send(AMF, request(5))
+    connection.send(UDM, response(5))
+    sbi = analyze(tmp_path, connection)
+    assert sbi["desynchronized_connections"] == 1
+    assert sbi["requests"] == 1
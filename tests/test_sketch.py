@@ -0,0 +1,126 @@
+"""Accuracy and mergeability of the fixed-size sketches."""
+import numpy as np
+import pytest
+
+from src.capture.sketch import HyperLogLog, QuantileSketch, SpaceSaving, hash_columns
+
+QUANTILES = [0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 0.999]
+
+
+@pytest.fixture(scope="module")
+def latencies():
+    """Heavy-tailed positive values with some zeros, like packet latencies in ms."""
+    rng = np.random.default_rng(7)
+    values = rng.lognormal(mean=1.0, sigma=2.0, size=200_000)
+    values[rng.random(values.size) < 0.01] = 0.0
+    return values
+
+
+def sketch_of(values, **kwargs) -> QuantileSketch:
+    sketch = QuantileSketch(**kwargs)
+    sketch.add(values)
+    return sketch
+
+
+@pytest.mark.parametrize("accuracy", [0.01, 0.05])
+def test_quantiles_within_relative_error(latencies, accuracy):
+    sketch = sketch_of(latencies, relative_accuracy=accuracy)
+    assert (sketch.count, sketch.min, sketch.max) == (latencies.size, latencies.min(), latencies.max())
+    for q in QUANTILES:
+        # The rank may fall between two samples; the estimate is close to one of them
+        low = np.percentile(latencies, q * 100, method="lower")
+        high = np.percentile(latencies, q * 100, method="higher")
+        assert low * (1 - accuracy) <= sketch.quantile(q) <= high * (1 + accuracy), q
+
+
+@pytest.mark.parametrize("max_bins", [2048, 64])
+def test_merge_equals_one_sketch_of_both_streams(latencies, max_bins):
+    first, second = latencies[:70_000], latencies[70_000:] * 1000
+    merged = sketch_of(first, max_bins=max_bins)
+    merged.merge(sketch_of(second, max_bins=max_bins))
+    whole = sketch_of(np.concatenate([first, second]), max_bins=max_bins)
+    assert (merged.offset, merged.counts.tolist(), merged.zeros) == (whole.offset, whole.counts.tolist(), whole.zeros)
+    assert (merged.count, merged.min, merged.max) == (whole.count, whole.min, whole.max)
+    assert merged.total == pytest.approx(whole.total)
+    assert [merged.quantile(q) for q in QUANTILES] == [whole.quantile(q) for q in QUANTILES]
+
+
+def test_round_trip_and_accuracy_mismatch(latencies):
+    sketch = sketch_of(latencies[:1000])
+    restored = QuantileSketch.from_dict(sketch.to_dict())
+    assert [restored.quantile(q) for q in QUANTILES] == [sketch.quantile(q) for q in QUANTILES]
+    with pytest.raises(ValueError):
+        sketch.merge(QuantileSketch(relative_accuracy=0.05))
+
+
+@pytest.fixture(scope="module")
+def skewed():
+    """A Zipf-distributed stream of 3-column keys with byte-like weights."""
+    rng = np.random.default_rng(11)
+    ranks = np.minimum(rng.zipf(1.3, size=100_000), 5000)
+    keys = np.stack([ranks, ranks * 7, np.full_like(ranks, 443)], axis=1).astype(np.uint64)
+    weights = rng.integers(60, 1500, size=ranks.size)
+    return keys, weights
+
+
+def true_weights(keys, weights):
+    unique, inverse = np.unique(keys[:, 0], return_inverse=True)
+    return dict(zip(unique.tolist(), np.bincount(inverse, weights=weights).astype(np.int64).tolist()))
+
+
+def assert_space_saving_bounds(summary, truth, total):
+    assert summary.total == total
+    bound = total // summary.capacity
+    for key, count, error in summary.top(summary.capacity):
+        # Counts never underestimate and overestimate by at most error
+        assert count - error <= truth[key[0]] <= count
+        assert error <= bound
+    monitored = {key[0] for key, _, _ in summary.top(summary.capacity)}
+    assert {key for key, weight in truth.items() if weight > bound} <= monitored
+
+
+def test_space_saving_overestimate_bound(skewed):
+    keys, weights = skewed
+    truth = true_weights(keys, weights)
+    summary = SpaceSaving(3, capacity=64)
+    for start in range(0, len(keys), 4096):
+        summary.add(keys[start:start + 4096], weights[start:start + 4096])
+    assert len(summary.ids) == 64 < len(truth)
+    assert_space_saving_bounds(summary, truth, int(weights.sum()))
+    heaviest = max(truth, key=truth.get)
+    assert summary.top(1)[0][0] == (heaviest, heaviest * 7, 443)
+
+
+def test_merged_space_saving_keeps_the_bound(skewed):
+    keys, weights = skewed
+    parts = []
+    for part in np.array_split(np.arange(len(keys)), 3):
+        summary = SpaceSaving(3, capacity=64)
+        summary.add(keys[part], weights[part])
+        parts.append(summary)
+    merged = parts[0]
+    for summary in parts[1:]:
+        merged.merge(summary)
+    assert_space_saving_bounds(merged, true_weights(keys, weights), int(weights.sum()))
+
+
+@pytest.mark.parametrize("distinct", [50, 3000, 200_000])
+def test_hyperloglog_within_three_standard_errors(distinct):
+    estimator = HyperLogLog()
+    # Every key three times, in batches
+    values = np.tile(np.arange(distinct, dtype=np.uint64) * 9973, 3)
+    for start in range(0, len(values), 50_000):
+        estimator.add(hash_columns([values[start:start + 50_000]]))
+    assert abs(estimator.count() - distinct) <= 3 * estimator.relative_error * distinct
+
+
+def test_hyperloglog_merge_is_a_union():
+    hashes = hash_columns([np.arange(30_000), np.arange(30_000) % 7])
+    first, second, both = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    first.add(hashes[:20_000])
+    second.add(hashes[10_000:])
+    both.add(hashes)
+    first.merge(second)
+    assert first.registers.tolist() == both.registers.tolist()
+    with pytest.raises(ValueError):
+        first.merge(HyperLogLog(precision=10))
@@ -0,0 +1,105 @@
+"""KPI time series and the tools that read them."""
+import pytest
+
+from src.capture.analysis import analyze_capture
+from src.capture.metrics import create_accumulators, kpi_series
+
+METRICS = ["latency", "throughput", "packet_loss", "connections", "rtt"]
+BUCKETED = ["latency", "rtt", "packet_loss", "connections", "capture_stats"]
+
+
+def bucket_options(bucket_size):
+    return {name: {"bucket_size": bucket_size} for name in BUCKETED}
+
+
+@pytest.mark.parametrize("bucket_size", [0.25, 1.0])
+def test_series_add_up_to_the_totals(lossy_capture, bucket_size):
+    results = analyze_capture(lossy_capture, METRICS, bucket_options(bucket_size))
+    series = results["timeseries"]
+    assert series["bucket_s"] == bucket_size
+    assert series["start"] == int(1.0 / bucket_size) * bucket_size
+    for name in ("packets", "throughput_kbps", "latency_avg_ms", "rtt_avg_ms", "retransmits",
+                 "loss_percentage", "new_connections"):
+        assert len(series[name]) == series["buckets"], name
+
+    assert sum(series["packets"]) == results["capture_stats"]["packets_analyzed"]
+    # The series counts handshakes exactly; the total is a distinct-count estimate
+    assert sum(series["new_connections"]) == 60
+    assert results["connection_stats"]["total_connections"] == pytest.approx(60, rel=0.05)
+    assert sum(series["retransmits"]) == results["packet_loss"]["retransmits"]
+    total_kbits = sum(series["throughput_kbps"]) * bucket_size
+    assert total_kbits == pytest.approx(results["capture_stats"]["bytes_analyzed"] * 8 / 1000, rel=1e-3)
+    # Buckets without handshakes have no latency average
+    latency = [value for value in series["latency_avg_ms"] if value is not None]
+    assert latency and all(value == pytest.approx(20, abs=0.1) for value in latency)
+
+
+def test_only_present_series_are_included(clean_capture):
+    series = analyze_capture(clean_capture, ["throughput"])["timeseries"]
+    assert set(series) == {"bucket_s", "start", "buckets", "packets", "throughput_kbps"}
+
+
+def test_mismatched_bucket_widths_are_rejected():
+    options = bucket_options(1.0)
+    options["rtt"] = {"bucket_size": 0.5}
+    with pytest.raises(ValueError, match="bucket width"):
+        create_accumulators(METRICS, options)
+
+    accumulators = create_accumulators(METRICS, bucket_options(1.0))
+    accumulators.update(create_accumulators(["rtt"], {"rtt": {"bucket_size": 0.5},
+                                                      "capture_stats": {"bucket_size": 0.5}}))
+    with pytest.raises(ValueError, match="bucket width"):
+        kpi_series(accumulators)
+
+
+def series_with(values):
+    """A KPI series section with one-second buckets starting 2024-06-12 14:12:00 UTC."""
+    return {"bucket_s": 1.0, "start": 1718201520.0, "buckets": len(next(iter(values.values()))), **values}
+
+
+@pytest.fixture
+def tools():
+    pytest.importorskip("crewai")
+    from src.tools.anomaly_detector import AnomalyDetectorTool
+    from src.tools.metrics_extractor import MetricsExtractorTool
+    return MetricsExtractorTool(), AnomalyDetectorTool()
+
+
+def stalled():
+    """Steady throughput with a three-second stall, and a loss burst during it."""
+    throughput = [5000.0 + 10 * (i % 3) for i in range(30)]
+    throughput[12:15] = [200.0, 150.0, 300.0]
+    loss = [0.1] * 30
+    loss[13] = 8.0
+    return series_with({"throughput_kbps": throughput, "loss_percentage": loss,
+                        "rtt_avg_ms": [20.0] * 10 + [None] * 5 + [21.0] * 15})
+
+
+def test_timeseries_summary(tools):
+    extractor, _ = tools
+    summary = extractor._analyze_timeseries({"timeseries": stalled()})
+    throughput = summary["throughput_kbps"]
+    assert throughput["min"] == 150.0 and throughput["max"] == 5020.0
+    assert [worst["time"] for worst in throughput["worst"]] == ["2024-06-12 14:12:13", "2024-06-12 14:12:12",
+                                                               "2024-06-12 14:12:14"]
+    assert summary["loss_percentage"]["worst"][0] == {"time": "2024-06-12 14:12:13", "value": 8.0}
+    assert summary["rtt_avg_ms"]["mean"] == pytest.approx(20.6, abs=0.01)
+    assert summary["analysis"]["quality"] == "poor"
+    assert len(summary["analysis"]["issues"]) == 2
+
+    assert extractor._analyze_timeseries({})["analysis"]["issues"] == ["No time series data available"]
+
+
+def test_timeseries_anomalies(tools):
+    _, detector = tools
+    anomalies = detector._detect_timeseries_anomalies({"timeseries": stalled()}, 2.5)
+    assert [(anomaly["type"], anomaly["start"], anomaly["duration_s"]) for anomaly in anomalies] == [
+        ("Throughput Drop", "2024-06-12 14:12:12", 3.0),
+        ("Packet Loss Burst", "2024-06-12 14:12:13", 1.0),
+    ]
+    assert anomalies[0]["value"] == 150.0 and anomalies[0]["severity"] == "high"
+
+    # The partly covered first and last buckets of totals are not scored
+    edges = [100.0] + [5000.0] * 28 + [100.0]
+    assert detector._detect_timeseries_anomalies(series_with({"throughput_kbps": edges}), 2.5) == []
+    assert detector._detect_timeseries_anomalies({}, 2.5) == []